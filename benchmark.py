@@ -0,0 +1,1316 @@
+"""
+Benchmarks for the library management system.
+
+Usage:
+    python benchmark.py memory [--rows N]
+    python benchmark.py scale [--sizes 10000,100000,1000000] [--samples N] [--output FILE]
+    python benchmark.py stress [--threads N] [--rounds N] [--rows N]
+    python benchmark.py shards [--sizes 100000] [--shards 1,2,4] [--samples N] [--threads N]
+    python benchmark.py catalogue [--sizes 1000000] [--samples N]
+    python benchmark.py durability [--sizes 10000] [--samples N]
+    python benchmark.py holds [--sizes 10000,1000000] [--samples N]
+    python benchmark.py metrics [--sizes 100000] [--samples N]
+    python benchmark.py inventory [--sizes 100000] [--samples N]
+    python benchmark.py import [--sizes 1000000] [--workers 1,2,4]
+    python benchmark.py fuzzy [--sizes 100000,1000000] [--samples N]
+    python benchmark.py autocomplete [--sizes 100000,1000000] [--samples N]
+    python benchmark.py search_cache [--sizes 100000] [--samples N]
+    python benchmark.py listing [--sizes 1000000] [--samples N]
+    python benchmark.py fines [--sizes 1000000] [--samples N]
+
+Results are printed (or written to --output) as JSON so runs can be
+compared between commits.
+"""
+import argparse
+import contextlib
+import csv
+import gc
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import bulk_import
+import catalogue
+import fines
+import library
+import new
+import search_cache
+import search_index
+import shards
+from journal import read_rows
+from metrics import Metrics
+from write_behind import DURABILITY_MODES, INTERVAL, ON_EXIT
+
+WORDS = ['harry', 'potter', 'lord', 'rings', 'python', 'data', 'history', 'war', 'peace', 'stone',
+         'secret', 'garden', 'ocean', 'night', 'river', 'king', 'queen', 'shadow', 'light', 'winter']
+AUTHORS = ['Rowling', 'Tolkien', 'Tolstoy', 'Austen', 'Orwell', 'Dickens', 'Woolf', 'Achebe', 'Morrison', 'Eco']
+# The parts of the made-up syllables of the fuzzy benchmark, which needs a
+# vocabulary nearer the size and spelling of a real catalogue's than WORDS.
+ONSETS = ['', 'b', 'c', 'd', 'f', 'g', 'h', 'j', 'k', 'l', 'm', 'n', 'p', 'r', 's', 't', 'v', 'w',
+          'br', 'ch', 'cl', 'dr', 'gr', 'pl', 'sh', 'st', 'th', 'tr']
+VOWELS = ['a', 'e', 'i', 'o', 'u', 'ai', 'ea', 'ou', 'y']
+CODAS = ['', '', 'n', 'r', 's', 't', 'l', 'm', 'nd', 'st', 'ck']
+
+def plain_class(cls):
+    """
+    Creates a dict-backed copy of a record class, i.e. the class as it was
+    before it was given __slots__.
+
+    Parameters:
+    - cls (type): The record class.
+
+    Returns:
+    - type: A class with the same __init__ but no __slots__.
+    """
+    return type('Plain' + cls.__name__, (), {'__init__': cls.__init__})
+
+def measure(factory, rows):
+    """
+    Measures the memory used by a list of records.
+
+    Parameters:
+    - factory (callable): Creates the record for a row number.
+    - rows (int): The number of records to create.
+
+    Returns:
+    - float: The bytes allocated per record, including its field values.
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = [factory(i) for i in range(rows)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return (after - before) / rows
+
+def bench_memory(rows):
+    """
+    Compares the memory per record of the dict-backed and __slots__ record classes.
+
+    Parameters:
+    - rows (int): The number of records to create for each class.
+
+    Returns:
+    - List[dict]: One result per class.
+    """
+    cases = [
+        ('library.Book', library.Book, lambda cls, i: cls(f'Title {i}', f'Author {i % 5000}', f'978{i:010d}')),
+        ('library.Member', library.Member, lambda cls, i: cls(f'Member {i}', i)),
+        ('new.Book', new.Book, lambda cls, i: cls(f'978{i:010d}', f'Title {i}', f'Author {i % 5000}', True, False, '')),
+        ('new.User', new.User, lambda cls, i: cls(f'user{i}', 'user', f'0{i:010d}', f'user{i}@example.com', f'pw{i}')),
+    ]
+    results = []
+    for name, cls, make in cases:
+        plain = plain_class(cls)
+        before = measure(lambda i: make(plain, i), rows)
+        after = measure(lambda i: make(cls, i), rows)
+        results.append({
+            'benchmark': 'memory',
+            'class': name,
+            'rows': rows,
+            'bytes_per_record_dict': round(before, 1),
+            'bytes_per_record_slots': round(after, 1),
+            'saving_percent': round(100 * (before - after) / before, 1),
+        })
+    return results
+
+def isbn(i):
+    """
+    Gets the synthetic ISBN of a row number.
+
+    Parameters:
+    - i (int): The row number.
+
+    Returns:
+    - str: The ISBN.
+    """
+    return f'978{i:010d}'
+
+def generate_data(directory, rows, seed=42):
+    """
+    Writes a synthetic catalogue and user base in the layouts used by
+    library.Library and new.Library.
+
+    Parameters:
+    - directory (str): The directory to write to.
+    - rows (int): The number of books, and of members/users.
+    - seed (int): The random seed.
+
+    Returns:
+    - dict: The paths of the 'library_books', 'library_members', 'new_books' and 'new_users' files.
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = {name: os.path.join(directory, f'{name}_{rows}.csv')
+             for name in ('library_books', 'library_members', 'new_books', 'new_users')}
+    with open(paths['library_books'], 'w', newline='') as lib_file, open(paths['new_books'], 'w', newline='') as new_file:
+        lib_writer = csv.writer(lib_file)
+        new_writer = csv.writer(new_file)
+        lib_writer.writerow(['Title', 'Author', 'ISBN'])
+        new_writer.writerow(new.BOOK_FIELDS)
+        for i in range(rows):
+            title = ' '.join(rng.choice(WORDS) for _ in range(3)).title() + f' {i}'
+            author = rng.choice(AUTHORS)
+            lib_writer.writerow([title, author, isbn(i)])
+            on_loan = rng.random() < 0.1
+            due = f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}' if on_loan else ''
+            new_writer.writerow([isbn(i), title, author, not on_loan, False, due])
+    with open(paths['library_members'], 'w', newline='') as lib_file, open(paths['new_users'], 'w', newline='') as new_file:
+        lib_writer = csv.writer(lib_file)
+        new_writer = csv.writer(new_file)
+        lib_writer.writerow(['Name', 'MemberID'])
+        new_writer.writerow(new.USER_FIELDS)
+        for i in range(rows):
+            lib_writer.writerow([f'Member {i}', i])
+            new_writer.writerow([f'user{i}', 'admin' if i % 100 == 0 else 'user', f'0{i:010d}', f'user{i}@example.com', f'pw{i}'])
+    return paths
+
+def peak_rss_kb():
+    """
+    Gets the peak resident set size of this process so far.
+
+    Returns:
+    - int or None: The peak RSS in KiB, or None where it is not available.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def percentile(ordered, fraction):
+    """
+    Gets a percentile of sorted values by the nearest-rank method.
+
+    Parameters:
+    - ordered (List[float]): The sorted values.
+    - fraction (float): The percentile, between 0 and 1.
+
+    Returns:
+    - float: The value at that percentile.
+    """
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def summarize(implementation, operation, rows, latencies, items=1):
+    """
+    Summarizes the latencies of an operation.
+
+    Parameters:
+    - implementation (str): 'library' or 'new'.
+    - operation (str): The operation name.
+    - rows (int): The catalogue size.
+    - latencies (List[float]): The latency of each call, in seconds.
+    - items (int): The number of records each call processes, for throughput.
+
+    Returns:
+    - dict: The result.
+    """
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    return {
+        'benchmark': 'scale',
+        'implementation': implementation,
+        'operation': operation,
+        'rows': rows,
+        'calls': len(ordered),
+        'throughput_per_sec': round(len(ordered) * items / total, 1) if total else None,
+        'latency_ms': {
+            'mean': round(1000 * total / len(ordered), 4),
+            'p50': round(1000 * percentile(ordered, 0.50), 4),
+            'p95': round(1000 * percentile(ordered, 0.95), 4),
+            'p99': round(1000 * percentile(ordered, 0.99), 4),
+            'max': round(1000 * ordered[-1], 4),
+        },
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+def timed(function, arguments):
+    """
+    Times a function once per argument tuple, with its printed output discarded.
+
+    Parameters:
+    - function (callable): The function to time.
+    - arguments (Iterable[tuple]): The arguments for each call.
+
+    Returns:
+    - List[float]: The latency of each call, in seconds.
+    """
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for args in arguments:
+            start = time.perf_counter()
+            function(*args)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+def timed_threads(function, arguments, threads):
+    """
+    Times a function once per argument tuple, with the calls shared out
+    between several threads running at once.
+
+    Parameters:
+    - function (callable): The function to time.
+    - arguments (List[tuple]): The arguments for each call.
+    - threads (int): The number of threads.
+
+    Returns:
+    - Tuple[List[float], float]: The latency of each call, and the time
+      until the last call finished, in seconds.
+    """
+    shares = [[] for _ in range(threads)]
+
+    def worker(number):
+        for args in arguments[number::threads]:
+            start = time.perf_counter()
+            function(*args)
+            shares[number].append(time.perf_counter() - start)
+
+    # Redirected once for all the threads, as redirect_stdout swaps
+    # sys.stdout for the whole process.
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        run_threads(threads, worker)
+        elapsed = time.perf_counter() - start
+    return [latency for share in shares for latency in share], elapsed
+
+def bench_scale(rows, directory, samples):
+    """
+    Times the hot operations of library.Library and new.Library on a synthetic catalogue.
+
+    Parameters:
+    - rows (int): The number of books and of members/users.
+    - directory (str): The directory for the generated files.
+    - samples (int): The number of calls for per-item operations.
+
+    Returns:
+    - List[dict]: One result per operation.
+    """
+    rng = random.Random(rows)
+    paths = generate_data(directory, rows)
+    results = []
+    ids = [isbn(rng.randrange(rows)) for _ in range(samples)]
+    queries = [rng.choice(WORDS) + ' ' + rng.choice(WORDS) if i % 2 else rng.choice(WORDS)[1:5] for i in range(samples)]
+
+    lib = library.Library('Benchmark', paths['library_books'], paths['library_members'])
+    results.append(summarize('library', 'load_books', rows, timed(lib.load_books, [()]), rows))
+    results.append(summarize('library', 'load_members', rows, timed(lib.load_members, [()]), rows))
+    pairs = [(rng.randrange(rows), book_id) for book_id in ids]
+    results.append(summarize('library', 'check_out_book', rows, timed(lib.check_out_book, pairs)))
+    results.append(summarize('library', 'return_book', rows, timed(lib.return_book, pairs)))
+    results.append(summarize('library', 'check_out_books', rows, timed(lib.check_out_books, [(pairs,)]), len(pairs)))
+    results.append(summarize('library', 'return_books', rows, timed(lib.return_books, [(pairs,)]), len(pairs)))
+    results.append(summarize('library', 'save_books', rows, timed(lib.save_books, [()]), rows))
+    del lib
+    gc.collect()
+
+    lib = new.Library('Benchmark', paths['new_books'], paths['new_users'])
+    results.append(summarize('new', 'load_books', rows, timed(lib.load_books, [()]), rows))
+    results.append(summarize('new', 'load_users', rows, timed(lib.load_users, [()]), rows))
+    results.append(summarize('new', 'search_books', rows, timed(lib.search_books, [(query,) for query in queries])))
+    results.append(summarize('new', 'find_book_by_id', rows, timed(lib.find_book_by_id, [(book_id,) for book_id in ids])))
+    results.append(summarize('new', 'save_books', rows, timed(lib.save_books, [()]), rows))
+    del lib
+    gc.collect()
+
+    for path in paths.values():
+        os.remove(path)
+    return results
+
+def run_threads(threads, target):
+    """
+    Runs a function on several threads at once and waits for them all.
+
+    Parameters:
+    - threads (int): The number of threads.
+    - target (callable): The function, called with the thread number.
+    """
+    barrier = threading.Barrier(threads)
+
+    def run(number):
+        barrier.wait()
+        target(number)
+
+    workers = [threading.Thread(target=run, args=(number,)) for number in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+class Holders:
+    """
+    Tracks who holds each book during a stress run and counts the times a
+    book was handed to a second thread before the first one let it go.
+
+    Attributes:
+    - granted (int): The number of times a book was handed out.
+    - double_issues (int): The number of times it was already held.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new Holders object.
+        """
+        self.lock = threading.Lock()
+        self.held = set()
+        self.granted = 0
+        self.double_issues = 0
+
+    def take(self, book, still_held=True):
+        """
+        Records that a thread was given a book.
+
+        Parameters:
+        - book (object): The book.
+        - still_held (bool): False if the thread already finds the book
+          recorded against someone else.
+        """
+        with self.lock:
+            self.granted += 1
+            if id(book) in self.held or not still_held:
+                self.double_issues += 1
+            self.held.add(id(book))
+
+    def give_back(self, book):
+        """
+        Records that a thread is letting a book go.
+
+        Parameters:
+        - book (object): The book.
+        """
+        with self.lock:
+            self.held.discard(id(book))
+
+def stress_library(thread_safe, threads, rounds, rows, directory):
+    """
+    Has many threads check out and return the same few books of a
+    library.Library at once, counting copies issued to two members at a time.
+
+    Parameters:
+    - thread_safe (bool): Whether the library is created thread-safe.
+    - threads (int): The number of threads.
+    - rounds (int): The number of checkouts and returns per thread and book.
+    - rows (int): The number of books and members.
+    - directory (str): The directory for the generated files.
+
+    Returns:
+    - dict: The result.
+    """
+    paths = generate_data(directory, rows)
+    lib = library.Library('Stress', paths['library_books'], paths['library_members'], thread_safe=thread_safe,
+                          durability=ON_EXIT)
+    # A few ISBNs with several copies each, fewer copies than threads.
+    wanted = [isbn(i) for i in range(8)]
+    for ISBN in wanted:
+        for copy in range(3):
+            lib.add_book(library.Book(f'Copy {copy}', 'Stress', ISBN))
+    holders = Holders()
+
+    def worker(number):
+        member_id = number % rows
+        for _ in range(rounds):
+            for result in lib.check_out_books([(member_id, ISBN) for ISBN in wanted]):
+                if result['status'] == library.OK:
+                    holders.take(result['book'], result['book'].checked_out_by is result['member'])
+            returned = [book for book in lib.find_member(member_id).checked_out_books]
+            for book in returned:
+                holders.give_back(book)
+            lib.return_books([(member_id, book.ISBN) for book in returned])
+
+    start = time.perf_counter()
+    run_threads(threads, worker)
+    elapsed = time.perf_counter() - start
+    lib.close()
+    for path in paths.values():
+        os.remove(path)
+    return {
+        'benchmark': 'stress',
+        'implementation': 'library',
+        'thread_safe': thread_safe,
+        'threads': threads,
+        'rounds': rounds,
+        'issued': holders.granted,
+        'double_issues': holders.double_issues,
+        'seconds': round(elapsed, 3),
+    }
+
+def stress_new(thread_safe, threads, rounds, rows, directory):
+    """
+    Has many threads reserve and release the same few books of a new.Library
+    at once, counting books reserved by two threads at a time.
+
+    Parameters:
+    - thread_safe (bool): Whether the library is created thread-safe.
+    - threads (int): The number of threads.
+    - rounds (int): The number of reservations per thread and book.
+    - rows (int): The number of books and users.
+    - directory (str): The directory for the generated files.
+
+    Returns:
+    - dict: The result.
+    """
+    paths = generate_data(directory, rows)
+    lib = new.Library('Stress', paths['new_books'], paths['new_users'], thread_safe=thread_safe, durability=ON_EXIT)
+    wanted = [book.book_id for book in lib.books if book.availability and not book.reserved][:16]
+    holders = Holders()
+
+    def worker(number):
+        for _ in range(rounds):
+            for book_id in wanted:
+                status, book = lib.reserve_book(book_id)
+                if status == new.OK:
+                    holders.take(book)
+                    time.sleep(0)
+                    holders.give_back(book)
+                    with lib.book_locks.hold(book_id):
+                        book.reserved = False
+
+    start = time.perf_counter()
+    run_threads(threads, worker)
+    elapsed = time.perf_counter() - start
+    lib.close()
+    for path in paths.values():
+        os.remove(path)
+    return {
+        'benchmark': 'stress',
+        'implementation': 'new',
+        'thread_safe': thread_safe,
+        'threads': threads,
+        'rounds': rounds,
+        'reserved': holders.granted,
+        'double_issues': holders.double_issues,
+        'seconds': round(elapsed, 3),
+    }
+
+def stress_new_deletes(thread_safe, threads, rounds, rows, directory):
+    """
+    Has many threads check out and return the last few books of a
+    new.Library while another thread deletes the books before them,
+    counting lookups that missed a book that was never deleted.
+
+    Parameters:
+    - thread_safe (bool): Whether the library is created thread-safe.
+    - threads (int): The number of threads checking books out.
+    - rounds (int): The number of checkouts per thread and book.
+    - rows (int): The number of books and users.
+    - directory (str): The directory for the generated files.
+
+    Returns:
+    - dict: The result.
+    """
+    paths = generate_data(directory, rows)
+    lib = new.Library('Stress', paths['new_books'], paths['new_users'], thread_safe=thread_safe, durability=ON_EXIT)
+    wanted = [book.book_id for book in lib.books if book.availability and not book.reserved][-16:]
+    doomed = [book.book_id for book in lib.books[:rows // 2] if book.book_id not in wanted]
+    lock = threading.Lock()
+    counts = {'issued': 0, 'missed': 0, 'deleted': 0}
+
+    def worker(number):
+        if number == threads:
+            deleted = sum(1 for book_id in doomed if lib.delete_book(book_id))
+            with lock:
+                counts['deleted'] += deleted
+            return
+        for _ in range(rounds):
+            for book_id in wanted:
+                status, book = lib.check_out_book(book_id, f'user{number}')
+                with lock:
+                    counts['issued'] += status == new.OK
+                    counts['missed'] += status == new.NOT_FOUND
+                if status == new.OK:
+                    lib.return_book(book_id)
+
+    start = time.perf_counter()
+    run_threads(threads + 1, worker)
+    elapsed = time.perf_counter() - start
+    lib.close()
+    for path in paths.values():
+        os.remove(path)
+    return {
+        'benchmark': 'stress',
+        'implementation': 'new',
+        'case': 'delete_during_checkout',
+        'thread_safe': thread_safe,
+        'threads': threads,
+        'rounds': rounds,
+        'issued': counts['issued'],
+        'deleted': counts['deleted'],
+        'missed_lookups': counts['missed'],
+        'seconds': round(elapsed, 3),
+    }
+
+def bench_stress(threads, rounds, rows, directory):
+    """
+    Runs the stress checks with and without thread_safe. Thread switches are
+    forced as often as possible so that races show up in a short run.
+
+    Parameters:
+    - threads (int): The number of threads.
+    - rounds (int): The number of operations per thread and book.
+    - rows (int): The catalogue size.
+    - directory (str): The directory for the generated files.
+
+    Returns:
+    - List[dict]: One result per implementation and mode.
+    """
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        return [check(thread_safe, threads, rounds, rows, directory)
+                for check in (stress_library, stress_new, stress_new_deletes) for thread_safe in (False, True)]
+    finally:
+        sys.setswitchinterval(interval)
+
+def bench_shards(rows, shard_counts, directory, samples, threads):
+    """
+    Compares search and reservation throughput of new.Library with
+    shards.ShardedLibrary at several shard counts, with the calls made
+    from several threads at once, as the network service makes them.
+
+    Parameters:
+    - rows (int): The number of books and users.
+    - shard_counts (List[int]): The shard counts to try.
+    - directory (str): The directory for the generated files.
+    - samples (int): The number of calls per operation.
+    - threads (int): The number of threads making the calls.
+
+    Returns:
+    - List[dict]: One result per operation and shard count.
+    """
+    rng = random.Random(rows)
+    paths = generate_data(directory, rows)
+    ids = [isbn(rng.randrange(rows)) for _ in range(samples)]
+    queries = [rng.choice(WORDS) + ' ' + rng.choice(WORDS) if i % 2 else rng.choice(WORDS)[1:5] for i in range(samples)]
+    results = []
+    for count in [0] + shard_counts:
+        if count:
+            lib = shards.ShardedLibrary('Benchmark', paths['new_books'], paths['new_users'], shards=count,
+                                        durability=INTERVAL)
+        else:
+            lib = new.Library('Benchmark', paths['new_books'], paths['new_users'], thread_safe=True,
+                              durability=INTERVAL)
+        for operation, function, arguments in (('search_books', lib.search_books, [(query,) for query in queries]),
+                                               ('reserve_book', lib.reserve_book, [(book_id,) for book_id in ids])):
+            latencies, elapsed = timed_threads(function, arguments, threads)
+            result = summarize('new' if not count else 'sharded', operation, rows, latencies)
+            result['throughput_per_sec'] = round(len(latencies) / elapsed, 1)
+            result['shards'] = count
+            result['threads'] = threads
+            results.append(result)
+        lib.close()
+        if count:
+            shards.remove_shard_files(paths['new_books'], count)
+        del lib
+        gc.collect()
+    for path in paths.values():
+        os.remove(path)
+    return results
+
+def bench_durability(rows, directory, samples):
+    """
+    Times reservations of new.Library under each durability setting,
+    including the final flush.
+
+    Parameters:
+    - rows (int): The number of books and users.
+    - directory (str): The directory for the generated files.
+    - samples (int): The number of reservations.
+
+    Returns:
+    - List[dict]: One result per durability setting.
+    """
+    rng = random.Random(rows)
+    paths = generate_data(directory, rows)
+    results = []
+    for durability in DURABILITY_MODES:
+        lib = new.Library('Benchmark', paths['new_books'], paths['new_users'], durability=durability, flush_interval=0.05)
+        ids = [book.book_id for book in rng.sample(lib.books, samples)]
+        latencies = timed(lib.reserve_book, [(book_id,) for book_id in ids])
+        start = time.perf_counter()
+        lib.close()
+        close = time.perf_counter() - start
+        result = summarize('new', 'reserve_book', rows, latencies)
+        result.update({'benchmark': 'durability', 'durability': durability, 'group_writes': lib.write_behind.groups,
+                       'close_ms': round(1000 * close, 3),
+                       'total_seconds': round(sum(latencies) + close, 3)})
+        results.append(result)
+    for path in paths.values():
+        os.remove(path)
+    return results
+
+def bench_holds(patrons, samples):
+    """
+    Times the hold queue of one much-wanted book held in memory by
+    new.Library: joining it, looking up positions, cancelling from the
+    middle, and passing the book on at each return. With O(1) queue
+    operations the latencies should not grow with the queue.
+
+    Parameters:
+    - patrons (int): The number of patrons waiting.
+    - samples (int): The number of calls per operation.
+
+    Returns:
+    - List[dict]: One result per operation.
+    """
+    rng = random.Random(patrons)
+    lib = new.Library('Benchmark', None, None, durability=ON_EXIT)
+    lib.add_book(new.Book(isbn(0), 'Wanted', 'Author', True, False, None))
+    lib.check_out_book(isbn(0), 'first reader')
+    names = [f'patron{i}' for i in range(patrons)]
+    results = [summarize('new', 'reserve_book', patrons, timed(lib.reserve_book, [(isbn(0), name) for name in names]))]
+    results.append(summarize('new', 'hold_position', patrons,
+                             timed(lib.hold_position, [(isbn(0), name) for name in rng.sample(names, samples)])))
+    results.append(summarize('new', 'cancel_reservation', patrons,
+                             timed(lib.cancel_reservation, [(isbn(0), name) for name in rng.sample(names, samples)])))
+
+    def pass_on():
+        lib.return_book(isbn(0))
+        lib.check_out_book(isbn(0), lib.ready_holds[isbn(0)][0])
+    results.append(summarize('new', 'return_and_collect', patrons, timed(pass_on, [()] * samples)))
+    for result in results:
+        result['benchmark'] = 'holds'
+    lib.close()
+    return results
+
+def bench_metrics(rows, directory, samples):
+    """
+    Times the same lookups, searches and reservations of new.Library with
+    and without a Metrics object, to show what instrumentation costs.
+
+    Parameters:
+    - rows (int): The number of books and users.
+    - directory (str): The directory for the generated files.
+    - samples (int): The number of calls per operation.
+
+    Returns:
+    - List[dict]: One result per operation and setting.
+    """
+    rng = random.Random(rows)
+    paths = generate_data(directory, rows)
+    ids = [isbn(rng.randrange(rows)) for _ in range(samples)]
+    queries = [rng.choice(WORDS) for _ in range(samples)]
+    results = []
+    for metrics in (None, Metrics()):
+        lib = new.Library('Benchmark', paths['new_books'], paths['new_users'], durability=ON_EXIT, metrics=metrics)
+        for operation, function, arguments in (('find_book_by_id', lib.find_book_by_id, [(book_id,) for book_id in ids]),
+                                               ('search_books', lib.search_books, [(query,) for query in queries]),
+                                               ('reserve_book', lib.reserve_book, [(book_id,) for book_id in ids])):
+            result = summarize('new', operation, rows, timed(function, arguments))
+            result.update({'benchmark': 'metrics', 'metrics': metrics is not None})
+            results.append(result)
+        lib.close()
+    for path in paths.values():
+        os.remove(path)
+    return results
+
+def count_available(books):
+    """
+    Counts the available books the way callers had to before inventory
+    counters: by asking every book.
+
+    Parameters:
+    - books (Iterable[new.Book]): The books.
+
+    Returns:
+    - int: The number of available books.
+    """
+    return sum(1 for book in books if book.availability_status() == "Available")
+
+def bench_inventory(rows, directory, samples):
+    """
+    Compares counting available books by scanning the catalogue with
+    reading new.Library's inventory counters, and checks the counters
+    against a full recount after a run of reservations and loans.
+
+    Parameters:
+    - rows (int): The number of books.
+    - directory (str): The directory for the generated files.
+    - samples (int): The number of reads, reservations and loans.
+
+    Returns:
+    - List[dict]: One result per operation.
+    """
+    rng = random.Random(rows)
+    paths = generate_data(directory, rows)
+    lib = new.Library('Benchmark', paths['new_books'], paths['new_users'], durability=ON_EXIT)
+    ids = [isbn(rng.randrange(rows)) for _ in range(samples)]
+    results = [summarize('new', 'scan_availability_status', rows, timed(count_available, [(lib.books,)] * min(samples, 20))),
+               summarize('new', 'inventory_counts', rows, timed(lib.inventory_counts, [()] * samples))]
+    results.append(summarize('new', 'reserve_book', rows, timed(lib.reserve_book, [(book_id, 'reader') for book_id in ids])))
+    results.append(summarize('new', 'check_out_book', rows, timed(lib.check_out_book, [(book_id, 'reader') for book_id in ids])))
+    results.append(summarize('new', 'inventory_by_author', rows, timed(lib.inventory_by_author, [()] * samples)))
+    problems = lib.check_inventory()
+    for result in results:
+        result.update({'benchmark': 'inventory', 'consistent': not problems})
+    lib.close()
+    for path in paths.values():
+        os.remove(path)
+    return results
+
+def valid_isbn(i):
+    """
+    Gets a synthetic ISBN-13 with a correct check digit, for import data.
+
+    Parameters:
+    - i (int): The row number.
+
+    Returns:
+    - str: The ISBN.
+    """
+    digits = f'979{i:09d}'
+    return digits + str(-sum((3 if position % 2 else 1) * int(d) for position, d in enumerate(digits)) % 10)
+
+def write_import_file(path, rows, rng):
+    """
+    Writes a CSV export to import, with a few records of each kind an
+    import must reject: invalid ISBNs, missing titles and repeated ISBNs.
+    Some ISBNs are hyphenated.
+
+    Parameters:
+    - path (str): The file to write.
+    - rows (int): The number of records.
+    - rng (random.Random): The random source.
+    """
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['ISBN', 'Title', 'Author'])
+        for i in range(rows):
+            chance = rng.random()
+            book_isbn = valid_isbn(i)
+            if chance < 0.01:
+                book_isbn = book_isbn[:-1] + str((int(book_isbn[-1]) + 1) % 10)
+            elif chance < 0.02:
+                book_isbn = valid_isbn(rng.randrange(i + 1))
+            elif chance < 0.2:
+                book_isbn = f'{book_isbn[:3]}-{book_isbn[3:5]}-{book_isbn[5:12]}-{book_isbn[12]}'
+            title = '' if 0.02 <= chance < 0.025 else ' '.join(rng.choice(WORDS) for _ in range(3)).title() + f' {i}'
+            writer.writerow([book_isbn, title, rng.choice(AUTHORS)])
+
+def bench_import(rows, directory, worker_counts):
+    """
+    Times bulk imports of a CSV export into new.Library with different
+    numbers of worker processes. Each import starts from the same
+    catalogue, so every run imports the same books.
+
+    Parameters:
+    - rows (int): The number of records in the export, and of books in the catalogue.
+    - directory (str): The directory for the generated files.
+    - worker_counts (List[int]): The numbers of worker processes to try.
+
+    Returns:
+    - List[dict]: One result per worker count.
+    """
+    paths = generate_data(directory, rows)
+    source = os.path.join(directory, f'import_{rows}.csv')
+    write_import_file(source, rows, random.Random(rows))
+    target = os.path.join(directory, f'import_target_{rows}.csv')
+    results = []
+    for workers in worker_counts:
+        shutil.copyfile(paths['new_books'], target)
+        lib = new.Library('Benchmark', target, None)
+        report = bulk_import.import_books(lib, source, 'csv', workers, chunk_bytes=max(1 << 16, os.path.getsize(source) // (4 * workers)))
+        lib.close()
+        reasons = {}
+        for line, reason, record in report.rejected:
+            reasons[reason] = reasons.get(reason, 0) + 1
+        results.append({'benchmark': 'import', 'rows': rows, 'workers': workers, 'seconds': round(report.seconds, 3),
+                        'rows_per_sec': round(report.rows_per_second), 'imported': report.imported,
+                        'rejected': reasons, 'peak_rss_kb': peak_rss_kb()})
+    for path in list(paths.values()) + [source, target]:
+        os.remove(path)
+    return results
+
+def bench_catalogue(rows, directory, samples):
+    """
+    Compares reading a book CSV file with opening, streaming and searching
+    the same books as a binary catalogue.
+
+    Parameters:
+    - rows (int): The number of books.
+    - directory (str): The directory for the generated files.
+    - samples (int): The number of lookups.
+
+    Returns:
+    - List[dict]: One result per operation.
+    """
+    rng = random.Random(rows)
+    paths = generate_data(directory, rows)
+    path = os.path.join(directory, f'new_books_{rows}{catalogue.SUFFIX}')
+    ids = [isbn(rng.randrange(rows)) for _ in range(samples)]
+    results = [
+        summarize('csv', 'read_rows', rows, timed(lambda: count_rows(read_rows(paths['new_books'])), [()]), rows),
+        summarize('catalogue', 'csv_to_catalogue', rows, timed(catalogue.csv_to_catalogue, [(paths['new_books'], path)]), rows),
+    ]
+    opened = []
+    results.append(summarize('catalogue', 'open', rows, timed(lambda: opened.append(catalogue.BinaryCatalogue(path)), [()])))
+    binary = opened[0]
+    results.append(summarize('catalogue', 'iter_rows', rows, timed(lambda: count_rows(binary.iter_rows()), [()]), rows))
+    results.append(summarize('catalogue', 'find', rows, timed(binary.find, [(book_id,) for book_id in ids])))
+    binary.close()
+    for result in results:
+        result['benchmark'] = 'catalogue'
+    os.remove(path)
+    for path in paths.values():
+        os.remove(path)
+    return results
+
+def count_rows(rows):
+    """
+    Counts rows without keeping them.
+
+    Parameters:
+    - rows (Iterable[dict]): The rows.
+
+    Returns:
+    - int: The number of rows.
+    """
+    return sum(1 for _ in rows)
+
+def metadata():
+    """
+    Describes the environment of a benchmark run.
+
+    Returns:
+    - dict: The git commit, Python version, platform and start time.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'started': datetime.now().isoformat(timespec='seconds'),
+    }
+
+def brute_force_completions(lib, prefix, limit):
+    """
+    Finds the most borrowed books whose title or author starts with a
+    prefix by scanning the whole catalogue, to check autocomplete() against.
+
+    Parameters:
+    - lib (new.Library): The library.
+    - prefix (str): The prefix, already normalized.
+    - limit (int): The largest number of books.
+
+    Returns:
+    - List[Tuple[int, str, str]]: The loan count, title and author of each book.
+    """
+    matches = []
+    for book in lib.books:
+        title, author = search_index.normalize(book.book_title), search_index.normalize(book.book_author)
+        if title.startswith(prefix) or author.startswith(prefix):
+            matches.append((-lib.loan_counts.get(book.book_id, 0), title, author))
+    return [(-loans, title, author) for loans, title, author in sorted(matches)[:limit]]
+
+def bench_autocomplete(rows, directory, samples):
+    """
+    Times new.Library.autocomplete() for prefixes of random titles and
+    authors after a run of loans, against searching and sorting by loan
+    count, and times the changes that update the completions. Checks some
+    suggestions against a scan of the catalogue.
+
+    Parameters:
+    - rows (int): The number of books.
+    - directory (str): The directory for the generated files.
+    - samples (int): The number of calls per operation.
+
+    Returns:
+    - List[dict]: One result per operation.
+    """
+    rng = random.Random(rows)
+    paths = generate_data(directory, rows)
+    lib = new.Library('Benchmark', paths['new_books'], paths['new_users'], durability=ON_EXIT)
+    # A few books are borrowed far more often than the rest.
+    popular = [rng.choice(lib.books) for _ in range(100)]
+    for _ in range(samples):
+        book = rng.choice(popular) if rng.random() < 0.8 else rng.choice(lib.books)
+        lib.check_out_book(book.book_id, 'reader')
+        lib.return_book(book.book_id)
+
+    start = time.perf_counter()
+    lib.autocomplete('')
+    build = time.perf_counter() - start
+    prefixes = []
+    for _ in range(samples):
+        book = rng.choice(lib.books)
+        text = search_index.normalize(book.book_title if rng.random() < 0.8 else book.book_author)
+        prefixes.append(text[:rng.randint(1, 10)])
+
+    def search_and_rank(prefix):
+        books = lib.search_books(prefix)
+        return sorted(books, key=lambda book: -lib.loan_counts.get(book.book_id, 0))[:new.MAX_COMPLETIONS]
+
+    results = [summarize('new', 'autocomplete', rows, timed(lib.autocomplete, [(prefix,) for prefix in prefixes])),
+               summarize('new', 'search_books_and_rank', rows,
+                         timed(search_and_rank, [(prefix,) for prefix in prefixes[:min(samples, 50)]]))]
+    added = [new.Book(isbn(rows + i), f'{rng.choice(WORDS).title()} Extra {i}', rng.choice(AUTHORS), True, False, None)
+             for i in range(min(samples, 200))]
+    results.append(summarize('new', 'add_book', rows, timed(lib.add_book, [(book,) for book in added])))
+    results.append(summarize('new', 'delete_book', rows, timed(lib.delete_book, [(book.book_id,) for book in added])))
+    loaned = [rng.choice(lib.books).book_id for _ in range(samples)]
+    results.append(summarize('new', 'check_out_book', rows, timed(lib.check_out_book, [(book_id, 'reader') for book_id in loaned])))
+
+    consistent = True
+    for prefix in prefixes[:20]:
+        got = [(loans, search_index.normalize(book.book_title), search_index.normalize(book.book_author))
+               for loans, book in lib.autocomplete(prefix)]
+        consistent = consistent and got == brute_force_completions(lib, search_index.normalize(prefix), new.MAX_COMPLETIONS)
+    for result in results:
+        result.update({'benchmark': 'autocomplete', 'first_call_ms': round(1000 * build, 1), 'consistent': consistent})
+    lib.close()
+    for path in paths.values():
+        os.remove(path)
+    return results
+
+def made_up_word(rng):
+    """
+    Makes up a word of one to three syllables.
+
+    Parameters:
+    - rng (random.Random): The random source.
+
+    Returns:
+    - str: The word.
+    """
+    return ''.join(rng.choice(ONSETS) + rng.choice(VOWELS) + rng.choice(CODAS) for _ in range(rng.choice([1, 2, 2, 2, 3, 3])))
+
+def misspell(word, rng):
+    """
+    Makes one typo in a word: a letter changed, dropped, added or swapped
+    with the next one. Words too short for a fuzzy search to forgive a typo
+    are left alone.
+
+    Parameters:
+    - word (str): The word.
+    - rng (random.Random): The random source.
+
+    Returns:
+    - str: The misspelled word.
+    """
+    if not search_index.allowed_edits(word):
+        return word
+    i = rng.randrange(len(word) - 1)
+    letter = rng.choice('abcdefghijklmnopqrstuvwxyz')
+    return rng.choice([word[:i] + letter + word[i + 1:], word[:i] + word[i + 1:],
+                       word[:i] + letter + word[i:], word[:i] + word[i + 1] + word[i] + word[i + 2:]])
+
+def bench_fuzzy(rows, directory, samples):
+    """
+    Times fuzzy searches of new.Library for two words of a random title,
+    each with one typo, on a catalogue of made-up words, and counts how
+    often the book meant is among the results.
+
+    Parameters:
+    - rows (int): The number of books.
+    - directory (str): The directory for the generated files.
+    - samples (int): The number of searches.
+
+    Returns:
+    - List[dict]: One result per operation.
+    """
+    rng = random.Random(rows)
+    book_file = os.path.join(directory, f'fuzzy_books_{rows}.csv')
+    vocabulary = list({made_up_word(rng) for _ in range(max(1000, rows // 10))})
+    authors = [f'{made_up_word(rng).title()} {made_up_word(rng).title()}' for _ in range(max(100, rows // 100))]
+    with open(book_file, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(new.BOOK_FIELDS)
+        for i in range(rows):
+            title = ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(2, 5))).title()
+            writer.writerow([isbn(i), title, rng.choice(authors), True, False, ''])
+    lib = new.Library('Benchmark', book_file, None, durability=ON_EXIT)
+
+    start = time.perf_counter()
+    lib.fuzzy_search_books('warmup')
+    build = time.perf_counter() - start
+    meant = [rng.choice(lib.books) for _ in range(samples)]
+    queries = [' '.join(misspell(word, rng) for word in search_index.tokenize(search_index.normalize(book.book_title))[:2])
+               for book in meant]
+    found = 0
+    latencies = []
+    for book, query in zip(meant, queries):
+        start = time.perf_counter()
+        results = lib.fuzzy_search_books(query)
+        latencies.append(time.perf_counter() - start)
+        found += any(result is book for distance, result in results)
+    result = summarize('new', 'fuzzy_search_books', rows, latencies)
+    result.update({'benchmark': 'fuzzy', 'vocabulary': len(lib.search_index.token_postings),
+                   'first_search_ms': round(1000 * build, 1), 'found_rate': round(found / samples, 3),
+                   'budget_ms': 1000 * new.FUZZY_BUDGET})
+    lib.close()
+    os.remove(book_file)
+    return [result]
+
+def bench_search_cache(rows, directory, samples):
+    """
+    Runs the same mix of repeated searches, reservations, renewals, adds and
+    deletes on new.Library with and without the search cache, and checks
+    every cached search against the search index.
+
+    The queries are drawn from a pool of titles, authors and word pairs,
+    the first ones far more often than the rest, as a few popular queries
+    are in a real library.
+
+    Parameters:
+    - rows (int): The number of books.
+    - directory (str): The directory for the generated files.
+    - samples (int): The number of operations.
+
+    Returns:
+    - List[dict]: One result per operation and setting.
+    """
+    rng = random.Random(rows)
+    paths = generate_data(directory, rows)
+    pool = ([f'{rng.choice(WORDS)} {rng.choice(WORDS)} {rng.randrange(rows)}' for _ in range(100)] +
+            [f'{first} {second}' for first in WORDS[:5] for second in WORDS[5:10]] + AUTHORS)
+    rng.shuffle(pool)
+    weights = [1 / rank for rank in range(1, len(pool) + 1)]
+    ids = [isbn(rng.randrange(rows)) for _ in range(samples)]
+    plan = []
+    for i in range(samples):
+        roll = rng.random()
+        if roll < 0.9:
+            plan.append(('search_books', rng.choices(pool, weights)[0]))
+        elif roll < 0.94:
+            plan.append(('reserve_book', ids[i]))
+        elif roll < 0.96:
+            plan.append(('renew_book', ids[i]))
+        elif roll < 0.98:
+            plan.append(('add_book', new.Book(isbn(rows + i), f'{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}',
+                                              rng.choice(AUTHORS), True, False, None)))
+        else:
+            plan.append(('delete_book', ids[i]))
+
+    results = []
+    for size in (0, search_cache.SEARCH_CACHE_SIZE):
+        lib = new.Library('Benchmark', paths['new_books'], None, durability=ON_EXIT, search_cache_size=size)
+        latencies = {}
+        consistent = True
+        for operation, argument in plan:
+            start = time.perf_counter()
+            found = getattr(lib, operation)(argument)
+            latencies.setdefault(operation, []).append(time.perf_counter() - start)
+            if operation == 'search_books' and size:
+                consistent = consistent and found == lib.search_index.search(argument)
+        stats = lib.search_cache_stats()
+        for operation, timings in latencies.items():
+            result = summarize('new', operation, rows, timings)
+            result.update({'benchmark': 'search_cache', 'cache_size': size, 'hit_rate': stats['hit_rate'],
+                           'invalidations': stats['invalidations'], 'evictions': stats['evictions']})
+            if size:
+                result['consistent'] = consistent
+            results.append(result)
+        lib.close()
+    for path in paths.values():
+        os.remove(path)
+    return results
+
+def bench_listing(rows, directory, samples):
+    """
+    Times dumping the whole catalogue and member list of library.Library
+    one print() per record against writing them in blocks, to a line
+    buffered file as a terminal is, and times fetching pages at random
+    cursors.
+
+    Parameters:
+    - rows (int): The number of books and members.
+    - directory (str): The directory for the generated files.
+    - samples (int): The number of pages fetched.
+
+    Returns:
+    - List[dict]: One result per operation.
+    """
+    rng = random.Random(rows)
+    paths = generate_data(directory, rows)
+    lib = library.Library('Benchmark', paths['library_books'], paths['library_members'], durability=ON_EXIT)
+    out_file = os.path.join(directory, f'listing_{rows}.txt')
+
+    def print_books():
+        for book in lib.books:
+            book.display_info()
+
+    def print_members():
+        for member in lib.members:
+            print(f"Member ID: {member.member_id}, Name: {member.name}")
+
+    results = []
+    for operation, function in (('print_per_book', print_books), ('display_books', lib.display_books),
+                                ('print_per_member', print_members), ('display_members', lib.display_members)):
+        latencies = []
+        for _ in range(3):
+            with open(out_file, 'w', buffering=1) as file, contextlib.redirect_stdout(file):
+                start = time.perf_counter()
+                function()
+                latencies.append(time.perf_counter() - start)
+        results.append(summarize('library', operation, rows, latencies, rows))
+    cursors = [f'books:{rng.randrange(rows)}' for _ in range(samples)]
+    results.append(summarize('library', 'books_page', rows, timed(lib.books_page, [(cursor,) for cursor in cursors])))
+    for result in results:
+        result['benchmark'] = 'listing'
+    lib.close()
+    os.remove(out_file)
+    for path in paths.values():
+        os.remove(path)
+    return results
+
+def bench_fines(rows, samples):
+    """
+    Times the nightly fine calculation over a given number of loans
+    against working out each loan's fine from its Book object, and times
+    the loans, renewals and returns that update the fines in between.
+    Checks the two calculations agree.
+
+    Parameters:
+    - rows (int): The number of loans.
+    - samples (int): The number of calls per per-loan operation.
+
+    Returns:
+    - List[dict]: One result per operation.
+    """
+    rng = random.Random(rows)
+    today = date(2024, 6, 1)
+    member_types = list(fines.FINE_RULES)
+    borrowers = [(f'user{i}', rng.choice(member_types)) for i in range(max(1, rows // 10))]
+    books = []
+    engine = fines.FineEngine()
+    start = time.perf_counter()
+    for i in range(rows):
+        book = new.Book(isbn(i), f'Book {i}', 'Author', False, True, today + timedelta(days=rng.randint(-60, 14)))
+        user_name, member_type = rng.choice(borrowers)
+        engine.lend(book.book_id, book.due_return, user_name, member_type)
+        books.append((book, member_type))
+    load = time.perf_counter() - start
+
+    def fine_each_book():
+        return sum(fines.FINE_RULES[member_type].fine((today - book.due_return).days) for book, member_type in books)
+
+    day = today.toordinal()
+    results = [summarize('new', 'assess_fines', rows, timed(engine.assess, [(day,)] * 5), rows),
+               summarize('new', 'fine_each_book', rows, timed(fine_each_book, [()] * 3), rows)]
+    consistent = engine.total == fine_each_book()
+    picked = [rng.choice(books)[0] for _ in range(samples)]
+    results.append(summarize('new', 'renew', rows, timed(
+        engine.renew, [(book.book_id, today + timedelta(days=rng.randint(-30, 14))) for book in picked])))
+    results.append(summarize('new', 'settle', rows, timed(engine.settle, [(book.book_id, day) for book in picked])))
+    results.append(summarize('new', 'lend', rows, timed(
+        engine.lend, [(book.book_id, today + timedelta(days=14), 'user0', member_types[0]) for book in picked])))
+    fresh = engine.total
+    engine.assess(day)
+    consistent = consistent and fresh == engine.total
+    for result in results:
+        result.update({'benchmark': 'fines', 'numpy': fines.numpy is not None, 'load_ms': round(1000 * load, 1),
+                       'consistent': consistent})
+    return results
+
+def main():
+    """
+    Runs the benchmark given on the command line and writes the results as JSON.
+    """
+    parser = argparse.ArgumentParser(description="Library management system benchmarks.")
+    parser.add_argument('benchmark', choices=['memory', 'scale', 'stress', 'shards', 'catalogue', 'durability', 'holds', 'metrics', 'inventory', 'import', 'fuzzy', 'autocomplete', 'search_cache', 'listing', 'fines'])
+    parser.add_argument('--rows', type=int, help="memory: number of records (default 1000000); "
+                                                 "stress: catalogue size (default 1000).")
+    parser.add_argument('--sizes', default='10000,100000',
+                        help="scale, shards, catalogue, durability, metrics, inventory, import, fuzzy, autocomplete, search_cache, listing: comma-separated catalogue sizes, e.g. 10000,100000,1000000,10000000; fines: numbers of loans; "
+                             "holds: comma-separated queue lengths.")
+    parser.add_argument('--samples', type=int, default=1000,
+                        help="scale, shards, catalogue, durability, holds, metrics, inventory, fuzzy, autocomplete, search_cache, listing, fines: calls per per-item operation (default 1000).")
+    parser.add_argument('--shards', default='1,2,4', help="shards: comma-separated shard counts (default 1,2,4).")
+    parser.add_argument('--workers', default='1,2,4', help="import: comma-separated worker process counts (default 1,2,4).")
+    parser.add_argument('--threads', type=int, default=32, help="stress, shards: number of threads (default 32).")
+    parser.add_argument('--rounds', type=int, default=50, help="stress: operations per thread and book (default 50).")
+    parser.add_argument('--data-dir', help="scale, stress, shards, catalogue, durability, metrics, inventory, import, fuzzy, autocomplete, search_cache, listing: where to generate the data files (default a temporary directory).")
+    parser.add_argument('--output', help="Write the JSON results to this file instead of printing them.")
+    args = parser.parse_args()
+
+    report = {'meta': metadata(), 'results': []}
+    if args.benchmark == 'memory':
+        report['results'] = bench_memory(args.rows or 1000000)
+    elif args.benchmark == 'scale':
+        directory = args.data_dir or tempfile.mkdtemp(prefix='library-bench-')
+        for rows in [int(size) for size in args.sizes.split(',')]:
+            report['results'].extend(bench_scale(rows, directory, args.samples))
+    elif args.benchmark == 'stress':
+        directory = args.data_dir or tempfile.mkdtemp(prefix='library-bench-')
+        report['results'] = bench_stress(args.threads, args.rounds, args.rows or 1000, directory)
+    elif args.benchmark == 'shards':
+        directory = args.data_dir or tempfile.mkdtemp(prefix='library-bench-')
+        shard_counts = [int(count) for count in args.shards.split(',')]
+        for rows in [int(size) for size in args.sizes.split(',')]:
+            report['results'].extend(bench_shards(rows, shard_counts, directory, args.samples, args.threads))
+    elif args.benchmark == 'catalogue':
+        directory = args.data_dir or tempfile.mkdtemp(prefix='library-bench-')
+        for rows in [int(size) for size in args.sizes.split(',')]:
+            report['results'].extend(bench_catalogue(rows, directory, args.samples))
+    elif args.benchmark == 'durability':
+        directory = args.data_dir or tempfile.mkdtemp(prefix='library-bench-')
+        for rows in [int(size) for size in args.sizes.split(',')]:
+            report['results'].extend(bench_durability(rows, directory, args.samples))
+    elif args.benchmark == 'metrics':
+        directory = args.data_dir or tempfile.mkdtemp(prefix='library-bench-')
+        for rows in [int(size) for size in args.sizes.split(',')]:
+            report['results'].extend(bench_metrics(rows, directory, args.samples))
+    elif args.benchmark == 'inventory':
+        directory = args.data_dir or tempfile.mkdtemp(prefix='library-bench-')
+        for rows in [int(size) for size in args.sizes.split(',')]:
+            report['results'].extend(bench_inventory(rows, directory, args.samples))
+    elif args.benchmark == 'import':
+        directory = args.data_dir or tempfile.mkdtemp(prefix='library-bench-')
+        worker_counts = [int(count) for count in args.workers.split(',')]
+        for rows in [int(size) for size in args.sizes.split(',')]:
+            report['results'].extend(bench_import(rows, directory, worker_counts))
+    elif args.benchmark == 'fuzzy':
+        directory = args.data_dir or tempfile.mkdtemp(prefix='library-bench-')
+        for rows in [int(size) for size in args.sizes.split(',')]:
+            report['results'].extend(bench_fuzzy(rows, directory, args.samples))
+    elif args.benchmark == 'autocomplete':
+        directory = args.data_dir or tempfile.mkdtemp(prefix='library-bench-')
+        for rows in [int(size) for size in args.sizes.split(',')]:
+            report['results'].extend(bench_autocomplete(rows, directory, args.samples))
+    elif args.benchmark == 'search_cache':
+        directory = args.data_dir or tempfile.mkdtemp(prefix='library-bench-')
+        for rows in [int(size) for size in args.sizes.split(',')]:
+            report['results'].extend(bench_search_cache(rows, directory, args.samples))
+    elif args.benchmark == 'listing':
+        directory = args.data_dir or tempfile.mkdtemp(prefix='library-bench-')
+        for rows in [int(size) for size in args.sizes.split(',')]:
+            report['results'].extend(bench_listing(rows, directory, args.samples))
+    elif args.benchmark == 'fines':
+        for rows in [int(size) for size in args.sizes.split(',')]:
+            report['results'].extend(bench_fines(rows, args.samples))
+    elif args.benchmark == 'holds':
+        for patrons in [int(size) for size in args.sizes.split(',')]:
+            report['results'].extend(bench_holds(patrons, args.samples))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+    if any(result.get('thread_safe') and result.get('double_issues') for result in report['results']):
+        sys.exit("Thread-safe run issued a book more than once.")
+    if any(result.get('thread_safe') and result.get('missed_lookups') for result in report['results']):
+        sys.exit("Thread-safe run failed to find a book that was never deleted.")
+    if any(result.get('consistent') is False for result in report['results']):
+        sys.exit("Inventory counters, autocomplete suggestions, cached searches or fines disagree with a recount.")
+
+if __name__ == "__main__":
+    main()
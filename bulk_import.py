@@ -0,0 +1,427 @@
+r"""
+Bulk catalogue import.
+
+Reads a large export of books and adds the new ones to a library with a
+single write. The file is split into chunks at record boundaries and the
+chunks are parsed by a pool of worker processes, each validating and
+normalizing the ISBNs of its chunk. The results are then deduplicated in
+file order, against the catalogue and within the import, and added in one
+go.
+
+Two formats are read:
+- csv: a CSV file with a header. The ISBN column may be called ISBN or
+  book_id, the title Title or book_title and the author Author or
+  book_author (in any case). Quoted values may not contain line breaks.
+- marc: MARC records in the MARCMaker text format (.mrk), one field per
+  line and a blank line between records, e.g.
+
+      =LDR  00000nam  2200000   4500
+      =020  \\$a0-306-40615-2 (pbk.)
+      =100  1\\$aRowling, J. K.
+      =245  10$aHarry Potter and the philosopher's stone /$cJ.K. Rowling.
+
+  ISBNs come from 020 $a, titles from 245 $a and authors from 100 $a.
+
+ISBNs are stored in their 13-digit form without hyphens, so the same book
+given as ISBN-10 and ISBN-13 is only imported once.
+
+Usage:
+    python bulk_import.py export.csv --app new --books books.csv
+    python bulk_import.py export.mrk --format marc --app library --books books.csv --members members.csv --rejects rejects.csv
+"""
+import argparse
+import csv
+import io
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import library
+import new
+
+# The size of the chunks the file is split into for the workers, in bytes.
+CHUNK_BYTES = 1 << 22
+
+FORMATS = ('csv', 'marc')
+
+# An ISBN as written: an optional 'ISBN' or 'ISBN-13:' prefix, then digits
+# with hyphens or spaces between them, and perhaps a final X.
+ISBN_PATTERN = re.compile(r'\s*(?:ISBN(?:-1[03])?:?\s*)?([0-9](?:[0-9 -]*[0-9X])?)')
+
+# The accepted names of the CSV columns, in lower case.
+ISBN_COLUMNS = ('isbn', 'book_id', 'isbn13', 'isbn10')
+TITLE_COLUMNS = ('title', 'book_title')
+AUTHOR_COLUMNS = ('author', 'book_author')
+
+def normalize_isbn(value):
+    """
+    Validates an ISBN and converts it to its 13-digit form.
+
+    Hyphens, spaces, an 'ISBN' prefix and anything after the number (such
+    as '(pbk.)') are ignored. ISBN-10s are checked with their mod-11 check
+    digit and ISBN-13s with their mod-10 one.
+
+    Parameters:
+    - value (str): The ISBN as given.
+
+    Returns:
+    - str or None: The 13 digits, or None if the value is not a valid ISBN.
+    """
+    match = ISBN_PATTERN.match(value.upper())
+    if not match:
+        return None
+    digits = match.group(1).replace('-', '').replace(' ', '')
+    if len(digits) == 10 and digits[:9].isdigit():
+        check = sum(weight * int(digit) for weight, digit in zip(range(10, 1, -1), digits))
+        check += 10 if digits[9] == 'X' else int(digits[9])
+        if check % 11:
+            return None
+        digits = '978' + digits[:9]
+        return digits + str(-(sum(map(int, digits[0::2])) + 3 * sum(map(int, digits[1::2]))) % 10)
+    if len(digits) == 13 and digits.isdigit() and digits[:3] in ('978', '979'):
+        if (sum(map(int, digits[0::2])) + 3 * sum(map(int, digits[1::2]))) % 10:
+            return None
+        return digits
+    return None
+
+class ImportReport:
+    """
+    Represents the outcome of an import.
+
+    Attributes:
+    - read (int): The number of records read.
+    - imported (int): The number of books added.
+    - rejected (List[Tuple[int, str, str]]): The (line, reason, record) of each record not imported.
+    - seconds (float): How long the import took, including the write.
+    """
+
+    def __init__(self, read, imported, rejected, seconds):
+        """
+        Initializes a new ImportReport object.
+
+        Parameters:
+        - read (int): The number of records read.
+        - imported (int): The number of books added.
+        - rejected (List[Tuple[int, str, str]]): The rejected records.
+        - seconds (float): How long the import took.
+        """
+        self.read = read
+        self.imported = imported
+        self.rejected = rejected
+        self.seconds = seconds
+
+    @property
+    def rows_per_second(self):
+        """
+        Gets the import rate.
+
+        Returns:
+        - float: Records read per second.
+        """
+        return self.read / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        """
+        Describes the import in one line.
+
+        Returns:
+        - str: The summary.
+        """
+        return (f"Imported {self.imported} of {self.read} records in {self.seconds:.2f}s "
+                f"({self.rows_per_second:,.0f} records/sec); {len(self.rejected)} rejected.")
+
+def find_column(fieldnames, names):
+    """
+    Finds a column by any of its accepted names, ignoring case.
+
+    Parameters:
+    - fieldnames (List[str]): The header.
+    - names (Tuple[str]): The accepted names, in lower case.
+
+    Returns:
+    - int or None: The column's position, or None if there is no such column.
+    """
+    lowered = [field.strip().lower() for field in fieldnames]
+    return next((lowered.index(name) for name in names if name in lowered), None)
+
+def read_header(path):
+    """
+    Reads the header of a CSV file.
+
+    Parameters:
+    - path (str): The file.
+
+    Returns:
+    - Tuple[List[str], int]: The column names and the byte offset of the first record.
+    """
+    with open(path, 'rb') as file:
+        line = file.readline()
+        return next(csv.reader([line.decode('utf-8-sig')]), []), file.tell()
+
+def chunk_bounds(path, start, fmt, chunk_bytes):
+    """
+    Splits a file into chunks that end at record boundaries: the end of a
+    line for CSV, a blank line for MARC.
+
+    Parameters:
+    - path (str): The file.
+    - start (int): The byte offset of the first record.
+    - fmt (str): 'csv' or 'marc'.
+    - chunk_bytes (int): The rough size of each chunk.
+
+    Returns:
+    - List[Tuple[int, int]]: The (start, end) byte offsets of each chunk.
+    """
+    size = os.path.getsize(path)
+    bounds = []
+    with open(path, 'rb') as file:
+        while start < size:
+            file.seek(max(start, start + chunk_bytes - 1))
+            line = file.readline()
+            if fmt == 'marc':
+                while line and line.strip():
+                    line = file.readline()
+            end = min(file.tell(), size)
+            bounds.append((start, end))
+            start = end
+    return bounds
+
+def parse_chunk(path, start, end, fmt, columns):
+    """
+    Parses and validates the records of one chunk. Runs in a worker process.
+
+    Parameters:
+    - path (str): The file.
+    - start (int): The byte offset of the chunk.
+    - end (int): The byte offset just past the chunk.
+    - fmt (str): 'csv' or 'marc'.
+    - columns (Tuple[int, int, int or None]): The positions of the ISBN,
+      title and author columns (csv only).
+
+    Returns:
+    - Tuple[list, list, int]: The accepted (ISBN, title, author, line)
+      records, the rejected (line, reason, record) ones, both with lines
+      counted from the start of the chunk, and the number of lines in the chunk.
+    """
+    with open(path, 'rb') as file:
+        file.seek(start)
+        text = file.read(end - start).decode('utf-8-sig' if start == 0 else 'utf-8')
+    records = iter_csv_records(text, columns) if fmt == 'csv' else iter_marc_records(text)
+    separator = ',' if fmt == 'csv' else ' | '
+    accepted = []
+    rejected = []
+    for line, raw_isbn, title, author, parts in records:
+        isbn = normalize_isbn(raw_isbn or '')
+        title = (title or '').strip()
+        if isbn is None:
+            rejected.append((line, 'invalid ISBN', separator.join(parts)))
+        elif not title:
+            rejected.append((line, 'missing title', separator.join(parts)))
+        else:
+            accepted.append((isbn, title, (author or '').strip(), line))
+    return accepted, rejected, text.count('\n')
+
+def iter_csv_records(text, columns):
+    """
+    Yields the records of a chunk of a CSV file.
+
+    Parameters:
+    - text (str): The chunk.
+    - columns (Tuple[int, int, int or None]): The positions of the ISBN, title and author columns.
+
+    Returns:
+    - Iterator[tuple]: The (line, ISBN, title, author, values) of each non-blank record.
+    """
+    isbn_column, title_column, author_column = columns
+    reader = csv.reader(io.StringIO(text, newline=''))
+    for values in reader:
+        if not values:
+            continue
+        yield (reader.line_num,
+               values[isbn_column] if isbn_column < len(values) else None,
+               values[title_column] if title_column < len(values) else None,
+               values[author_column] if author_column is not None and author_column < len(values) else None,
+               values)
+
+def iter_marc_records(text):
+    """
+    Yields the records of a chunk of a MARCMaker text file.
+
+    Parameters:
+    - text (str): The chunk.
+
+    Returns:
+    - Iterator[tuple]: The (first line, ISBN, title, author, lines) of each record.
+    """
+    fields = {}
+    lines = []
+    first = None
+    for line, text_line in enumerate(text.splitlines(), 1):
+        if not text_line.strip():
+            if lines:
+                yield first, fields.get('020'), fields.get('245'), fields.get('100'), lines
+            fields, lines, first = {}, [], None
+            continue
+        if first is None:
+            first = line
+        lines.append(text_line)
+        tag = text_line[1:4]
+        if text_line.startswith('=') and tag in ('020', '100', '245') and tag not in fields:
+            fields[tag] = subfield_a(text_line[4:])
+    if lines:
+        yield first, fields.get('020'), fields.get('245'), fields.get('100'), lines
+
+def subfield_a(field):
+    """
+    Gets the $a subfield of a MARCMaker field, without the indicators and
+    the trailing punctuation MARC puts before the next subfield.
+
+    Parameters:
+    - field (str): The field after its tag, e.g. '  10$aTitle /$cAuthor.'.
+
+    Returns:
+    - str or None: The subfield's text, or None if there is none.
+    """
+    start = field.find('$a')
+    if start < 0:
+        return None
+    value = field[start + 2:]
+    end = value.find('$')
+    if end >= 0:
+        value = value[:end]
+    return value.strip().rstrip(' /:;,').strip()
+
+def parse_file(path, fmt='csv', workers=None, chunk_bytes=CHUNK_BYTES):
+    """
+    Parses and validates a whole file, in parallel when it has more than one chunk.
+
+    Parameters:
+    - path (str): The file.
+    - fmt (str): 'csv' or 'marc'.
+    - workers (int): The number of worker processes (default the number of CPUs).
+    - chunk_bytes (int): The rough size of each chunk.
+
+    Returns:
+    - Tuple[list, list]: The accepted (ISBN, title, author, line) records
+      and the rejected (line, reason, record) ones, in file order.
+
+    Raises:
+    - ValueError: If the format is unknown or a CSV file has no ISBN or title column.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    columns = None
+    start = 0
+    first_line = 1
+    if fmt == 'csv':
+        header, start = read_header(path)
+        columns = (find_column(header, ISBN_COLUMNS), find_column(header, TITLE_COLUMNS),
+                   find_column(header, AUTHOR_COLUMNS))
+        if columns[0] is None or columns[1] is None:
+            raise ValueError(f"{path} needs an ISBN and a title column; its columns are {', '.join(header)}")
+        first_line = 2
+    bounds = chunk_bounds(path, start, fmt, chunk_bytes)
+    jobs = [(path, chunk_start, chunk_end, fmt, columns) for chunk_start, chunk_end in bounds]
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(parse_chunk, *zip(*jobs)))
+    else:
+        results = [parse_chunk(*job) for job in jobs]
+    accepted = []
+    rejected = []
+    # Lines are counted per chunk; shift them to lines of the file.
+    offset = first_line - 1
+    for chunk_accepted, chunk_rejected, lines in results:
+        accepted.extend((isbn, title, author, line + offset) for isbn, title, author, line in chunk_accepted)
+        rejected.extend((line + offset, reason, record) for line, reason, record in chunk_rejected)
+        offset += lines
+    return accepted, rejected
+
+def import_books(lib, path, fmt='csv', workers=None, chunk_bytes=CHUNK_BYTES):
+    """
+    Imports the new books in a file into a library, with one write.
+
+    A record is rejected if its ISBN is invalid, its title is missing, or
+    its ISBN is already in the catalogue or earlier in the file.
+
+    Parameters:
+    - lib (library.Library or new.Library): The library.
+    - path (str): The file.
+    - fmt (str): 'csv' or 'marc'.
+    - workers (int): The number of worker processes (default the number of CPUs).
+    - chunk_bytes (int): The rough size of each chunk.
+
+    Returns:
+    - ImportReport: What was imported and rejected, and how fast.
+    """
+    started = time.perf_counter()
+    accepted, rejected = parse_file(path, fmt, workers, chunk_bytes)
+    if isinstance(lib, new.Library):
+        existing = [book.book_id for book in lib.books]
+    else:
+        existing = list(lib.books_by_isbn)
+    # Most stored IDs are already in the 13-digit form, so only the others are normalized.
+    catalogue = {isbn if len(isbn) == 13 and isbn.isdigit() else normalize_isbn(isbn) or isbn for isbn in existing}
+    read = len(accepted) + len(rejected)
+    imported = set()
+    books = []
+    for isbn, title, author, line in accepted:
+        if isbn in catalogue or isbn in imported:
+            reason = 'ISBN already in the catalogue' if isbn in catalogue else 'ISBN repeated in the import'
+            rejected.append((line, reason, f'{isbn},{title},{author}'))
+            continue
+        imported.add(isbn)
+        if isinstance(lib, new.Library):
+            books.append(new.Book(isbn, title, author, True, False, None))
+        else:
+            books.append(library.Book(title, author, isbn))
+    lib.add_books(books)
+    rejected.sort()
+    return ImportReport(read, len(books), rejected, time.perf_counter() - started)
+
+def write_rejects(report, path):
+    """
+    Writes the rejected records to a CSV file.
+
+    Parameters:
+    - report (ImportReport): The import's report.
+    - path (str): The CSV file.
+    """
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['line', 'reason', 'record'])
+        writer.writerows(report.rejected)
+
+def main():
+    """
+    Imports a file into a library, as given on the command line.
+    """
+    parser = argparse.ArgumentParser(description="Import books into a library in bulk.")
+    parser.add_argument('source', help="The file to import.")
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--app', choices=['library', 'new'], default='new')
+    parser.add_argument('--books', default='books.csv', help="The library's book file.")
+    parser.add_argument('--members', default='members.csv', help="The library's member file (library app).")
+    parser.add_argument('--workers', type=int, help="Worker processes (default the number of CPUs).")
+    parser.add_argument('--rejects', help="Write the rejected records to this CSV file.")
+    args = parser.parse_args()
+
+    if args.app == 'library':
+        lib = library.Library("My Library", args.books, args.members)
+    else:
+        lib = new.Library("My Library", args.books, None)
+    report = import_books(lib, args.source, args.format, args.workers)
+    lib.close()
+    print(report.summary())
+    if args.rejects:
+        write_rejects(report, args.rejects)
+    else:
+        for line, reason, record in report.rejected[:10]:
+            print(f"  line {line}: {reason}: {record}")
+        if len(report.rejected) > 10:
+            print(f"  ... and {len(report.rejected) - 10} more; use --rejects to write them all.")
+
+if __name__ == "__main__":
+    main()
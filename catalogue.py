@@ -0,0 +1,357 @@
+"""
+Binary catalogue files.
+
+A binary catalogue holds the same rows as a book CSV file in fixed-width
+records, followed by an index of the record numbers sorted by key. Opening
+one maps the file into memory instead of parsing it, so it opens in the same
+time whatever its size, and processes opening the same file share its pages
+in the OS page cache. Finding a row by key binary-searches the index, and
+only the fields asked for are decoded.
+
+File layout:
+    8 bytes      MAGIC
+    4 bytes      header length, little-endian
+    header       JSON: fieldnames, widths, key and count
+    records      count fixed-width records; each field is UTF-8, padded with NUL bytes
+    index        count little-endian uint32 record numbers, sorted by key
+
+Usage:
+    python catalogue.py to-binary books.csv books.lmsc
+    python catalogue.py to-csv books.lmsc books.csv
+"""
+import argparse
+import array
+import csv
+import json
+import mmap
+import os
+import struct
+import sys
+
+from journal import read_rows, replace_file
+
+MAGIC = b'LMSCAT01'
+SUFFIX = '.lmsc'
+
+# The key columns of the book layouts of library.py and new.py.
+KEY_FIELDS = ('ISBN', 'book_id')
+
+class BinaryCatalogue:
+    """
+    Represents an open binary catalogue file.
+
+    Attributes:
+    - path (str): The catalogue file.
+    - fieldnames (List[str]): The columns.
+    - key (str): The column the index is sorted by.
+    """
+
+    def __init__(self, path):
+        """
+        Initializes a new BinaryCatalogue object, mapping the file into memory.
+
+        Parameters:
+        - path (str): The catalogue file.
+
+        Raises:
+        - ValueError: If the file is not a binary catalogue.
+        """
+        self.path = path
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.map.close()
+            raise ValueError(f"{path} is not a binary catalogue")
+        header_length, = struct.unpack_from('<I', self.map, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(self.map[start:start + header_length])
+        self.fieldnames = header['fieldnames']
+        self.widths = header['widths']
+        self.key = header['key']
+        self.count = header['count']
+        self.record = struct.Struct(''.join(f'{width}s' for width in self.widths))
+        self.records_start = start + header_length
+        self.index_start = self.records_start + self.count * self.record.size
+        self.offsets = {}
+        offset = 0
+        for field, width in zip(self.fieldnames, self.widths):
+            self.offsets[field] = (offset, width)
+            offset += width
+        self.index = memoryview(self.map)[self.index_start:self.index_start + 4 * self.count].cast('I')
+        if sys.byteorder != 'little':
+            index = array.array('I', self.index)
+            index.byteswap()
+            self.index.release()
+            self.index = memoryview(index)
+
+    def __len__(self):
+        return self.count
+
+    def value(self, number, field):
+        """
+        Decodes one field of a record.
+
+        Parameters:
+        - number (int): The record number.
+        - field (str): The column.
+
+        Returns:
+        - str: The value.
+        """
+        offset, width = self.offsets[field]
+        start = self.records_start + number * self.record.size + offset
+        return self.map[start:start + width].rstrip(b'\0').decode()
+
+    def row(self, number):
+        """
+        Decodes a record.
+
+        Parameters:
+        - number (int): The record number.
+
+        Returns:
+        - dict: The row.
+        """
+        values = self.record.unpack_from(self.map, self.records_start + number * self.record.size)
+        return {field: value.rstrip(b'\0').decode() for field, value in zip(self.fieldnames, values)}
+
+    def iter_rows(self):
+        """
+        Yields the rows one at a time, in catalogue order.
+
+        Returns:
+        - Iterator[dict]: The rows.
+        """
+        fieldnames = self.fieldnames
+        records = memoryview(self.map)[self.records_start:self.index_start]
+        try:
+            for values in self.record.iter_unpack(records):
+                yield {field: value.rstrip(b'\0').decode() for field, value in zip(fieldnames, values)}
+        finally:
+            records.release()
+
+    def position(self, key):
+        """
+        Binary-searches the index for the first record with a key.
+
+        Parameters:
+        - key (str): The key to look for.
+
+        Returns:
+        - int or None: The record number, or None if no record has the key.
+        """
+        offset, width = self.offsets[self.key]
+        wanted = str(key).encode()
+        if len(wanted) > width:
+            return None
+        wanted = wanted.ljust(width, b'\0')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            start = self.records_start + self.index[middle] * self.record.size + offset
+            if self.map[start:start + width] < wanted:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.count:
+            return None
+        number = self.index[low]
+        start = self.records_start + number * self.record.size + offset
+        return number if self.map[start:start + width] == wanted else None
+
+    def find(self, key):
+        """
+        Finds the first row with a key.
+
+        Parameters:
+        - key (str): The key to look for.
+
+        Returns:
+        - dict or None: The row, or None if no row has the key.
+        """
+        number = self.position(key)
+        return None if number is None else self.row(number)
+
+    def close(self):
+        """
+        Unmaps the file.
+        """
+        self.index.release()
+        self.map.close()
+
+def write_catalogue(path, fieldnames, key, rows):
+    """
+    Writes rows to a binary catalogue file. The file is written next to
+    the target and then renamed over it, so readers never see a partial file.
+
+    Parameters:
+    - path (str): The catalogue file.
+    - fieldnames (List[str]): The columns.
+    - key (str): The column to index.
+    - rows (Iterable[dict]): The rows, in catalogue order.
+
+    Returns:
+    - int: The number of rows written.
+    """
+    encoded = [[b'' if row.get(field) is None else str(row[field]).encode() for field in fieldnames] for row in rows]
+    widths = [max([len(values[i]) for values in encoded], default=0) or 1 for i in range(len(fieldnames))]
+    record = struct.Struct(''.join(f'{width}s' for width in widths))
+    key_position = fieldnames.index(key)
+    # Padding with NUL bytes keeps the byte order of the keys the same as
+    # their string order, and a stable sort puts duplicates in catalogue order.
+    index = array.array('I', sorted(range(len(encoded)), key=lambda number: encoded[number][key_position]))
+    if sys.byteorder != 'little':
+        index.byteswap()
+    header = json.dumps({'fieldnames': fieldnames, 'widths': widths, 'key': key, 'count': len(encoded)}).encode()
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(MAGIC + struct.pack('<I', len(header)) + header)
+        for values in encoded:
+            file.write(record.pack(*values))
+        index.tofile(file)
+        file.flush()
+        os.fsync(file.fileno())
+    replace_file(temporary, path)
+    return len(encoded)
+
+def csv_to_catalogue(csv_path, path, key=None):
+    """
+    Converts a CSV file to a binary catalogue file.
+
+    Parameters:
+    - csv_path (str): The CSV file to read.
+    - path (str): The catalogue file to write.
+    - key (str): The column to index (default ISBN or book_id, whichever the file has).
+
+    Returns:
+    - int: The number of rows written.
+    """
+    with open(csv_path, 'r', newline='') as file:
+        fieldnames = next(csv.reader(file), [])
+    key = key or next((field for field in fieldnames if field in KEY_FIELDS), fieldnames[0])
+    return write_catalogue(path, fieldnames, key, read_rows(csv_path))
+
+def catalogue_to_csv(path, csv_path):
+    """
+    Converts a binary catalogue file to a CSV file.
+
+    Parameters:
+    - path (str): The catalogue file to read.
+    - csv_path (str): The CSV file to write.
+
+    Returns:
+    - int: The number of rows written.
+    """
+    catalogue = BinaryCatalogue(path)
+    try:
+        with open(csv_path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=catalogue.fieldnames)
+            writer.writeheader()
+            writer.writerows(catalogue.iter_rows())
+        return len(catalogue)
+    finally:
+        catalogue.close()
+
+class CatalogueTable:
+    """
+    Represents a table stored in a binary catalogue file, for
+    CSVStorage. Any change rewrites the whole file, so binary catalogues
+    suit catalogues that are read much more often than they change.
+
+    Attributes:
+    - path (str): The catalogue file.
+    - fieldnames (List[str]): The columns.
+    - key (str): The column to index.
+    - catalogue (BinaryCatalogue or None): The open file, if it exists.
+    """
+
+    def __init__(self, path, fieldnames, key):
+        """
+        Initializes a new CatalogueTable object.
+
+        Parameters:
+        - path (str): The catalogue file.
+        - fieldnames (List[str]): The columns.
+        - key (str): The column to index.
+        """
+        self.path = path
+        self.fieldnames = fieldnames
+        self.key = key
+        self.catalogue = BinaryCatalogue(path) if os.path.exists(path) else None
+
+    def iter_rows(self):
+        """
+        Yields the stored rows one at a time.
+
+        Returns:
+        - Iterator[dict]: The rows, in catalogue order.
+        """
+        return self.catalogue.iter_rows() if self.catalogue else iter(())
+
+    def record(self, op, row):
+        """
+        Records a change to a single row.
+
+        Parameters:
+        - op (str): 'add', 'update' or 'delete'.
+        - row (dict): The row that changed.
+
+        Returns:
+        - bool: Always True; the caller should save all rows with save().
+        """
+        return True
+
+    def record_many(self, op, rows):
+        """
+        Records the same change to several rows.
+
+        Parameters:
+        - op (str): 'add', 'update' or 'delete'.
+        - rows (List[dict]): The rows that changed.
+
+        Returns:
+        - bool: Always True; the caller should save all rows with save().
+        """
+        return True
+
+    def save(self, rows):
+        """
+        Replaces the stored rows, rewriting the file.
+
+        Parameters:
+        - rows (Iterable[dict]): The current rows.
+        """
+        write_catalogue(self.path, self.fieldnames, self.key, rows)
+        self.close()
+        self.catalogue = BinaryCatalogue(self.path)
+
+    def close(self):
+        """
+        Unmaps the file, if it is open.
+        """
+        if self.catalogue:
+            self.catalogue.close()
+            self.catalogue = None
+
+def main():
+    """
+    Converts between CSV and binary catalogue files, as given on the command line.
+    """
+    parser = argparse.ArgumentParser(description="Convert book files between CSV and binary catalogues.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    to_binary = commands.add_parser('to-binary', help="Convert a CSV file to a binary catalogue.")
+    to_binary.add_argument('source')
+    to_binary.add_argument('target')
+    to_binary.add_argument('--key', help="The column to index (default ISBN or book_id).")
+    to_csv = commands.add_parser('to-csv', help="Convert a binary catalogue to a CSV file.")
+    to_csv.add_argument('source')
+    to_csv.add_argument('target')
+    args = parser.parse_args()
+    if args.command == 'to-binary':
+        count = csv_to_catalogue(args.source, args.target, args.key)
+    else:
+        count = catalogue_to_csv(args.source, args.target)
+    print(f"Wrote {count} rows to {args.target}.")
+
+if __name__ == "__main__":
+    main()
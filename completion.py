@@ -0,0 +1,336 @@
+import sys
+from bisect import bisect_left
+
+from search_index import normalize
+
+# The most completions a prefix query returns, and so the number of best
+# books each trie node keeps.
+MAX_COMPLETIONS = 10
+
+# The most entries a leaf holds before it is split into a node per next
+# character.
+LEAF_SIZE = 64
+
+# The largest character, which has no next character to search up to.
+MAX_CHAR = chr(sys.maxunicode)
+
+# The fields of an index entry (book, title, author) that are completed.
+TITLE = 1
+AUTHOR = 2
+
+class Node:
+    """
+    Represents a node of a CompletionTrie: all the entries whose text starts
+    with the node's prefix.
+
+    Attributes:
+    - children (dict or None): The child node for each next character, or
+      None for a leaf.
+    - held (List[List[tuple]]): The entries held here, by field (TITLE or
+      AUTHOR): all of them in a leaf, only those whose text ends here
+      otherwise. Keeping a list per field saves a (field, entry) pair per entry.
+    - top (List[tuple]): The best entries of the node, one per book, best
+      first; kept for inner nodes only.
+    """
+    __slots__ = ('children', 'held', 'top')
+
+    def __init__(self):
+        """
+        Initializes a new, empty leaf Node object.
+        """
+        self.children = None
+        self.held = [None, [], []]
+        self.top = []
+
+    def __len__(self):
+        return len(self.held[TITLE]) + len(self.held[AUTHOR])
+
+    def entries(self):
+        """
+        Gets the entries held here, without their fields.
+
+        Returns:
+        - List[tuple]: The (book, title, author) entries.
+        """
+        return self.held[TITLE] + self.held[AUTHOR]
+
+class CompletionTrie:
+    """
+    Represents a prefix index over book titles and authors that answers
+    "the most borrowed books whose title or author starts with this"
+    without visiting every match.
+
+    It is a burst trie: a node holds its entries in plain lists until
+    there are more than LEAF_SIZE of them, and is then split into a child
+    per next character. Each inner node keeps its best MAX_COMPLETIONS
+    books, so a short, common prefix is answered from that list, and a
+    long, rare one by filtering one small leaf. A node's best books are
+    always among its own entries and its children's best, so a change only
+    updates the nodes on the paths of the book's title and author.
+
+    The entries are the (book, title, author) tuples of a SearchIndex, with
+    the title and author already normalized, so the trie shares their text.
+    A book is known by its Book object, so an entry from a rebuilt index
+    stands for the same book as the one it replaced.
+
+    Attributes:
+    - popularity (callable): Gets the loan count of a book.
+    """
+
+    def __init__(self, entries=(), popularity=lambda book: 0):
+        """
+        Initializes a new CompletionTrie object.
+
+        Parameters:
+        - entries (Iterable[tuple]): The (book, title, author) entries to index.
+        - popularity (callable): Gets the loan count of a book.
+        """
+        self.popularity = popularity
+        texts = []
+        held = []
+        for entry in entries:
+            for field in (TITLE, AUTHOR):
+                if entry[field]:
+                    texts.append(entry[field])
+                    held.append((field, entry))
+        order = sorted(range(len(texts)), key=texts.__getitem__)
+        self.root = self.build([texts[i] for i in order], [held[i] for i in order], 0, len(texts), 0)
+
+    def build(self, texts, held, start, end, depth):
+        """
+        Builds the node for a run of sorted texts sharing a prefix. Each
+        child's run is found by binary search, so building the whole trie
+        costs one sort rather than a pass over the entries per level.
+
+        Parameters:
+        - texts (List[str]): All the texts, sorted.
+        - held (List[Tuple[int, tuple]]): The (field, entry) of each text.
+        - start (int): The first text of the run.
+        - end (int): The end of the run.
+        - depth (int): The length of the prefix the run shares.
+
+        Returns:
+        - Node: The node.
+        """
+        node = Node()
+        if end - start <= LEAF_SIZE:
+            for field, entry in held[start:end]:
+                node.held[field].append(entry)
+            return node
+        node.children = {}
+        # Texts that end here sort before those that go on.
+        while start < end and len(texts[start]) == depth:
+            field, entry = held[start]
+            node.held[field].append(entry)
+            start += 1
+        while start < end:
+            char = texts[start][depth]
+            stop = bisect_left(texts, texts[start][:depth] + chr(ord(char) + 1), start, end) if char < MAX_CHAR else end
+            node.children[char] = self.build(texts, held, start, stop, depth + 1)
+            start = stop
+        self.refresh(node)
+        return node
+
+    def rank(self, entry):
+        """
+        Gets the sort key of an entry: most borrowed first, then by title and author.
+
+        Parameters:
+        - entry (tuple): The (book, title, author) entry.
+
+        Returns:
+        - tuple: The key.
+        """
+        return -self.popularity(entry[0]), entry[1], entry[2]
+
+    def best(self, entries):
+        """
+        Picks the best entries, one per book.
+
+        Parameters:
+        - entries (Iterable[tuple]): The (book, title, author) entries.
+
+        Returns:
+        - List[tuple]: At most MAX_COMPLETIONS entries, best first.
+        """
+        unique = {id(entry[0]): entry for entry in entries}
+        return sorted(unique.values(), key=self.rank)[:MAX_COMPLETIONS]
+
+    def node_best(self, node):
+        """
+        Gets the best entries of a node, working them out for a leaf.
+
+        Parameters:
+        - node (Node): The node.
+
+        Returns:
+        - List[tuple]: At most MAX_COMPLETIONS entries, best first.
+        """
+        if node.children is None:
+            return self.best(node.entries())
+        return node.top
+
+    def refresh(self, node):
+        """
+        Works out the best entries of an inner node again from its own
+        entries and its children's best.
+
+        Parameters:
+        - node (Node): The inner node.
+        """
+        candidates = node.entries()
+        for child in node.children.values():
+            candidates.extend(self.node_best(child))
+        node.top = self.best(candidates)
+
+    def path(self, text, create=True):
+        """
+        Walks down to the node where a text is stored.
+
+        Parameters:
+        - text (str): The normalized text.
+        - create (bool): Add the missing nodes on the way, to store a new
+          text; otherwise the walk stops where the path ends, as the text
+          cannot be stored below.
+
+        Returns:
+        - List[Node]: The nodes from the root down; the last one holds the
+          text, if it is stored.
+        """
+        node = self.root
+        nodes = [node]
+        depth = 0
+        while node.children is not None and depth < len(text):
+            child = node.children.get(text[depth])
+            if child is None:
+                if not create:
+                    break
+                child = node.children[text[depth]] = Node()
+            node = child
+            nodes.append(node)
+            depth += 1
+        return nodes
+
+    def add(self, entry):
+        """
+        Adds a book's title and author.
+
+        Parameters:
+        - entry (tuple): The book's (book, title, author) entry.
+        """
+        for field in (TITLE, AUTHOR):
+            text = entry[field]
+            if not text:
+                continue
+            nodes = self.path(text)
+            nodes[-1].held[field].append(entry)
+            for node in nodes:
+                if node.children is not None:
+                    self.offer(node, entry)
+            if nodes[-1].children is None and len(nodes[-1]) > LEAF_SIZE:
+                self.split(nodes[-1], len(nodes) - 1)
+
+    def split(self, node, depth):
+        """
+        Turns a leaf into an inner node with a leaf per next character,
+        splitting those that are still too big in turn.
+
+        Parameters:
+        - node (Node): The leaf.
+        - depth (int): The length of the leaf's prefix.
+        """
+        held = node.held
+        node.children = {}
+        node.held = [None, [], []]
+        for field in (TITLE, AUTHOR):
+            for entry in held[field]:
+                text = entry[field]
+                if len(text) == depth:
+                    node.held[field].append(entry)
+                    continue
+                child = node.children.get(text[depth])
+                if child is None:
+                    child = node.children[text[depth]] = Node()
+                child.held[field].append(entry)
+        for child in node.children.values():
+            if len(child) > LEAF_SIZE:
+                self.split(child, depth + 1)
+        self.refresh(node)
+
+    def offer(self, node, entry):
+        """
+        Puts an entry among the best of an inner node, if it is good enough.
+
+        Parameters:
+        - node (Node): The inner node.
+        - entry (tuple): The (book, title, author) entry.
+        """
+        top = node.top
+        if any(kept[0] is entry[0] for kept in top):
+            top.sort(key=self.rank)
+        elif len(top) < MAX_COMPLETIONS or self.rank(entry) < self.rank(top[-1]):
+            top.append(entry)
+            top.sort(key=self.rank)
+            del top[MAX_COMPLETIONS:]
+
+    def remove(self, entry):
+        """
+        Removes a book's title and author.
+
+        Parameters:
+        - entry (tuple): The book's (book, title, author) entry.
+        """
+        for field in (TITLE, AUTHOR):
+            text = entry[field]
+            if not text:
+                continue
+            nodes = self.path(text, create=False)
+            held = nodes[-1].held[field]
+            for i, kept in enumerate(held):
+                if kept[0] is entry[0]:
+                    del held[i]
+                    break
+            # Deepest first, so each node is worked out from up-to-date children.
+            for node in reversed(nodes):
+                if node.children is not None and any(kept[0] is entry[0] for kept in node.top):
+                    self.refresh(node)
+
+    def update(self, entry):
+        """
+        Moves a book up the completions after its loan count went up.
+
+        Parameters:
+        - entry (tuple): The book's (book, title, author) entry.
+        """
+        for field in (TITLE, AUTHOR):
+            if entry[field]:
+                for node in self.path(entry[field], create=False):
+                    if node.children is not None:
+                        self.offer(node, entry)
+
+    def complete(self, prefix, limit=MAX_COMPLETIONS):
+        """
+        Finds the most borrowed books whose title or author starts with a prefix.
+
+        Parameters:
+        - prefix (str): The prefix, as typed; case and repeated spaces are
+          ignored, but a trailing space means the word is complete.
+        - limit (int): The largest number of books, at most MAX_COMPLETIONS.
+
+        Returns:
+        - List[tuple]: The (book, title, author) entries, most borrowed first.
+        """
+        text = normalize(prefix)
+        if text and prefix[-1:].isspace():
+            text += ' '
+        node = self.root
+        depth = 0
+        while node.children is not None and depth < len(text):
+            node = node.children.get(text[depth])
+            if node is None:
+                return []
+            depth += 1
+        if node.children is not None:
+            return node.top[:limit]
+        matches = [entry for field in (TITLE, AUTHOR) for entry in node.held[field] if entry[field].startswith(text)]
+        return self.best(matches)[:limit]
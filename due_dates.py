@@ -0,0 +1,149 @@
+import itertools
+from bisect import bisect_left, insort
+
+# The number of loans a bucket of a DueDateIndex holds after a split;
+# buckets split in two once they hold twice as many.
+BUCKET_SIZE = 1000
+
+class DueDateIndex:
+    """
+    Represents the active loans sorted by due date.
+
+    The loans are kept as a sorted list cut into buckets of about
+    BUCKET_SIZE loans, with the last loan of each bucket in a separate
+    list. A query finds the first loan due at or after its start by binary
+    search, first over the buckets' last loans and then within one bucket,
+    and walks forward from there until a loan is due after its end, so it
+    only visits the loans it returns. Adding or removing a loan only
+    shifts the loans of one bucket.
+
+    Loans due on the same date are kept in the order they were added. Due
+    dates can be any comparable values (datetime or date), as long as one
+    index does not mix them.
+    """
+
+    def __init__(self, loans=()):
+        """
+        Initializes a new DueDateIndex object.
+
+        Parameters:
+        - loans (Iterable[Tuple[object, datetime]]): The (book, due date) pairs to index.
+        """
+        self.counter = itertools.count()
+        self.entries = {}
+        items = []
+        for book, due in loans:
+            if due:
+                entry = (due, next(self.counter), book)
+                self.entries[book] = entry
+                items.append(entry)
+        items.sort()
+        self.buckets = [items[i:i + BUCKET_SIZE] for i in range(0, len(items), BUCKET_SIZE)]
+        self.maxes = [bucket[-1] for bucket in self.buckets]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def set(self, book, due):
+        """
+        Records or moves the due date of a loan.
+
+        Parameters:
+        - book (object): The book on loan.
+        - due (datetime or None): The due date; None (or any false value) removes the loan.
+        """
+        self.remove(book)
+        if not due:
+            return
+        entry = (due, next(self.counter), book)
+        self.entries[book] = entry
+        if not self.buckets:
+            self.buckets.append([entry])
+            self.maxes.append(entry)
+            return
+        # Entries never tie, as each has its own counter value, so the
+        # books themselves are never compared.
+        index = min(bisect_left(self.maxes, entry), len(self.buckets) - 1)
+        bucket = self.buckets[index]
+        insort(bucket, entry)
+        self.maxes[index] = bucket[-1]
+        if len(bucket) > 2 * BUCKET_SIZE:
+            self.buckets[index:index + 1] = [bucket[:BUCKET_SIZE], bucket[BUCKET_SIZE:]]
+            self.maxes[index:index + 1] = [bucket[BUCKET_SIZE - 1], bucket[-1]]
+
+    def remove(self, book):
+        """
+        Removes a loan, if the book has one.
+
+        Parameters:
+        - book (object): The book that was returned or deleted.
+        """
+        entry = self.entries.pop(book, None)
+        if entry is None:
+            return
+        index = bisect_left(self.maxes, entry)
+        bucket = self.buckets[index]
+        del bucket[bisect_left(bucket, entry)]
+        if bucket:
+            self.maxes[index] = bucket[-1]
+        else:
+            del self.buckets[index]
+            del self.maxes[index]
+
+    def due_before(self, cutoff, inclusive=False, start=None):
+        """
+        Finds the loans due before a cutoff.
+
+        Parameters:
+        - cutoff (datetime): The cutoff.
+        - inclusive (bool): Include loans due exactly at the cutoff.
+        - start (datetime or None): Only include loans due at or after this.
+
+        Returns:
+        - List[Tuple[datetime, object]]: The (due date, book) pairs, earliest first.
+        """
+        found = []
+        if not self.buckets:
+            return found
+        if start is None:
+            index = position = 0
+        else:
+            # (start,) sorts before every entry due at start.
+            index = bisect_left(self.maxes, (start,))
+            position = bisect_left(self.buckets[index], (start,)) if index < len(self.buckets) else 0
+        while index < len(self.buckets):
+            bucket = self.buckets[index]
+            while position < len(bucket):
+                due, _, book = bucket[position]
+                if due > cutoff or (due == cutoff and not inclusive):
+                    return found
+                found.append((due, book))
+                position += 1
+            index += 1
+            position = 0
+        return found
+
+    def overdue(self, as_of):
+        """
+        Finds the loans that are overdue.
+
+        Parameters:
+        - as_of (datetime): The time to check against.
+
+        Returns:
+        - List[Tuple[datetime, object]]: The (due date, book) pairs due before as_of, earliest first.
+        """
+        return self.due_before(as_of)
+
+    def due_between(self, start, end):
+        """
+        Finds the loans that fall due in a period.
+
+        Parameters:
+        - start (datetime): The start of the period.
+        - end (datetime): The end of the period, inclusive.
+
+        Returns:
+        - List[Tuple[datetime, object]]: The (due date, book) pairs, earliest first.
+        """
+        return self.due_before(end, inclusive=True, start=start)
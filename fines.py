@@ -0,0 +1,428 @@
+from array import array
+from itertools import compress
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class FineRule:
+    """
+    Represents how overdue loans are fined for one type of member. Amounts
+    are in cents, so they add up exactly.
+
+    Attributes:
+    - grace_days (int): The days a loan can be late without a fine; only
+      the days after them are charged.
+    - daily_rate (int): The fine per day charged.
+    - cap (int): The most a single loan can be fined.
+    """
+    __slots__ = ('grace_days', 'daily_rate', 'cap')
+
+    def __init__(self, grace_days, daily_rate, cap):
+        """
+        Initializes a new FineRule object.
+
+        Parameters:
+        - grace_days (int): The days a loan can be late without a fine.
+        - daily_rate (int): The fine per day charged, in cents.
+        - cap (int): The most a single loan can be fined, in cents.
+        """
+        self.grace_days = grace_days
+        self.daily_rate = daily_rate
+        self.cap = cap
+
+    def fine(self, days_late):
+        """
+        Works out the fine of a loan.
+
+        Parameters:
+        - days_late (int): The days since the loan was due; zero or less if it is not overdue.
+
+        Returns:
+        - int: The fine, in cents.
+        """
+        return max(0, min((days_late - self.grace_days) * self.daily_rate, self.cap))
+
+# The fine rules by member type (User.user_type).
+FINE_RULES = {
+    'user': FineRule(grace_days=2, daily_rate=25, cap=1000),
+    'admin': FineRule(grace_days=7, daily_rate=10, cap=500),
+}
+
+# The member type whose rule applies to loans of unknown borrowers, such as
+# those loaded from the book file, which does not record who has a book.
+DEFAULT_MEMBER_TYPE = 'user'
+
+# The due date of an empty slot: far enough ahead that it is never fined.
+NEVER = 2 ** 40
+
+def format_cents(cents):
+    """
+    Formats an amount of money for people to read.
+
+    Parameters:
+    - cents (int): The amount, in cents.
+
+    Returns:
+    - str: The amount, e.g. '12.50'.
+    """
+    return f"{cents / 100:.2f}"
+
+class FineEngine:
+    """
+    Represents the overdue fines of a library: the fines accruing on the
+    books on loan, and the balances members owe for books they returned late.
+
+    Active loans are kept as parallel arrays of integers, one slot per
+    loan: the due date as a day ordinal, the member type and the borrower.
+    The nightly assess() works out the fine of every loan in one pass over
+    the arrays; with NumPy it runs as a handful of whole-array operations
+    on the same memory, without copying it, and otherwise as one loop over
+    the arrays. Between runs, lending, renewing and returning a book only
+    update its own slot and the totals, so they stay right without a new
+    pass. A returned book's slot is reused by the next loan.
+
+    Returning a book charges the fine accrued up to the return to its
+    borrower's balance; loans of unknown borrowers are fined at the
+    DEFAULT_MEMBER_TYPE rule but not charged to anyone.
+
+    It is not thread-safe; a Library uses it under its catalogue lock.
+
+    Attributes:
+    - rules (dict): The FineRule of each member type.
+    - balances (dict): The fines owed for returned books, in cents, by user name.
+    - accrued (dict): The fines accruing on each member's books on loan, in
+      cents, by user name, as of the last assessment.
+    - total (int): The fines accruing on all books on loan, as of the last assessment.
+    - overdue (int): The number of loans with a fine, as of the last assessment.
+    - assessed_on (int or None): The day ordinal of the last assessment, or None before the first.
+    """
+
+    def __init__(self, rules=None, loans=()):
+        """
+        Initializes a new FineEngine object.
+
+        Parameters:
+        - rules (dict or None): The FineRule of each member type (default FINE_RULES).
+        - loans (Iterable[Tuple[str, date]]): The (book ID, due date) of the
+          books already on loan, whose borrowers are not known.
+        """
+        self.rules = rules or FINE_RULES
+        self.types = list(self.rules)
+        self.type_index = {member_type: i for i, member_type in enumerate(self.types)}
+        self.default_type = self.type_index.get(DEFAULT_MEMBER_TYPE, 0)
+        self.book_ids = []
+        self.slot_of = {}
+        self.due = array('q')
+        self.kinds = array('b')
+        self.borrowers = array('q')
+        self.fines = array('q')
+        # Borrower 0 stands for an unknown borrower.
+        self.names = [None]
+        self.name_index = {}
+        self.free = []
+        self.balances = {}
+        self.accrued = {}
+        self.total = 0
+        self.overdue = 0
+        self.assessed_on = None
+        for book_id, due in loans:
+            self.slot_of[book_id] = len(self.book_ids)
+            self.book_ids.append(book_id)
+            self.due.append(due.toordinal())
+        count = len(self.book_ids)
+        self.kinds.extend([self.default_type] * count)
+        self.borrowers.extend([0] * count)
+        self.fines.extend([0] * count)
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def rule(self, kind):
+        """
+        Gets the fine rule of a member type index.
+
+        Parameters:
+        - kind (int): The index of the member type.
+
+        Returns:
+        - FineRule: The rule.
+        """
+        return self.rules[self.types[kind]]
+
+    def borrower_index(self, user_name):
+        """
+        Gets the number standing for a borrower in the borrowers array.
+
+        Parameters:
+        - user_name (str or None): The borrower, or None if unknown.
+
+        Returns:
+        - int: The number.
+        """
+        if user_name is None:
+            return 0
+        index = self.name_index.get(user_name)
+        if index is None:
+            index = self.name_index[user_name] = len(self.names)
+            self.names.append(user_name)
+        return index
+
+    def slot_fine(self, slot, day):
+        """
+        Works out the fine of a loan on a given day.
+
+        Parameters:
+        - slot (int): The loan's slot.
+        - day (int): The day ordinal.
+
+        Returns:
+        - int: The fine, in cents.
+        """
+        return self.rule(self.kinds[slot]).fine(day - self.due[slot])
+
+    def reassess(self, slot, fine):
+        """
+        Replaces the fine of a slot as of the last assessment, keeping the totals right.
+
+        Parameters:
+        - slot (int): The slot.
+        - fine (int): The new fine, in cents.
+        """
+        old = self.fines[slot]
+        if old == fine:
+            return
+        self.fines[slot] = fine
+        self.total += fine - old
+        self.overdue += (fine > 0) - (old > 0)
+        user_name = self.names[self.borrowers[slot]]
+        if user_name is not None:
+            accrued = self.accrued.get(user_name, 0) + fine - old
+            if accrued:
+                self.accrued[user_name] = accrued
+            else:
+                self.accrued.pop(user_name, None)
+
+    def lend(self, book_id, due, user_name=None, member_type=DEFAULT_MEMBER_TYPE):
+        """
+        Starts fining a loan, or replaces the loan of a book already on loan.
+
+        Parameters:
+        - book_id (str): The ISBN of the book.
+        - due (date): The due date.
+        - user_name (str or None): The borrower, or None if unknown.
+        - member_type (str): The borrower's member type; unknown types get
+          the DEFAULT_MEMBER_TYPE rule.
+        """
+        slot = self.slot_of.get(book_id)
+        if slot is None:
+            if self.free:
+                slot = self.free.pop()
+                self.book_ids[slot] = book_id
+            else:
+                slot = len(self.book_ids)
+                self.book_ids.append(book_id)
+                self.due.append(NEVER)
+                self.kinds.append(self.default_type)
+                self.borrowers.append(0)
+                self.fines.append(0)
+            self.slot_of[book_id] = slot
+        else:
+            self.reassess(slot, 0)
+        self.due[slot] = due.toordinal()
+        self.kinds[slot] = self.type_index.get(member_type, self.default_type)
+        self.borrowers[slot] = self.borrower_index(user_name)
+        if self.assessed_on is not None:
+            self.reassess(slot, self.slot_fine(slot, self.assessed_on))
+
+    def renew(self, book_id, due):
+        """
+        Moves the due date of a loan.
+
+        Parameters:
+        - book_id (str): The ISBN of the book.
+        - due (date): The new due date.
+
+        Returns:
+        - bool: True if the book is on loan.
+        """
+        slot = self.slot_of.get(book_id)
+        if slot is None:
+            return False
+        self.due[slot] = due.toordinal()
+        if self.assessed_on is not None:
+            self.reassess(slot, self.slot_fine(slot, self.assessed_on))
+        return True
+
+    def settle(self, book_id, day):
+        """
+        Stops fining a returned book and charges its fine to the borrower.
+
+        Parameters:
+        - book_id (str): The ISBN of the book.
+        - day (int): The day ordinal of the return.
+
+        Returns:
+        - Tuple[str or None, int]: The borrower (None if unknown) and the
+          fine charged, in cents; (None, 0) if the book was not on loan.
+        """
+        slot = self.slot_of.get(book_id)
+        if slot is None:
+            return None, 0
+        fine = self.slot_fine(slot, day)
+        user_name = self.names[self.borrowers[slot]]
+        self.release(slot)
+        if user_name is not None and fine:
+            self.balances[user_name] = self.balances.get(user_name, 0) + fine
+        return user_name, fine
+
+    def forget(self, book_id):
+        """
+        Stops fining a loan without charging anyone, e.g. for a deleted book.
+
+        Parameters:
+        - book_id (str): The ISBN of the book.
+        """
+        slot = self.slot_of.get(book_id)
+        if slot is not None:
+            self.release(slot)
+
+    def release(self, slot):
+        """
+        Empties a slot for the next loan.
+
+        Parameters:
+        - slot (int): The slot.
+        """
+        self.reassess(slot, 0)
+        del self.slot_of[self.book_ids[slot]]
+        self.book_ids[slot] = None
+        self.due[slot] = NEVER
+        self.kinds[slot] = self.default_type
+        self.borrowers[slot] = 0
+        self.free.append(slot)
+
+    def borrower_of(self, book_id):
+        """
+        Gets the borrower of a book on loan.
+
+        Parameters:
+        - book_id (str): The ISBN of the book.
+
+        Returns:
+        - str or None: The borrower, or None if the book is not on loan or its borrower is unknown.
+        """
+        slot = self.slot_of.get(book_id)
+        return None if slot is None else self.names[self.borrowers[slot]]
+
+    def borrowed(self):
+        """
+        Lists the loans whose borrowers are known.
+
+        Returns:
+        - List[Tuple[str, str, str]]: The (book ID, borrower, member type) of each.
+        """
+        return [(book_id, self.names[self.borrowers[slot]], self.types[self.kinds[slot]])
+                for book_id, slot in self.slot_of.items() if self.borrowers[slot]]
+
+    def fine_of(self, book_id, day):
+        """
+        Works out the fine of a book on loan on a given day.
+
+        Parameters:
+        - book_id (str): The ISBN of the book.
+        - day (int): The day ordinal.
+
+        Returns:
+        - int: The fine, in cents; 0 if the book is not on loan.
+        """
+        slot = self.slot_of.get(book_id)
+        return 0 if slot is None else self.slot_fine(slot, day)
+
+    def assess(self, day):
+        """
+        Works out the fine of every loan on a given day, in one pass, and
+        the totals by borrower.
+
+        Parameters:
+        - day (int): The day ordinal.
+
+        Returns:
+        - dict: The number of loans, the number overdue (with a fine) and
+          the total of their fines, in cents.
+        """
+        if numpy is not None and self.due:
+            self.assess_arrays(day)
+        else:
+            self.assess_loop(day)
+        self.assessed_on = day
+        return {'loans': len(self.slot_of), 'overdue': self.overdue, 'total': self.total}
+
+    def assess_arrays(self, day):
+        """
+        Does assess() with NumPy, reading the slot arrays in place.
+
+        Parameters:
+        - day (int): The day ordinal.
+        """
+        kinds = numpy.frombuffer(self.kinds, dtype=numpy.int8)
+        grace = numpy.array([self.rule(kind).grace_days for kind in range(len(self.types))], dtype=numpy.int64)
+        rate = numpy.array([self.rule(kind).daily_rate for kind in range(len(self.types))], dtype=numpy.int64)
+        cap = numpy.array([self.rule(kind).cap for kind in range(len(self.types))], dtype=numpy.int64)
+        charged = day - numpy.frombuffer(self.due, dtype=numpy.int64) - grace[kinds]
+        fines = numpy.clip(charged * rate[kinds], 0, cap[kinds])
+        borrowers = numpy.frombuffer(self.borrowers, dtype=numpy.int64)
+        by_borrower = numpy.bincount(borrowers, weights=fines, minlength=len(self.names))
+        self.fines = array('q', fines.tobytes())
+        self.total = int(fines.sum())
+        self.overdue = int(numpy.count_nonzero(fines))
+        owing = numpy.flatnonzero(by_borrower[1:]) + 1
+        self.accrued = {self.names[index]: int(by_borrower[index]) for index in owing.tolist()}
+
+    def assess_loop(self, day):
+        """
+        Does assess() in plain Python, in one pass over the slot arrays.
+
+        Parameters:
+        - day (int): The day ordinal.
+        """
+        # The last due date of each member type that is not yet fined, and its rate and cap.
+        rules = [self.rule(kind) for kind in range(len(self.types))]
+        last = [day - rule.grace_days for rule in rules]
+        rate = [rule.daily_rate for rule in rules]
+        cap = [rule.cap for rule in rules]
+        fines = [min((last[kind] - due) * rate[kind], cap[kind]) if due < last[kind] else 0
+                 for due, kind in zip(self.due, self.kinds)]
+        # Adding up by borrower number is much faster than by name.
+        by_borrower = [0] * len(self.names)
+        for borrower, fine in compress(zip(self.borrowers, fines), fines):
+            by_borrower[borrower] += fine
+        self.fines = array('q', fines)
+        self.total = sum(fines)
+        self.overdue = len(fines) - fines.count(0)
+        self.accrued = {self.names[borrower]: fine for borrower, fine in enumerate(by_borrower) if fine and borrower}
+
+    def pay(self, user_name, amount):
+        """
+        Pays off some of a member's balance.
+
+        Parameters:
+        - user_name (str): The member.
+        - amount (int): The amount paid, in cents; anything over the balance is not taken.
+
+        Returns:
+        - Tuple[int, int]: The amount taken and the balance left, in cents.
+
+        Raises:
+        - ValueError: If the amount is not positive.
+        """
+        if amount <= 0:
+            raise ValueError("The amount paid must be positive")
+        balance = self.balances.get(user_name, 0)
+        paid = min(amount, balance)
+        if balance - paid:
+            self.balances[user_name] = balance - paid
+        else:
+            self.balances.pop(user_name, None)
+        return paid, balance - paid
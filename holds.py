@@ -0,0 +1,298 @@
+from collections import deque
+
+class FenwickTree:
+    """
+    Represents a Fenwick (binary indexed) tree over a list of counts that
+    can grow at the end. Changing a count, appending one and summing the
+    counts before a position all cost O(log n).
+    """
+
+    def __init__(self, counts=()):
+        """
+        Initializes a new FenwickTree object, in O(n).
+
+        Parameters:
+        - counts (Iterable[int]): The counts to start with.
+        """
+        # tree[i] holds the sum of the counts at positions i - (i & -i) to
+        # i - 1; tree[0] is unused.
+        self.tree = [0]
+        self.tree.extend(counts)
+        for i in range(1, len(self.tree)):
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def append(self, count):
+        """
+        Adds a count at the end.
+
+        Parameters:
+        - count (int): The count.
+        """
+        i = len(self.tree)
+        # The new node also covers the counts just before it, which are
+        # already in the tree.
+        self.tree.append(count + self.prefix_sum(i - 1) - self.prefix_sum(i - (i & -i)))
+
+    def add(self, position, amount):
+        """
+        Adds to one count.
+
+        Parameters:
+        - position (int): The position of the count, from 0.
+        - amount (int): The amount to add; negative to subtract.
+        """
+        i = position + 1
+        while i < len(self.tree):
+            self.tree[i] += amount
+            i += i & -i
+
+    def prefix_sum(self, end):
+        """
+        Adds up the counts before a position.
+
+        Parameters:
+        - end (int): The position to stop before.
+
+        Returns:
+        - int: The sum of the counts at positions 0 to end - 1.
+        """
+        total = 0
+        while end > 0:
+            total += self.tree[end]
+            end -= end & -end
+        return total
+
+class HoldQueue:
+    """
+    Represents the patrons waiting for one book, first come, first served.
+
+    Each patron who joins is given the next ticket number. The queue is a
+    deque of (ticket, patron) pairs, and a dict maps each waiting patron to
+    their ticket, so promoting the next patron and checking whether someone
+    is waiting are O(1), amortized, however long the queue is. A patron who
+    leaves is dropped from the dict straight away and from the deque once
+    they reach the front, where entries whose ticket is no longer the
+    patron's are skipped.
+
+    A FenwickTree over the tickets counts 1 for each patron still waiting,
+    so a patron's position is the number of waiting tickets up to theirs,
+    found in O(log n) however many patrons left ahead of them; joining and
+    leaving update it in O(log n) too. The tree starts at the ticket of
+    the oldest entry in the deque, and is rebuilt from the deque once the
+    tickets before the front take up half of it, so it stays in proportion
+    to the queue.
+
+    Attributes:
+    - tickets (dict): The ticket of each waiting patron.
+    """
+
+    def __init__(self, patrons=()):
+        """
+        Initializes a new HoldQueue object.
+
+        Parameters:
+        - patrons (Iterable[str]): The patrons already waiting, first in line first.
+        """
+        self.waiting = deque()
+        self.tickets = {}
+        self.next_ticket = 0
+        # The ticket counted at the first position of the tree.
+        self.base = 0
+        self.counts = FenwickTree()
+        for patron in patrons:
+            self.join(patron)
+
+    def __len__(self):
+        return len(self.tickets)
+
+    def __contains__(self, patron):
+        return patron in self.tickets
+
+    def __iter__(self):
+        """
+        Yields the waiting patrons, first in line first.
+
+        Returns:
+        - Iterator[str]: The patrons.
+        """
+        return (patron for ticket, patron in self.waiting if self.tickets.get(patron) == ticket)
+
+    def join(self, patron):
+        """
+        Adds a patron to the back of the queue. A patron already waiting
+        keeps their place.
+
+        Parameters:
+        - patron (str): The patron.
+
+        Returns:
+        - int: The patron's position, 1 for the front of the queue.
+        """
+        if patron in self.tickets:
+            return self.position(patron)
+        ticket = self.next_ticket
+        self.next_ticket += 1
+        self.waiting.append((ticket, patron))
+        self.tickets[patron] = ticket
+        self.counts.append(1)
+        return len(self.tickets)
+
+    def position(self, patron):
+        """
+        Gets a patron's place in the queue.
+
+        Parameters:
+        - patron (str): The patron.
+
+        Returns:
+        - int or None: The position, 1 for the front of the queue, or None if the patron is not waiting.
+        """
+        ticket = self.tickets.get(patron)
+        if ticket is None:
+            return None
+        return self.counts.prefix_sum(ticket - self.base + 1)
+
+    def cancel(self, patron):
+        """
+        Takes a patron out of the queue.
+
+        Parameters:
+        - patron (str): The patron.
+
+        Returns:
+        - bool: True if the patron was waiting.
+        """
+        ticket = self.tickets.pop(patron, None)
+        if ticket is None:
+            return False
+        self.counts.add(ticket - self.base, -1)
+        self.prune()
+        return True
+
+    def pop(self):
+        """
+        Takes the patron at the front of the queue.
+
+        Returns:
+        - str or None: The patron, or None if nobody is waiting.
+        """
+        if not self.waiting:
+            return None
+        ticket, patron = self.waiting.popleft()
+        del self.tickets[patron]
+        self.counts.add(ticket - self.base, -1)
+        self.prune()
+        return patron
+
+    def prune(self):
+        """
+        Drops patrons who left from the front of the queue, so the front
+        entry is always a waiting patron, and rebuilds the tree once most
+        of it is behind the front.
+        """
+        while self.waiting and self.tickets.get(self.waiting[0][1]) != self.waiting[0][0]:
+            self.waiting.popleft()
+        front = self.waiting[0][0] if self.waiting else self.next_ticket
+        if 2 * (front - self.base) >= len(self.counts):
+            counts = [0] * (self.next_ticket - front)
+            for ticket, patron in self.waiting:
+                if self.tickets.get(patron) == ticket:
+                    counts[ticket - front] = 1
+            self.base = front
+            self.counts = FenwickTree(counts)
+
+class TimerWheel:
+    """
+    Represents a hashed timer wheel, for deadlines counted in whole ticks
+    (e.g. days as date ordinals).
+
+    A deadline is filed in the slot for its tick, modulo the number of
+    slots. Advancing the clock only visits the slots for the ticks that
+    passed, so expiring deadlines costs time in proportion to the deadlines
+    due, not to all those pending. Deadlines more than a full turn away
+    simply stay in their slot until their turn comes round.
+
+    Attributes:
+    - now (int): The last tick the wheel was advanced to.
+    """
+
+    def __init__(self, now, slots=64):
+        """
+        Initializes a new TimerWheel object.
+
+        Parameters:
+        - now (int): The current tick.
+        - slots (int): The number of slots.
+        """
+        self.now = now
+        self.slots = [[] for _ in range(slots)]
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def schedule(self, deadline, item):
+        """
+        Files an item to expire at a deadline. A deadline already passed
+        expires on the next advance.
+
+        Parameters:
+        - deadline (int): The tick at which the item expires.
+        - item (object): The item.
+        """
+        deadline = max(deadline, self.now + 1)
+        self.slots[deadline % len(self.slots)].append((deadline, item))
+        self.count += 1
+
+    def cancel(self, deadline, item):
+        """
+        Takes back an item that has not expired yet.
+
+        Parameters:
+        - deadline (int): The deadline the item was filed with.
+        - item (object): The item.
+
+        Returns:
+        - bool: True if the item was pending.
+        """
+        # schedule() moved deadlines already passed to the next tick, which
+        # for a pending item is still the tick after now.
+        deadline = max(deadline, self.now + 1)
+        try:
+            self.slots[deadline % len(self.slots)].remove((deadline, item))
+        except ValueError:
+            return False
+        self.count -= 1
+        return True
+
+    def advance(self, now):
+        """
+        Moves the clock forward and takes the items whose deadline has come.
+
+        Parameters:
+        - now (int): The current tick.
+
+        Returns:
+        - List[object]: The expired items, in no particular order.
+        """
+        if now <= self.now:
+            return []
+        if now - self.now >= len(self.slots):
+            ticks = range(len(self.slots))
+        else:
+            ticks = range(self.now + 1, now + 1)
+        expired = []
+        for tick in ticks:
+            slot = tick % len(self.slots)
+            entries = self.slots[slot]
+            if entries:
+                self.slots[slot] = [entry for entry in entries if entry[0] > now]
+                expired.extend(item for deadline, item in entries if deadline <= now)
+        self.count -= len(expired)
+        self.now = now
+        return expired
@@ -0,0 +1,251 @@
+from datetime import date, timedelta
+
+# The states a book can be in, as counted by Inventory.
+AVAILABLE = 'available'
+RESERVED = 'reserved'
+ON_LOAN = 'on_loan'
+
+def book_state(book):
+    """
+    Gets the state of a new.Book.
+
+    Parameters:
+    - book (Book): The book.
+
+    Returns:
+    - str: ON_LOAN if it is out, RESERVED if it is on the shelf but kept for
+      someone, otherwise AVAILABLE (what Book.availability_status() calls
+      "Available").
+    """
+    if not book.availability:
+        return ON_LOAN
+    return RESERVED if book.reserved else AVAILABLE
+
+class Counts:
+    """
+    Represents the inventory counters of the whole library or one author.
+
+    Attributes:
+    - total (int): The number of books.
+    - available (int): The books on the shelf and free to borrow.
+    - reserved (int): The books on the shelf but kept for someone.
+    - on_loan (int): The books out on loan.
+    - overdue (int): The books on loan past their due date.
+    """
+    __slots__ = ('total', AVAILABLE, RESERVED, ON_LOAN, 'overdue')
+
+    def __init__(self):
+        """
+        Initializes a new Counts object with every counter at zero.
+        """
+        self.total = 0
+        self.available = 0
+        self.reserved = 0
+        self.on_loan = 0
+        self.overdue = 0
+
+    def as_dict(self):
+        """
+        Gets the counters.
+
+        Returns:
+        - dict: The counters, by name.
+        """
+        return {field: getattr(self, field) for field in self.__slots__}
+
+class Inventory:
+    """
+    Represents counters of the books in each state, in total and per author,
+    kept up to date as books change instead of being recounted.
+
+    The state each book was last counted in is remembered, so a change is
+    counted by moving the book from its old state to its new one. Books on
+    loan are also counted per due date; the overdue counters cover the
+    loans due before a cutoff date, which is moved to the date asked about
+    one day at a time, so keeping them current costs one step per day
+    passed (or per distinct due date, if fewer), not a pass over the loans.
+
+    Attributes:
+    - totals (Counts): The counters for the whole library.
+    - authors (dict): The Counts of each author.
+    - cutoff (date or None): The date the overdue counters are correct for.
+    """
+
+    def __init__(self, books=()):
+        """
+        Initializes a new Inventory object.
+
+        Parameters:
+        - books (Iterable[Book]): The books to count.
+        """
+        self.totals = Counts()
+        self.authors = {}
+        self.counted = {}
+        self.due = {}
+        self.cutoff = None
+        for book in books:
+            self.add(book)
+
+    def add(self, book):
+        """
+        Counts a new book.
+
+        Parameters:
+        - book (Book): The book.
+        """
+        entry = (book_state(book), book.book_author, book.due_return or None)
+        self.counted[book] = entry
+        self.count(entry, 1)
+
+    def remove(self, book):
+        """
+        Stops counting a book, if it is counted.
+
+        Parameters:
+        - book (Book): The book.
+        """
+        entry = self.counted.pop(book, None)
+        if entry:
+            self.count(entry, -1)
+
+    def update(self, book):
+        """
+        Moves a book to the counters for its current state, author and due date.
+
+        Parameters:
+        - book (Book): The book that changed.
+        """
+        entry = (book_state(book), book.book_author, book.due_return or None)
+        old = self.counted.get(book)
+        if old == entry:
+            return
+        if old:
+            self.count(old, -1)
+        self.counted[book] = entry
+        self.count(entry, 1)
+
+    def count(self, entry, step):
+        """
+        Adds to or takes from the counters of a book.
+
+        Parameters:
+        - entry (Tuple[str, str, date or None]): The book's state, author and due date.
+        - step (int): 1 to count the book, -1 to uncount it.
+        """
+        state, author, due = entry
+        counts = self.authors.get(author)
+        if counts is None:
+            counts = self.authors[author] = Counts()
+        for target in (self.totals, counts):
+            target.total += step
+            setattr(target, state, getattr(target, state) + step)
+        if state == ON_LOAN and due:
+            by_author = self.due.setdefault(due, {})
+            by_author[author] = by_author.get(author, 0) + step
+            if not by_author[author]:
+                del by_author[author]
+                if not by_author:
+                    del self.due[due]
+            if self.cutoff is not None and due < self.cutoff:
+                self.totals.overdue += step
+                counts.overdue += step
+        if not counts.total:
+            del self.authors[author]
+
+    def move_cutoff(self, as_of):
+        """
+        Brings the overdue counters to a date.
+
+        Parameters:
+        - as_of (date): The date; loans due before it are overdue.
+        """
+        if self.cutoff is None:
+            self.cutoff = date.min
+            self.step_days(self.cutoff, as_of, 1)
+        elif as_of > self.cutoff:
+            self.step_days(self.cutoff, as_of, 1)
+        elif as_of < self.cutoff:
+            self.step_days(as_of, self.cutoff, -1)
+        self.cutoff = as_of
+
+    def step_days(self, start, end, step):
+        """
+        Adds to or takes from the overdue counters the loans due in a period.
+
+        Parameters:
+        - start (date): The first due date of the period.
+        - end (date): The day after the period.
+        - step (int): 1 to count the loans as overdue, -1 to uncount them.
+        """
+        if (end - start).days <= len(self.due):
+            days = (start + timedelta(days=offset) for offset in range((end - start).days))
+        else:
+            days = [due for due in self.due if start <= due < end]
+        for day in days:
+            for author, count in self.due.get(day, {}).items():
+                self.totals.overdue += step * count
+                self.authors[author].overdue += step * count
+
+    def counts(self, author=None, as_of=None):
+        """
+        Gets the counters for the whole library or one author.
+
+        Parameters:
+        - author (str or None): The author, or None for the whole library.
+        - as_of (date): The date overdue loans are counted at (default today).
+
+        Returns:
+        - dict: The counters: total, available, reserved, on_loan and overdue.
+        """
+        self.move_cutoff(as_of or date.today())
+        if author is None:
+            return self.totals.as_dict()
+        counts = self.authors.get(author)
+        return counts.as_dict() if counts else Counts().as_dict()
+
+    def by_author(self, as_of=None):
+        """
+        Gets the counters of every author.
+
+        Parameters:
+        - as_of (date): The date overdue loans are counted at (default today).
+
+        Returns:
+        - dict: The counters of each author, by author.
+        """
+        self.move_cutoff(as_of or date.today())
+        return {author: counts.as_dict() for author, counts in self.authors.items()}
+
+    def verify(self, books, as_of=None):
+        """
+        Recounts the books from scratch and compares the result with the counters.
+
+        Parameters:
+        - books (Iterable[Book]): Every book in the library.
+        - as_of (date): The date overdue loans are counted at (default today).
+
+        Returns:
+        - List[str]: A description of each counter that differs; empty if all agree.
+        """
+        as_of = as_of or date.today()
+        expected = {}
+        for book in books:
+            state = book_state(book)
+            for key in (None, book.book_author):
+                counts = expected.setdefault(key, Counts())
+                counts.total += 1
+                setattr(counts, state, getattr(counts, state) + 1)
+                if state == ON_LOAN and book.due_return and book.due_return < as_of:
+                    counts.overdue += 1
+        expected.setdefault(None, Counts())
+        actual = {None: self.counts(as_of=as_of)}
+        actual.update(self.by_author(as_of))
+        problems = []
+        for key in expected.keys() | actual.keys():
+            wanted = expected[key].as_dict() if key in expected else Counts().as_dict()
+            found = actual.get(key, Counts().as_dict())
+            for field, value in wanted.items():
+                if found[field] != value:
+                    name = 'all books' if key is None else f'author {key!r}'
+                    problems.append(f"{name}: {field} is {found[field]}, recounted {value}")
+        return sorted(problems)
@@ -0,0 +1,280 @@
+import csv
+import io
+import os
+
+def read_rows(path):
+    """
+    Yields the rows of a CSV file one at a time.
+
+    Parameters:
+    - path (str): The CSV file. A missing file yields no rows.
+
+    Returns:
+    - Iterator[dict]: The rows, keyed by the header.
+    """
+    try:
+        file = open(path, 'r', newline='')
+    except FileNotFoundError:
+        return
+    with file:
+        yield from csv.DictReader(file)
+
+def replace_file(temp_file, path):
+    """
+    Moves a fully written temporary file over a file, so readers see either
+    the old or the new contents and never a partial file. The temporary file
+    must already be flushed and fsynced; the directory is fsynced too, where
+    the platform allows it, so the rename itself survives a crash.
+
+    Parameters:
+    - temp_file (str): The temporary file, in the same directory as path.
+    - path (str): The file to replace.
+    """
+    os.replace(temp_file, path)
+    try:
+        directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(directory)
+    except OSError:
+        pass
+    finally:
+        os.close(directory)
+
+class Journal:
+    """
+    Represents an append-only journal of changes to a CSV file.
+
+    The CSV file is treated as a snapshot. Every change is appended to a
+    journal file next to it as one small record, so the cost of a write does
+    not depend on the number of rows. Loading reads the snapshot and replays
+    the journal on top of it. Once the journal holds as many records as the
+    snapshot has rows (and at least compact_threshold), the owner is asked to
+    compact it into a fresh snapshot, which keeps writes amortised O(1).
+
+    Compaction switches to the new snapshot with a single rename: the new
+    snapshot is written next to the old one, and renaming the journal to
+    its .done name is the point where the new snapshot becomes current. A
+    crash before that rename leaves the old snapshot and journal in use; a
+    crash after it is finished off by the next Journal over the same file,
+    so the journal is never replayed onto the snapshot it was folded into.
+    A record cut off by a crash is dropped before the next one is appended.
+
+    Attributes:
+    - snapshot_file (str): The CSV snapshot file.
+    - journal_file (str): The journal file, stored next to the snapshot.
+    - fieldnames (List[str]): The CSV columns.
+    - key (str or Tuple[str]): The column(s) used to identify a row for updates and deletes.
+    - compact_threshold (int): The minimum journal size before compaction.
+    """
+
+    def __init__(self, snapshot_file, fieldnames, key, compact_threshold=1000):
+        """
+        Initializes a new Journal object.
+
+        Parameters:
+        - snapshot_file (str): The CSV snapshot file.
+        - fieldnames (List[str]): The CSV columns.
+        - key (str or Tuple[str]): The column(s) used to identify a row.
+        - compact_threshold (int): The minimum journal size before compaction.
+        """
+        self.snapshot_file = snapshot_file
+        self.journal_file = snapshot_file + '.journal'
+        self.new_snapshot_file = snapshot_file + '.new'
+        self.done_file = self.journal_file + '.done'
+        self.fieldnames = fieldnames
+        self.key = key
+        self.compact_threshold = compact_threshold
+        self.records = 0
+        self.snapshot_rows = 0
+        self._file = None
+        self.recover()
+
+    def recover(self):
+        """
+        Finishes or rolls back a compaction cut off by a crash.
+        """
+        if os.path.exists(self.done_file):
+            # The journal was folded into the new snapshot; install it if
+            # the crash came before that.
+            if os.path.exists(self.new_snapshot_file):
+                replace_file(self.new_snapshot_file, self.snapshot_file)
+            os.remove(self.done_file)
+        elif os.path.exists(self.new_snapshot_file):
+            # The journal still applies to the old snapshot.
+            os.remove(self.new_snapshot_file)
+
+    def load(self):
+        """
+        Reads the snapshot and replays the journal on top of it.
+
+        Returns:
+        - List[dict]: The current rows, in insertion order.
+        """
+        return list(self.iter_rows())
+
+    def iter_rows(self):
+        """
+        Yields the current rows without loading the snapshot into memory.
+
+        Only the journal and the snapshot rows it refers to are held in
+        memory. When the journal is not empty the snapshot is read twice:
+        once to find the rows the journal refers to, and once to yield them.
+
+        Returns:
+        - Iterator[dict]: The current rows, in insertion order.
+        """
+        records = self.read_records()
+        touched = {self.key_of(row) for op, row in records}
+
+        # The rows the journal refers to, by position. Rows appended by the
+        # journal go after the snapshot; deleted rows are set to None.
+        changed = {}
+        positions = {}
+        appended = 0
+        if touched:
+            for index, row in enumerate(read_rows(self.snapshot_file)):
+                if self.key_of(row) in touched:
+                    positions.setdefault(self.key_of(row), []).append(index)
+                    changed[index] = row
+                appended = index + 1
+        end = appended
+        for op, row in records:
+            key = self.key_of(row)
+            if op == 'add':
+                positions.setdefault(key, []).append(end)
+                changed[end] = row
+                end += 1
+            elif op == 'update' and positions.get(key):
+                changed[positions[key][0]] = row
+            elif op == 'delete' and positions.get(key):
+                changed[positions[key].pop(0)] = None
+
+        size = 0
+        for index, row in enumerate(read_rows(self.snapshot_file)):
+            row = changed.get(index, row)
+            if row is not None:
+                yield row
+            size = index + 1
+        self.snapshot_rows = size
+        for index in range(appended, end):
+            if changed.get(index) is not None:
+                yield changed[index]
+
+    def read_records(self):
+        """
+        Reads the journal records.
+
+        Returns:
+        - List[Tuple[str, dict]]: The (op, row) records, oldest first.
+        """
+        records = []
+        try:
+            with open(self.journal_file, 'r', newline='') as file:
+                text = file.read()
+        except FileNotFoundError:
+            text = ''
+        # A last line without its line ending is a write that was cut off
+        # by a crash, even if it happens to have every field.
+        text = text[:text.rfind('\n') + 1]
+        for record in csv.reader(io.StringIO(text, newline='')):
+            # So is a short record.
+            if len(record) == len(self.fieldnames) + 1:
+                records.append((record[0], dict(zip(self.fieldnames, record[1:]))))
+        self.records = len(records)
+        return records
+
+    def drop_partial_record(self):
+        """
+        Cuts a record left unfinished by a crash off the end of the journal,
+        so the next record starts on a line of its own.
+        """
+        try:
+            file = open(self.journal_file, 'rb+')
+        except FileNotFoundError:
+            return
+        with file:
+            end = file.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(0, position - 4096)
+                file.seek(start)
+                block = file.read(position - start)
+                newline = block.rfind(b'\n')
+                if newline >= 0:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position < end:
+                file.truncate(position)
+
+    def key_of(self, row):
+        """
+        Gets the key of a row.
+
+        Parameters:
+        - row (dict): The row.
+
+        Returns:
+        - str or tuple: The key column's value, or a tuple of the key columns' values.
+        """
+        if isinstance(self.key, str):
+            return row[self.key]
+        return tuple(row[field] for field in self.key)
+
+    def append(self, op, row):
+        """
+        Appends a change to the journal.
+
+        Parameters:
+        - op (str): 'add', 'update' or 'delete'. Updates and deletes apply to
+          the first row with the same key.
+        - row (dict): The row values; a delete only needs the key column.
+
+        Returns:
+        - bool: True if the journal is now due for compaction.
+        """
+        if self._file is None:
+            self.drop_partial_record()
+            self._file = open(self.journal_file, 'a', newline='')
+            self._writer = csv.writer(self._file)
+        self._writer.writerow([op] + [row.get(field, '') for field in self.fieldnames])
+        self._file.flush()
+        self.records += 1
+        return self.records >= max(self.compact_threshold, self.snapshot_rows)
+
+    def compact(self, rows):
+        """
+        Writes a fresh snapshot and empties the journal.
+
+        Parameters:
+        - rows (Iterable[dict]): The current rows.
+        """
+        count = 0
+        with open(self.new_snapshot_file, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=self.fieldnames)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+            file.flush()
+            os.fsync(file.fileno())
+        self.close()
+        # The switch: from here on the journal no longer applies.
+        if os.path.exists(self.journal_file):
+            replace_file(self.journal_file, self.done_file)
+        else:
+            open(self.done_file, 'w').close()
+        replace_file(self.new_snapshot_file, self.snapshot_file)
+        os.remove(self.done_file)
+        self.records = 0
+        self.snapshot_rows = count
+
+    def close(self):
+        """
+        Closes the journal file if it is open.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
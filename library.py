@@ -1,8 +1,32 @@
 import os
 import csv
+import threading
 from datetime import datetime, timedelta
 
+from journal import read_rows
+from locks import NO_LOCK, StripedLock
+from due_dates import DueDateIndex
+from metrics import Metrics
+from pages import PAGE_SIZE, Records, show_pages, write_lines
+from storage import CSVStorage
+from write_behind import INTERVAL, PER_OP, WriteBehind
+
+# Statuses reported by Library.check_out_books() and Library.return_books().
+OK = 'ok'
+MEMBER_NOT_FOUND = 'member-not-found'
+NOT_AVAILABLE = 'not-available'
+NOT_CHECKED_OUT = 'not-checked-out'
+
+# The Library methods timed when the library has a Metrics object.
+METRIC_OPERATIONS = [
+    'load_books', 'load_members', 'find_book', 'find_member', 'check_out_book', 'return_book',
+    'check_out_books', 'return_books', 'add_book', 'add_books', 'remove_book', 'add_member', 'remove_member',
+    'overdue_books', 'books_due_within', 'save_books', 'save_members', 'save_loans', 'flush_tables',
+]
+
 class Book:
+    __slots__ = ('title', 'author', 'ISBN', 'checked_out_by', 'due_date', 'seq')
+
     def __init__(self, title, author, ISBN):
         """
         Represents a Book in the library.
@@ -17,14 +41,27 @@ class Book:
         self.ISBN = ISBN
         self.checked_out_by = None
         self.due_date = None
+        # The book's sequence number in its library's catalogue (see pages.Records).
+        self.seq = None
 
     def display_info(self):
         """
         Displays information about the book.
         """
-        print(f"Title: {self.title}, Author: {self.author}, ISBN: {self.ISBN}")
+        print(self.info())
+
+    def info(self):
+        """
+        Describes the book in one line.
+
+        Returns:
+        - str: The title, author and ISBN.
+        """
+        return f"Title: {self.title}, Author: {self.author}, ISBN: {self.ISBN}"
 
 class Member:
+    __slots__ = ('name', 'member_id', 'checked_out_books', 'seq')
+
     def __init__(self, name, member_id):
         """
         Represents a Member in the library.
@@ -36,6 +73,8 @@ class Member:
         self.name = name
         self.member_id = member_id
         self.checked_out_books = []
+        # The member's sequence number in its library's members (see pages.Records).
+        self.seq = None
 
     def check_out_book(self, book, due_date):
         """
@@ -61,8 +100,80 @@ class Member:
             book.due_date = None
             self.checked_out_books.remove(book)
 
+def member_info(member):
+    """
+    Describes a member in one line.
+
+    Args:
+    - member (Member): The member.
+
+    Returns:
+    - str: The member's ID and name.
+    """
+    return f"Member ID: {member.member_id}, Name: {member.name}"
+
+def stream_books(book_file):
+    """
+    Yields books from a CSV file one at a time, without loading the whole file.
+
+    Args:
+    - book_file (str): The CSV file to read.
+
+    Returns:
+    - Iterator[Book]: The books in the file.
+    """
+    for row in read_rows(book_file):
+        yield Book(row['Title'], row['Author'], row['ISBN'])
+
+def search_books(books, query):
+    """
+    Filters a stream of books by title or author, ignoring case.
+
+    Args:
+    - books (Iterable[Book]): The books to search, e.g. from stream_books().
+    - query (str): The text to look for.
+
+    Returns:
+    - Iterator[Book]: The matching books.
+    """
+    query = query.lower()
+    return (book for book in books if query in book.title.lower() or query in book.author.lower())
+
+def count_books(books):
+    """
+    Counts a stream of books without keeping them.
+
+    Args:
+    - books (Iterable[Book]): The books to count.
+
+    Returns:
+    - int: The number of books.
+    """
+    return sum(1 for _ in books)
+
+def export_books(books, path):
+    """
+    Writes a stream of books to a CSV file in the book file layout.
+
+    Args:
+    - books (Iterable[Book]): The books to write.
+    - path (str): The CSV file to write.
+
+    Returns:
+    - int: The number of books written.
+    """
+    count = 0
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=['Title', 'Author', 'ISBN'])
+        writer.writeheader()
+        for book in books:
+            writer.writerow({'Title': book.title, 'Author': book.author, 'ISBN': book.ISBN})
+            count += 1
+    return count
+
 class Library:
-    def __init__(self, name, book_file, member_file):
+    def __init__(self, name, book_file, member_file, journaled=False, storage=None, thread_safe=False,
+                 durability=PER_OP, flush_interval=1.0, metrics=None):
         """
         Represents a Library with books and members.
 
@@ -70,63 +181,240 @@ class Library:
         - name (str): The name of the library.
         - book_file (str): The filename for storing book data.
         - member_file (str): The filename for storing member data.
+        - journaled (bool): Append each change to a journal instead of rewriting
+          the CSV files. The journals are compacted into the CSV files by
+          save_books() / save_members() and once they grow large enough.
+        - storage (CSVStorage or SQLiteStorage): The storage backend. Defaults
+          to CSV files; with SQLite, loans are stored as well.
+        - thread_safe (bool): Allow the library to be shared between threads.
+          Checkouts and returns lock only the ISBN involved, so unrelated
+          ones run in parallel; changes to the catalogue, the indexes and
+          storage are serialized by a single catalogue lock, always taken
+          after any ISBN lock.
+        - durability (str): When changes reach storage: write_behind.PER_OP
+          (before each call returns), INTERVAL (in groups, flush_interval
+          seconds after the first change of each group) or ON_EXIT (at
+          close() or when the program exits).
+        - flush_interval (float): The INTERVAL window, in seconds.
+        - metrics (Metrics or None): Records the calls and latencies of the
+          operations in METRIC_OPERATIONS, and the rows and bytes each table
+          reads and writes. Without it, nothing is recorded.
         """
         self.name = name
+        self.metrics = metrics
+        if metrics:
+            metrics.instrument(self, METRIC_OPERATIONS)
         # Construct full file paths based on the current working directory
         self.book_file = os.path.join(os.getcwd(), book_file)
         self.member_file = os.path.join(os.getcwd(), member_file)
-        self.books = self.load_books()
-        self.members = self.load_members()
+        self.book_locks = StripedLock() if thread_safe else NO_LOCK
+        # INTERVAL flushes run on a timer thread, which must not save the
+        # catalogue while it is being changed.
+        self.catalogue_lock = threading.RLock() if thread_safe or durability == INTERVAL else NO_LOCK
+        self.write_behind = WriteBehind(self.flush_tables, durability, flush_interval)
+        self.storage = storage or CSVStorage(journaled)
+        self.book_store = self.storage.table('books', self.book_file, ['Title', 'Author', 'ISBN'], 'ISBN')
+        self.member_store = self.storage.table('members', self.member_file, ['Name', 'MemberID'], 'MemberID')
+        self.loan_store = self.storage.table('loans', None, ['ISBN', 'MemberID', 'DueDate'], ('ISBN', 'MemberID'), indexes=['DueDate'])
+        if metrics:
+            for table, store in (('books', self.book_store), ('members', self.member_store), ('loans', self.loan_store)):
+                metrics.instrument_table(table, store)
+        self.books = Records('books', self.load_books())
+        self.members = Records('members', self.load_members())
+        self.rebuild_indexes()
+        self.load_loans()
+        self.due_index = DueDateIndex((book, book.due_date) for book in self.books if book.checked_out_by)
+
+    def rebuild_indexes(self):
+        """
+        Rebuilds the ISBN and member ID lookup indexes from the book and member lists.
+
+        Books are indexed as a list of copies per ISBN, in catalogue order, and
+        members by their unique ID (the first member wins if an ID is repeated).
+        """
+        self.books_by_isbn = {}
+        for book in self.books:
+            self.books_by_isbn.setdefault(book.ISBN, []).append(book)
+        self.members_by_id = {}
+        for member in self.members:
+            self.members_by_id.setdefault(member.member_id, member)
+
+    def find_member(self, member_id):
+        """
+        Finds a member by ID.
+
+        Args:
+        - member_id (int): The ID of the member.
+
+        Returns:
+        - Member or None: The member if found, otherwise None.
+        """
+        return self.members_by_id.get(member_id)
+
+    def find_book(self, ISBN, available_only=False):
+        """
+        Finds a copy of a book by ISBN.
+
+        Args:
+        - ISBN (str): The ISBN of the book.
+        - available_only (bool): Only return a copy that is not checked out.
+
+        Returns:
+        - Book or None: The first matching copy, otherwise None.
+        """
+        for book in self.books_by_isbn.get(ISBN, ()):
+            if not available_only or not book.checked_out_by:
+                return book
+        return None
 
     def load_books(self):
         """
-        Loads books from the CSV file.
+        Loads books from storage.
 
         Returns:
         - List[Book]: List of Book objects.
         """
-        try:
-            with open(self.book_file, 'r') as file:
-                reader = csv.DictReader(file)
-                books = [Book(row['Title'], row['Author'], row['ISBN']) for row in reader]
-            return books
-        except FileNotFoundError:
-            return []
+        return list(self.iter_books())
+
+    def iter_books(self):
+        """
+        Yields the stored books one at a time, without loading the whole
+        catalogue. Use it with search_books(), count_books() and
+        export_books() to process very large catalogues.
+
+        Returns:
+        - Iterator[Book]: The stored books.
+        """
+        return (Book(row['Title'], row['Author'], row['ISBN']) for row in self.book_store.iter_rows())
 
     def load_members(self):
         """
-        Loads members from the CSV file.
+        Loads members from storage.
 
         Returns:
         - List[Member]: List of Member objects.
         """
-        try:
-            with open(self.member_file, 'r') as file:
-                reader = csv.DictReader(file)
-                members = [Member(row['Name'], int(row['MemberID'])) for row in reader]
-            return members
-        except FileNotFoundError:
-            return []
+        return [Member(row['Name'], int(row['MemberID'])) for row in self.member_store.iter_rows()]
+
+    def load_loans(self):
+        """
+        Checks books back out to the members who had them, if the storage backend keeps loans.
+        """
+        if not self.loan_store:
+            return
+        for row in self.loan_store.iter_rows():
+            member = self.find_member(int(row['MemberID']))
+            book = self.find_book(row['ISBN'], available_only=True)
+            if member and book:
+                member.check_out_book(book, datetime.fromisoformat(row['DueDate']))
 
     def save_books(self):
         """
-        Saves books to the CSV file.
+        Saves books to storage.
         """
-        with open(self.book_file, 'w', newline='') as file:
-            writer = csv.DictWriter(file, fieldnames=['Title', 'Author', 'ISBN'])
-            writer.writeheader()
-            for book in self.books:
-                writer.writerow({'Title': book.title, 'Author': book.author, 'ISBN': book.ISBN})
+        with self.catalogue_lock:
+            self.book_store.save({'Title': book.title, 'Author': book.author, 'ISBN': book.ISBN} for book in self.books)
 
     def save_members(self):
         """
-        Saves members to the CSV file.
+        Saves members to storage.
+        """
+        with self.catalogue_lock:
+            self.member_store.save({'Name': member.name, 'MemberID': member.member_id} for member in self.members)
+
+    def record_book(self, op, book):
+        """
+        Persists a single change to a book, or leaves it for the next group
+        write, as the durability setting says.
+
+        Args:
+        - op (str): 'add' or 'delete'.
+        - book (Book): The book that changed.
+        """
+        if self.write_behind.deferred:
+            self.write_behind.changed('books')
+        elif self.book_store.record(op, {'Title': book.title, 'Author': book.author, 'ISBN': book.ISBN}):
+            self.save_books()
+
+    def record_member(self, op, member):
+        """
+        Persists a single change to a member, or leaves it for the next
+        group write, as the durability setting says.
+
+        Args:
+        - op (str): 'add' or 'delete'.
+        - member (Member): The member that changed.
+        """
+        if self.write_behind.deferred:
+            self.write_behind.changed('members')
+        elif self.member_store.record(op, {'Name': member.name, 'MemberID': member.member_id}):
+            self.save_members()
+
+    def record_loans(self, op, loans):
+        """
+        Persists a batch of loan changes, if loans are stored, or leaves it
+        for the next group write, as the durability setting says.
+
+        Args:
+        - op (str): 'add' or 'delete'.
+        - loans (List[dict]): The loans table rows that changed.
+        """
+        if not (self.loan_store and loans):
+            return
+        if self.write_behind.deferred:
+            self.write_behind.changed('loans')
+        else:
+            with self.catalogue_lock:
+                self.loan_store.record_many(op, loans)
+
+    def save_loans(self):
+        """
+        Saves the current loans to storage, if loans are stored.
+        """
+        if self.loan_store:
+            with self.catalogue_lock:
+                self.loan_store.save(self.loan_row(book, book.checked_out_by) for book in self.books if book.checked_out_by)
+
+    def flush_tables(self, tables):
+        """
+        Writes a group of changes, saving each changed table once.
+
+        Args:
+        - tables (Set[str]): The changed tables: 'books', 'members' and/or 'loans'.
+        """
+        if 'books' in tables:
+            self.save_books()
+        if 'members' in tables:
+            self.save_members()
+        if 'loans' in tables:
+            self.save_loans()
+
+    def flush(self):
+        """
+        Writes any pending changes now.
+        """
+        self.write_behind.flush()
+
+    def loan_row(self, book, member):
+        """
+        Converts a loan to a row of the loans table.
+
+        Args:
+        - book (Book): The book on loan.
+        - member (Member): The member who has the book.
+
+        Returns:
+        - dict: The loans table row.
+        """
+        due_date = book.due_date.isoformat() if book.due_date else ''
+        return {'ISBN': book.ISBN, 'MemberID': member.member_id, 'DueDate': due_date}
+
+    def close(self):
+        """
+        Writes any pending changes and closes the storage backend.
         """
-        with open(self.member_file, 'w', newline='') as file:
-            writer = csv.DictWriter(file, fieldnames=['Name', 'MemberID'])
-            writer.writeheader()
-            for member in self.members:
-                writer.writerow({'Name': member.name, 'MemberID': member.member_id})
+        self.write_behind.close()
+        self.storage.close()
 
     def add_book(self, book):
         """
@@ -135,8 +423,29 @@ class Library:
         Args:
         - book (Book): The book to be added.
         """
-        self.books.append(book)
-        self.save_books()
+        with self.book_locks.hold(book.ISBN), self.catalogue_lock:
+            self.books.append(book)
+            self.books_by_isbn.setdefault(book.ISBN, []).append(book)
+            self.record_book('add', book)
+
+    def add_books(self, books):
+        """
+        Adds many books to the library at once, with a single write to storage.
+
+        Args:
+        - books (List[Book]): The books to be added.
+        """
+        with self.book_locks.hold(*[book.ISBN for book in books]), self.catalogue_lock:
+            self.books.extend(books)
+            for book in books:
+                self.books_by_isbn.setdefault(book.ISBN, []).append(book)
+            if not books:
+                return
+            if self.write_behind.deferred:
+                self.write_behind.changed('books')
+            elif self.book_store.record_many('add', [{'Title': book.title, 'Author': book.author, 'ISBN': book.ISBN}
+                                                     for book in books]):
+                self.save_books()
 
     def add_member(self, member):
         """
@@ -144,9 +453,17 @@ class Library:
 
         Args:
         - member (Member): The member to be added.
+
+        Returns:
+        - bool: True if the member was added, False if the ID is already taken.
         """
-        self.members.append(member)
-        self.save_members()
+        with self.catalogue_lock:
+            if member.member_id in self.members_by_id:
+                return False
+            self.members.append(member)
+            self.members_by_id[member.member_id] = member
+            self.record_member('add', member)
+            return True
 
     def delete_book(self, ISBN):
         """
@@ -155,14 +472,38 @@ class Library:
         Args:
         - ISBN (str): The ISBN of the book to be deleted.
         """
-        book = next((b for b in self.books if b.ISBN == ISBN), None)
-        if book:
-            self.books.remove(book)
-            self.save_books()
+        if self.remove_book(ISBN):
             print(f"Book with ISBN {ISBN} deleted successfully.")
+        elif self.find_book(ISBN):
+            print(f"Every copy of the book with ISBN {ISBN} is checked out; return one first.")
         else:
             print(f"Book with ISBN {ISBN} not found.")
 
+    def remove_book(self, ISBN):
+        """
+        Removes a copy of a book from the library. Only a copy on the shelf
+        is removed; a copy that is checked out must be returned first, so
+        its loan is never left behind.
+
+        Args:
+        - ISBN (str): The ISBN of the book to be removed.
+
+        Returns:
+        - bool: True if a copy on the shelf was found and removed.
+        """
+        with self.book_locks.hold(ISBN), self.catalogue_lock:
+            book = self.find_book(ISBN, available_only=True)
+            if not book:
+                return False
+            copies = self.books_by_isbn[ISBN]
+            copies.remove(book)
+            if not copies:
+                del self.books_by_isbn[ISBN]
+            self.books.remove(book)
+            self.due_index.remove(book)
+            self.record_book('delete', book)
+            return True
+
     def delete_member(self, member_id):
         """
         Deletes a member from the library based on their ID.
@@ -170,27 +511,98 @@ class Library:
         Args:
         - member_id (int): The ID of the member to be deleted.
         """
-        member = next((m for m in self.members if m.member_id == member_id), None)
-        if member:
-            self.members.remove(member)
-            self.save_members()
+        if self.remove_member(member_id):
             print(f"Member with ID {member_id} deleted successfully.")
         else:
             print(f"Member with ID {member_id} not found.")
 
-    def display_books(self):
+    def remove_member(self, member_id):
+        """
+        Removes a member from the library.
+
+        Args:
+        - member_id (int): The ID of the member to be removed.
+
+        Returns:
+        - bool: True if the member was found and removed.
+        """
+        with self.catalogue_lock:
+            member = self.members_by_id.pop(member_id, None)
+            if not member:
+                return False
+            self.members.remove(member)
+            self.record_member('delete', member)
+            return True
+
+    def books_page(self, cursor=None, limit=PAGE_SIZE):
+        """
+        Gets a page of the catalogue, in catalogue order. A cursor stays
+        valid while the library runs, whatever is added or removed.
+
+        Args:
+        - cursor (str or None): The cursor returned with the previous page,
+          or None for the first page.
+        - limit (int): The most books on the page.
+
+        Returns:
+        - Tuple[List[Book], str or None]: The books, and the cursor of the
+          next page, or None after the last page.
+
+        Raises:
+        - ValueError: If the cursor is not a cursor of the catalogue.
+        """
+        with self.catalogue_lock:
+            return self.books.page(cursor, limit)
+
+    def members_page(self, cursor=None, limit=PAGE_SIZE):
+        """
+        Gets a page of the members, in the order they joined. A cursor
+        stays valid while the library runs, whatever is added or removed.
+
+        Args:
+        - cursor (str or None): The cursor returned with the previous page,
+          or None for the first page.
+        - limit (int): The most members on the page.
+
+        Returns:
+        - Tuple[List[Member], str or None]: The members, and the cursor of
+          the next page, or None after the last page.
+
+        Raises:
+        - ValueError: If the cursor is not a cursor of the members.
+        """
+        with self.catalogue_lock:
+            return self.members.page(cursor, limit)
+
+    def display_books(self, page_size=None):
         """
         Displays information about all available books in the library.
+
+        Args:
+        - page_size (int or None): Show this many books at a time, asking
+          before each next page; None writes them all in large blocks.
         """
-        for book in self.books:
-            book.display_info()
+        if page_size:
+            show_pages(self.books_page, Book.info, page_size)
+        else:
+            with self.catalogue_lock:
+                books = list(self.books)
+            write_lines(map(Book.info, books))
 
-    def display_members(self):
+    def display_members(self, page_size=None):
         """
         Displays information about all library members.
+
+        Args:
+        - page_size (int or None): Show this many members at a time, asking
+          before each next page; None writes them all in large blocks.
         """
-        for member in self.members:
-            print(f"Member ID: {member.member_id}, Name: {member.name}")
+        if page_size:
+            show_pages(self.members_page, member_info, page_size)
+        else:
+            with self.catalogue_lock:
+                members = list(self.members)
+            write_lines(map(member_info, members))
 
     def check_out_book(self, member_id, ISBN):
         """
@@ -200,16 +612,12 @@ class Library:
         - member_id (int): The ID of the member.
         - ISBN (str): The ISBN of the book to be checked out.
         """
-        member = next((m for m in self.members if m.member_id == member_id), None)
-        book = next((b for b in self.books if b.ISBN == ISBN and not b.checked_out_by), None)
-
-        if member and book:
-            due_date = datetime.now() + timedelta(days=14)  # Example: 2 weeks checkout period
-            member.check_out_book(book, due_date)
-            print(f"{book.title} checked out to {member.name}. Due date: {due_date}")
-        elif not member:
+        result = self.check_out_books([(member_id, ISBN)])[0]
+        if result['status'] == OK:
+            print(f"{result['book'].title} checked out to {result['member'].name}. Due date: {result['due_date']}")
+        elif result['status'] == MEMBER_NOT_FOUND:
             print(f"Member with ID {member_id} not found.")
-        elif not book:
+        else:
             print(f"Book with ISBN {ISBN} not available for checkout.")
 
     def return_book(self, member_id, ISBN):
@@ -220,16 +628,114 @@ class Library:
         - member_id (int): The ID of the member.
         - ISBN (str): The ISBN of the book to be returned.
         """
-        member = next((m for m in self.members if m.member_id == member_id), None)
-        book = next((b for b in self.books if b.ISBN == ISBN and b.checked_out_by == member), None)
-
-        if member and book:
-            member.return_book(book)
-            print(f"{book.title} returned by {member.name}.")
-        elif not member:
+        result = self.return_books([(member_id, ISBN)])[0]
+        if result['status'] == OK:
+            print(f"{result['book'].title} returned by {result['member'].name}.")
+        elif result['status'] == MEMBER_NOT_FOUND:
             print(f"Member with ID {member_id} not found.")
-        elif not book:
-            print(f"Book with ISBN {ISBN} not checked out by {member.name}.")
+        else:
+            print(f"Book with ISBN {ISBN} not checked out by {result['member'].name}.")
+
+    def check_out_books(self, pairs, loan_days=14):
+        """
+        Checks out a batch of books, e.g. a class set of textbooks, and
+        persists all the loans in one write.
+
+        Args:
+        - pairs (Iterable[Tuple[int, str]]): The (member ID, ISBN) pairs to check out.
+        - loan_days (int): The loan period in days.
+
+        Returns:
+        - List[dict]: One result per pair, in order, with the keys 'member_id',
+          'ISBN', 'status' (OK, MEMBER_NOT_FOUND or NOT_AVAILABLE), 'member',
+          'book' and 'due_date'.
+        """
+        due_date = datetime.now() + timedelta(days=loan_days)
+        results = []
+        loans = []
+        for member_id, ISBN in pairs:
+            member = self.find_member(member_id)
+            book = None
+            if member:
+                # Finding a free copy and issuing it must not be split by
+                # another checkout of the same ISBN.
+                with self.book_locks.hold(ISBN):
+                    book = self.find_book(ISBN, available_only=True)
+                    if book:
+                        member.check_out_book(book, due_date)
+                        with self.catalogue_lock:
+                            self.due_index.set(book, due_date)
+                if book:
+                    loans.append(self.loan_row(book, member))
+            if book:
+                status = OK
+            else:
+                status = NOT_AVAILABLE if member else MEMBER_NOT_FOUND
+            results.append({'member_id': member_id, 'ISBN': ISBN, 'status': status,
+                            'member': member, 'book': book, 'due_date': due_date if book else None})
+        self.record_loans('add', loans)
+        return results
+
+    def return_books(self, pairs):
+        """
+        Returns a batch of books, e.g. the contents of a book-drop bin, and
+        persists all the returns in one write.
+
+        Args:
+        - pairs (Iterable[Tuple[int, str]]): The (member ID, ISBN) pairs to return.
+
+        Returns:
+        - List[dict]: One result per pair, in order, with the keys 'member_id',
+          'ISBN', 'status' (OK, MEMBER_NOT_FOUND or NOT_CHECKED_OUT), 'member'
+          and 'book'.
+        """
+        results = []
+        loans = []
+        for member_id, ISBN in pairs:
+            member = self.find_member(member_id)
+            book = None
+            if member:
+                with self.book_locks.hold(ISBN):
+                    book = next((b for b in self.books_by_isbn.get(ISBN, ()) if b.checked_out_by is member), None)
+                    if book:
+                        loans.append(self.loan_row(book, member))
+                        member.return_book(book)
+                        with self.catalogue_lock:
+                            self.due_index.remove(book)
+            if book:
+                status = OK
+            else:
+                status = NOT_CHECKED_OUT if member else MEMBER_NOT_FOUND
+            results.append({'member_id': member_id, 'ISBN': ISBN, 'status': status, 'member': member, 'book': book})
+        self.record_loans('delete', loans)
+        return results
+
+    def overdue_books(self, as_of=None):
+        """
+        Finds the books that are overdue, without scanning the whole catalogue.
+
+        Args:
+        - as_of (datetime): The time to check against (default now).
+
+        Returns:
+        - List[Book]: The overdue books, earliest due date first.
+        """
+        as_of = as_of or datetime.now()
+        return [book for due_date, book in self.due_index.overdue(as_of)]
+
+    def books_due_within(self, days, as_of=None):
+        """
+        Finds the books that fall due in the next few days.
+
+        Args:
+        - days (int): The number of days to look ahead.
+        - as_of (datetime): The start of the period (default now).
+
+        Returns:
+        - List[Book]: The books due in the period, earliest due date first.
+        """
+        as_of = as_of or datetime.now()
+        return [book for due_date, book in self.due_index.due_between(as_of, as_of + timedelta(days=days))]
 
 def display_menu():
     """
@@ -245,12 +751,14 @@ def display_menu():
     print("7. Exit")
     print("8. Add Member")
     print("9. Add Book")
+    print("Type 'stats' to see operation timings.")
 
 def main():
     """
     Main function to run the library management system.
     """
-    library = Library("My Library", "books.csv", "members.csv")
+    # Changes are written in groups; the library's exit hook writes the last one.
+    library = Library("My Library", "books.csv", "members.csv", durability=INTERVAL, metrics=Metrics())
 
     while True:
         display_menu()
@@ -258,10 +766,10 @@ def main():
 
         if choice == '1':
             print("\nAvailable Books:")
-            library.display_books()
+            library.display_books(PAGE_SIZE)
         elif choice == '2':
             print("\nLibrary Members:")
-            library.display_members()
+            library.display_members(PAGE_SIZE)
         elif choice == '3':
             member_id = input("Enter your member ID: ")
             ISBN = input("Enter the ISBN of the book you want to check out: ")
@@ -283,8 +791,10 @@ def main():
             name = input("Enter the member's name: ")
             member_id = int(input("Enter the member's ID: "))
             new_member = Member(name, member_id)
-            library.add_member(new_member)
-            print(f"Member {name} added successfully.")
+            if library.add_member(new_member):
+                print(f"Member {name} added successfully.")
+            else:
+                print(f"Member with ID {member_id} already exists.")
         elif choice == '9':
             title = input("Enter the book's title: ")
             author = input("Enter the book's author: ")
@@ -292,6 +802,8 @@ def main():
             new_book = Book(title, author, ISBN)
             library.add_book(new_book)
             print(f"Book {title} added successfully.")
+        elif choice == 'stats':
+            print(library.metrics.report())
         else:
             print("Invalid choice. Please enter a number between 1 and 9.")
 
@@ -0,0 +1,71 @@
+import threading
+from contextlib import contextmanager, nullcontext
+
+class StripedLock:
+    """
+    Represents a fixed set of locks shared out among keys by hash.
+
+    Operations on the same key always take the same lock and so run one at a
+    time, while operations on unrelated keys usually take different locks and
+    run side by side. A fixed number of stripes keeps memory flat however
+    many keys there are.
+
+    Attributes:
+    - locks (List[threading.Lock]): The stripes.
+    """
+
+    def __init__(self, stripes=64):
+        """
+        Initializes a new StripedLock object.
+
+        Parameters:
+        - stripes (int): The number of locks.
+        """
+        self.locks = [threading.Lock() for _ in range(stripes)]
+
+    @contextmanager
+    def hold(self, *keys):
+        """
+        Holds the locks for some keys. Stripes are always taken in the same
+        order, so two callers holding several keys cannot deadlock.
+
+        Parameters:
+        - keys (hashable): The keys, e.g. ISBNs.
+
+        Returns:
+        - ContextManager: Holds the locks until exit.
+        """
+        stripes = sorted({hash(key) % len(self.locks) for key in keys})
+        for stripe in stripes:
+            self.locks[stripe].acquire()
+        try:
+            yield
+        finally:
+            for stripe in reversed(stripes):
+                self.locks[stripe].release()
+
+class NoLock:
+    """
+    Stands in for a StripedLock or RLock when a library is not shared
+    between threads, so the locking code costs next to nothing.
+    """
+
+    def hold(self, *keys):
+        """
+        Does nothing.
+
+        Parameters:
+        - keys (hashable): Ignored.
+
+        Returns:
+        - ContextManager: A context manager that does nothing.
+        """
+        return nullcontext()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NO_LOCK = NoLock()
@@ -0,0 +1,316 @@
+"""
+Operation metrics for the library management system.
+
+A Metrics object counts the calls, failures and latencies of a library's
+operations, and the rows and bytes its tables read and write. It is only
+attached when asked for: a library created without one runs its plain
+methods, so metrics cost nothing when they are off.
+
+The metrics can be printed as a table (the menus' stats command) or
+exported in the Prometheus text format, e.g. to a file read by the node
+exporter's textfile collector.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# The upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def file_size(path):
+    """
+    Gets the size of a file.
+
+    Parameters:
+    - path (str or None): The file.
+
+    Returns:
+    - int or None: The size in bytes, or None if there is no such file.
+    """
+    if path is None:
+        return None
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+class Histogram:
+    """
+    Represents the latencies of one operation, counted in fixed buckets.
+
+    Attributes:
+    - counts (List[int]): The number of calls per bucket; the last bucket
+      holds calls slower than the largest bound.
+    - count (int): The number of calls.
+    - total (float): The total time of the calls, in seconds.
+    - failures (int): The number of calls that raised an exception.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new, empty Histogram object.
+        """
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.failures = 0
+
+    def observe(self, seconds, failed=False):
+        """
+        Records one call.
+
+        Parameters:
+        - seconds (float): How long the call took.
+        - failed (bool): Whether the call raised an exception.
+        """
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if failed:
+            self.failures += 1
+
+    def quantile(self, fraction):
+        """
+        Estimates a latency quantile as the upper bound of the bucket it falls in.
+
+        Parameters:
+        - fraction (float): The quantile, e.g. 0.99.
+
+        Returns:
+        - float or None: The estimate in seconds (infinity beyond the largest
+          bound), or None if there were no calls.
+        """
+        if not self.count:
+            return None
+        wanted = fraction * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= wanted:
+                return bound
+        return float('inf')
+
+class Metrics:
+    """
+    Represents the metrics of one library.
+
+    Attributes:
+    - prefix (str): The prefix of the exported metric names.
+    - operations (dict): A Histogram per operation name.
+    - rows (dict): The rows moved, by (table, 'read' or 'written').
+    - bytes (dict): The bytes moved, by (table, 'read' or 'written'), for file-backed tables.
+    """
+
+    def __init__(self, prefix='library'):
+        """
+        Initializes a new Metrics object.
+
+        Parameters:
+        - prefix (str): The prefix of the exported metric names.
+        """
+        self.prefix = prefix
+        self.operations = {}
+        self.rows = {}
+        self.bytes = {}
+        self.lock = threading.Lock()
+
+    def observe(self, operation, seconds, failed=False):
+        """
+        Records one call of an operation.
+
+        Parameters:
+        - operation (str): The operation name.
+        - seconds (float): How long the call took.
+        - failed (bool): Whether the call raised an exception.
+        """
+        with self.lock:
+            histogram = self.operations.get(operation)
+            if histogram is None:
+                histogram = self.operations[operation] = Histogram()
+            histogram.observe(seconds, failed)
+
+    def count_io(self, table, direction, rows, size=None):
+        """
+        Records rows and bytes read from or written to a table.
+
+        Parameters:
+        - table (str): The table name.
+        - direction (str): 'read' or 'written'.
+        - rows (int): The number of rows.
+        - size (int or None): The number of bytes, if known.
+        """
+        key = (table, direction)
+        with self.lock:
+            self.rows[key] = self.rows.get(key, 0) + rows
+            if size is not None:
+                self.bytes[key] = self.bytes.get(key, 0) + size
+
+    def timed(self, operation, function):
+        """
+        Wraps a function so each call is recorded under an operation name.
+
+        Parameters:
+        - operation (str): The operation name.
+        - function (callable): The function.
+
+        Returns:
+        - callable: The wrapped function.
+        """
+        clock = time.perf_counter
+
+        def call(*args, **kwargs):
+            start = clock()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                self.observe(operation, clock() - start, True)
+                raise
+            self.observe(operation, clock() - start)
+            return result
+        call.__name__ = getattr(function, '__name__', operation)
+        call.__doc__ = getattr(function, '__doc__', None)
+        return call
+
+    def instrument(self, owner, operations):
+        """
+        Times some methods of an object, by replacing them on the object
+        itself; the class and other instances are left alone.
+
+        Parameters:
+        - owner (object): The object, e.g. a library.
+        - operations (Iterable[str]): The names of the methods to time.
+        """
+        for operation in operations:
+            setattr(owner, operation, self.timed(operation, getattr(owner, operation)))
+
+    def instrument_table(self, name, table):
+        """
+        Counts the rows and bytes a storage table reads and writes. Bytes
+        are counted for tables kept in files: the file size for a full read
+        or save, and the growth of the journal for a journaled change.
+
+        Parameters:
+        - name (str): The table name.
+        - table (CSVTable, CatalogueTable or SQLiteTable or None): The table; None is ignored.
+        """
+        if table is None:
+            return
+        path = getattr(table, 'path', None)
+        journal = getattr(table, 'journal', None)
+        iter_rows, save, record, record_many = table.iter_rows, table.save, table.record, table.record_many
+
+        def counted_iter_rows():
+            count = 0
+            size = file_size(path)
+            for row in iter_rows():
+                count += 1
+                yield row
+            self.count_io(name, 'read', count, size)
+
+        def counted_save(rows):
+            count = 0
+
+            def each():
+                nonlocal count
+                for row in rows:
+                    count += 1
+                    yield row
+            save(each())
+            self.count_io(name, 'written', count, file_size(path))
+
+        def counted_record(op, row):
+            # A journal that does not exist yet is empty.
+            before = (file_size(journal.journal_file) or 0) if journal else None
+            due = record(op, row)
+            after = file_size(journal.journal_file) if journal else None
+            self.count_io(name, 'written', 1, after - before if None not in (before, after) else None)
+            return due
+
+        def counted_record_many(op, rows):
+            # A journal that does not exist yet is empty.
+            before = (file_size(journal.journal_file) or 0) if journal else None
+            due = record_many(op, rows)
+            after = file_size(journal.journal_file) if journal else None
+            self.count_io(name, 'written', len(rows), after - before if None not in (before, after) else None)
+            return due
+
+        table.iter_rows = counted_iter_rows
+        table.save = counted_save
+        table.record = counted_record
+        table.record_many = counted_record_many
+
+    def prometheus(self):
+        """
+        Formats the metrics in the Prometheus text exposition format.
+
+        Returns:
+        - str: The metrics.
+        """
+        prefix = self.prefix
+        with self.lock:
+            operations = sorted(self.operations.items())
+            rows = sorted(self.rows.items())
+            sizes = sorted(self.bytes.items())
+            lines = [f'# HELP {prefix}_operation_seconds Latency of library operations.',
+                     f'# TYPE {prefix}_operation_seconds histogram']
+            for operation, histogram in operations:
+                seen = 0
+                for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                    seen += count
+                    lines.append(f'{prefix}_operation_seconds_bucket{{operation="{operation}",le="{bound}"}} {seen}')
+                lines.append(f'{prefix}_operation_seconds_bucket{{operation="{operation}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{prefix}_operation_seconds_sum{{operation="{operation}"}} {histogram.total!r}')
+                lines.append(f'{prefix}_operation_seconds_count{{operation="{operation}"}} {histogram.count}')
+            lines += [f'# HELP {prefix}_operation_failures_total Library operations that raised an exception.',
+                      f'# TYPE {prefix}_operation_failures_total counter']
+            lines += [f'{prefix}_operation_failures_total{{operation="{operation}"}} {histogram.failures}'
+                      for operation, histogram in operations]
+            lines += [f'# HELP {prefix}_storage_rows_total Rows read from and written to storage.',
+                      f'# TYPE {prefix}_storage_rows_total counter']
+            lines += [f'{prefix}_storage_rows_total{{table="{table}",direction="{direction}"}} {count}'
+                      for (table, direction), count in rows]
+            lines += [f'# HELP {prefix}_storage_bytes_total Bytes read from and written to storage files.',
+                      f'# TYPE {prefix}_storage_bytes_total counter']
+            lines += [f'{prefix}_storage_bytes_total{{table="{table}",direction="{direction}"}} {size}'
+                      for (table, direction), size in sizes]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """
+        Writes the metrics to a file in the Prometheus text format. The
+        file is replaced atomically, so a collector never reads half of it.
+
+        Parameters:
+        - path (str): The file, e.g. library.prom.
+        """
+        temp_file = path + '.tmp'
+        with open(temp_file, 'w') as file:
+            file.write(self.prometheus())
+        os.replace(temp_file, path)
+
+    def report(self):
+        """
+        Formats the metrics as a table for people to read.
+
+        Returns:
+        - str: The report.
+        """
+        def milliseconds(seconds):
+            return '-' if seconds is None else f'>{1000 * LATENCY_BUCKETS[-1]:g}' if seconds == float('inf') else f'{1000 * seconds:g}'
+
+        with self.lock:
+            lines = [f"{'Operation':<22} {'Calls':>8} {'Failed':>6} {'Mean ms':>9} {'p50 ms':>8} {'p99 ms':>8}"]
+            for operation, histogram in sorted(self.operations.items()):
+                mean = histogram.total / histogram.count if histogram.count else None
+                lines.append(f"{operation:<22} {histogram.count:>8} {histogram.failures:>6} "
+                             f"{'-' if mean is None else f'{1000 * mean:.3f}':>9} "
+                             f"{milliseconds(histogram.quantile(0.5)):>8} {milliseconds(histogram.quantile(0.99)):>8}")
+            if self.rows:
+                lines.append('')
+                lines.append(f"{'Table':<22} {'Direction':<9} {'Rows':>10} {'Bytes':>12}")
+                for (table, direction), count in sorted(self.rows.items()):
+                    size = self.bytes.get((table, direction))
+                    lines.append(f"{table:<22} {direction:<9} {count:>10} {'-' if size is None else size:>12}")
+        return '\n'.join(lines)
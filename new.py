@@ -1,6 +1,46 @@
 import csv
 import os
-from datetime import timedelta
+import threading
+from datetime import date, timedelta
+from itertools import starmap
+
+from completion import MAX_COMPLETIONS, CompletionTrie
+from due_dates import DueDateIndex
+from fines import DEFAULT_MEMBER_TYPE, FineEngine, format_cents
+from holds import HoldQueue, TimerWheel
+from inventory import Inventory
+from journal import read_rows
+from locks import NO_LOCK, StripedLock
+from metrics import Metrics
+from pages import PAGE_SIZE, Sequence, show_pages, write_lines
+from search_cache import SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SearchCache
+from search_index import SearchIndex, normalize
+from snapshot import load_snapshot
+from storage import CSVStorage, CSVTable
+from write_behind import INTERVAL, PER_OP, WriteBehind
+
+# Statuses reported by the circulation methods of Library.
+OK = 'ok'
+NOT_FOUND = 'not-found'
+NOT_AVAILABLE = 'not-available'
+ALREADY_RESERVED = 'already-reserved'
+NOT_RENEWABLE = 'not-renewable'
+WAITLISTED = 'waitlisted'
+NOT_CHECKED_OUT = 'not-checked-out'
+
+# The Library methods timed when the library has a Metrics object.
+METRIC_OPERATIONS = [
+    'load_books', 'load_users', 'build_search_index', 'find_book_by_id', 'find_user', 'search_books',
+    'fuzzy_search_books', 'autocomplete',
+    'add_user', 'add_book', 'add_books', 'delete_book', 'reserve_book', 'renew_book', 'cancel_reservation',
+    'check_out_book', 'return_book', 'expire_holds', 'overdue_books', 'books_due_within',
+    'assess_fines', 'pay_fine',
+    'save_books', 'save_users', 'save_holds', 'save_loan_counts', 'save_fines', 'flush_tables',
+]
+
+# The time a fuzzy search may spend checking candidates before it settles
+# for the best found so far, in seconds.
+FUZZY_BUDGET = 0.05
 
 class User:
     """
@@ -13,6 +53,8 @@ class User:
         - user_email (str): The email address of the user.
         - password (str): The password for user authentication.
         """
+    __slots__ = ('user_name', 'user_type', 'user_phone', 'user_email', 'password')
+
     def __init__(self, user_name, user_type, user_phone, user_email, password):
         self.user_name = user_name
         self.user_type = user_type
@@ -20,14 +62,21 @@ class User:
         self.user_email = user_email
         self.password = password
 
-    def register(self):
+    def register(self, library):
         """
-        Register the user by adding user details to the 'users.csv' file.
+        Register the user by adding user details to the library's user file.
+
+        Args:
+        - library (Library): The Library object representing the library system.
+
+        Returns:
+        - bool: True if registered, False if the user name is already taken.
         """
-        with open('users.csv', 'a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([self.user_name, self.user_type, self.user_phone, self.user_email, self.password])
+        if not library.add_user(self):
+            print(f"User name {self.user_name} is already taken.")
+            return False
         print(f"User {self.user_name} registered successfully.")
+        return True
 
     def login(self, entered_password):
         """
@@ -53,6 +102,12 @@ class User:
         matching_books = library.search_books(search_query)
         if matching_books:
             print("Matching Books:")
+        else:
+            # Nothing matches as typed, so look for near misses.
+            matching_books = [book for distance, book in library.fuzzy_search_books(search_query)]
+            if matching_books:
+                print("No exact matches. Did you mean:")
+        if matching_books:
             for book in matching_books:
                 print(f"ISBN: {book.book_id}, Title: {book.book_title}, Availability: {book.availability}")
         else:
@@ -66,42 +121,39 @@ class User:
         - book_id (str): The ISBN of the book to be reserved.
         - library (Library): The Library object representing the library system.
         """
-        book_to_reserve = library.find_book_by_id(book_id)
-
-        if book_to_reserve:
-            if book_to_reserve.availability and not book_to_reserve.reserved:
-                book_to_reserve.reserved = True
-                print(f"Book '{book_to_reserve.book_title}' reserved successfully.")
-            elif not book_to_reserve.availability:
-                print("Book is not available for reservation.")
-            elif book_to_reserve.reserved:
-                print("Book is already reserved.")
+        status, book = library.reserve_book(book_id, self.user_name)
+        if status == OK:
+            print(f"Book '{book.book_title}' reserved successfully.")
+        elif status == WAITLISTED:
+            position = library.hold_position(book_id, self.user_name)
+            print(f"Book '{book.book_title}' is out. You are number {position} in the queue.")
+        elif status == NOT_AVAILABLE:
+            print("Book is not available for reservation.")
+        elif status == ALREADY_RESERVED:
+            print("Book is already reserved.")
         else:
             print("Book not found.")
 
     def renew_book(self, book_id, library):
         """
-        Renew a reserved book in the library.
+        Renew a book on loan from the library.
 
         Args:
         - book_id (str): The ISBN of the book to be renewed.
         - library (Library): The Library object representing the library system.
         """
-        book_to_renew = library.find_book_by_id(book_id)
-
-        if book_to_renew:
-            if book_to_renew.reserved and not book_to_renew.availability:
-                book_to_renew.due_return += timedelta(days=14)
-                library.save_books()
-
-                print(f"Book '{book_to_renew.book_title}' renewed successfully. New due date: {book_to_renew.due_return}")
-            else:
-                print("Book cannot be renewed. Check availability and reservation status.")
+        status, book = library.renew_book(book_id)
+        if status == OK:
+            print(f"Book '{book.book_title}' renewed successfully. New due date: {book.due_return}")
+        elif status == NOT_RENEWABLE:
+            print("Book cannot be renewed: it is not on loan.")
         else:
             print("Book not found.")
 
 
 class Admin(User):
+    __slots__ = ()
+
     def __init__(self, user_name, user_type, user_phone, user_email, password):
         """
         Initialize an Admin object, inheriting from User.
@@ -115,14 +167,21 @@ class Admin(User):
         """
         super().__init__(user_name, "admin", user_phone, user_email, password)
 
-    def register(self):
+    def register(self, library):
         """
-        Register the admin by adding admin details to the 'users.csv' file.
+        Register the admin by adding admin details to the library's user file.
+
+        Args:
+        - library (Library): The Library object representing the library system.
+
+        Returns:
+        - bool: True if registered, False if the user name is already taken.
         """
-        with open('users.csv', 'a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([self.user_name, "admin", self.user_phone, self.user_email, self.password])
+        if not library.add_user(self):
+            print(f"User name {self.user_name} is already taken.")
+            return False
         print(f"Admin {self.user_name} registered successfully.")
+        return True
 
     def add_book(self, library):
         """
@@ -135,7 +194,7 @@ class Admin(User):
         title = input("Enter the book's title: ")
         author = input("Enter the book's author: ")
 
-        new_book = Book(ISBN, title, author)
+        new_book = Book(ISBN, title, author, True, False, None)
         library.add_book(new_book)
 
         print(f"Book {title} added successfully.")
@@ -148,26 +207,29 @@ class Admin(User):
         - library (Library): The Library object representing the library system.
         """
         book_id = input("Enter the book ISBN to delete: ")
-        if any(book.book_id == book_id for book in library.books):
-            updated_books = [book for book in library.books if book.book_id != book_id]
-            library.books = updated_books
-            library.save_books()
+        if library.delete_book(book_id):
             print(f"Book with ISBN {book_id} deleted successfully.")
         else:
             print(f"Book with ISBN {book_id} not found.")
 
-    def view_users(self, library):
+    def view_users(self, library, page_size=PAGE_SIZE):
         """
         View information about all users registered in the library.
 
         Args:
         - library (Library): The Library object representing the library system.
+        - page_size (int or None): Show this many users at a time, asking
+          before each next page; None writes them all in large blocks.
         """
         print("Viewing user information:")
-        for user in library.users:
-            print(f"User Name: {user.user_name}, User Type: {user.user_type}, Phone: {user.user_phone}, Email: {user.user_email}")
+        if page_size:
+            show_pages(library.users_page, user_info, page_size)
+        else:
+            write_lines(map(user_info, list(library.users)))
 
 class Book:
+    __slots__ = ('book_id', 'book_title', 'book_author', 'availability', 'reserved', 'due_return')
+
     def __init__(self, book_id, book_title, book_author, availability=None, reserved=False, due_return=False):
         """
         Initialize a Book object.
@@ -241,9 +303,24 @@ class Student:
         """Handles the process of returning a book."""
         print("Returning a book...")
 
-    def pay_fine(self):
-        """Handles the process of paying fines."""
-        print("Paying fines...")
+    def pay_fine(self, library, amount=None):
+        """
+        Pays the student's fines for books returned late.
+
+        Parameters:
+        - library (Library): The library.
+        - amount (int or None): The amount to pay, in cents; None pays everything owed.
+
+        Returns:
+        - int: The amount still owed, in cents.
+        """
+        owed = library.fines_of(self.student_id)['owed']
+        if not owed:
+            print("No fines to pay.")
+            return 0
+        paid, owed = library.pay_fine(self.student_id, owed if amount is None else amount)
+        print(f"Paid {format_cents(paid)}. Still owed: {format_cents(owed)}.")
+        return owed
 
 class Clerk:
     """
@@ -274,9 +351,21 @@ class Clerk:
         """Handles the process of issuing a book."""
         print("Issuing a book...")
 
-    def calc_fine(self):
-        """Handles the process of calculating fines."""
-        print("Calculating fines...")
+    def calc_fine(self, library, as_of=None):
+        """
+        Runs the nightly fine calculation over every book on loan.
+
+        Parameters:
+        - library (Library): The library.
+        - as_of (date): The date to fine up to (default today).
+
+        Returns:
+        - dict: See Library.assess_fines().
+        """
+        summary = library.assess_fines(as_of)
+        print(f"{summary['overdue']} of {summary['loans']} loans overdue. "
+              f"Fines accruing: {format_cents(summary['total'])}.")
+        return summary
 
 class PayFine:
     """
@@ -286,6 +375,8 @@ class PayFine:
     - pay_id (str): The ID of the payment.
     - pay_description (str): The description of the payment.
     - student_id (str): The ID of the student making the payment.
+    - amount (int): The amount to pay, in cents.
+    - payment_method (str): How the student pays, e.g. 'cash' or 'card'.
     """
 
     def __init__(self, pay_id, pay_description, student_id):
@@ -300,18 +391,47 @@ class PayFine:
         self.pay_id = pay_id
         self.pay_description = pay_description
         self.student_id = student_id
+        self.amount = 0
+        self.payment_method = 'cash'
 
-    def create_pay(self):
-        """Handles the process of creating a payment record."""
-        print("Creating a payment record...")
+    def create_pay(self, library, amount=None):
+        """
+        Creates the payment, for everything the student owes unless an amount is given.
 
-    def payment_type(self):
-        """Handles the process of specifying payment type."""
-        print("Specifying payment type...")
+        Parameters:
+        - library (Library): The library.
+        - amount (int or None): The amount to pay, in cents.
+        """
+        owed = library.fines_of(self.student_id)['owed']
+        self.amount = owed if amount is None else min(amount, owed)
+        print(f"Payment {self.pay_id} ({self.pay_description}): {format_cents(self.amount)} "
+              f"of {format_cents(owed)} owed by {self.student_id}.")
 
-    def confirm_pay(self):
-        """Handles the process of confirming payment."""
-        print("Confirming payment...")
+    def payment_type(self, payment_method='cash'):
+        """
+        Sets how the student pays.
+
+        Parameters:
+        - payment_method (str): e.g. 'cash' or 'card'.
+        """
+        self.payment_method = payment_method
+
+    def confirm_pay(self, library):
+        """
+        Takes the payment.
+
+        Parameters:
+        - library (Library): The library.
+
+        Returns:
+        - int: The amount still owed, in cents.
+        """
+        if not self.amount:
+            print("Nothing to pay.")
+            return library.fines_of(self.student_id)['owed']
+        paid, owed = library.pay_fine(self.student_id, self.amount)
+        print(f"Paid {format_cents(paid)} by {self.payment_method}. Still owed: {format_cents(owed)}.")
+        return owed
 
 class RenewBook:
     """
@@ -343,7 +463,7 @@ class CalculateFine:
     Attributes:
     - fine_id (str): The ID of the fine.
     - student_id (str): The ID of the student with fines.
-    - total_balance (float): The total fine balance.
+    - total_balance (int): The total fine balance, in cents.
     """
 
     def __init__(self, fine_id, student_id, total_balance):
@@ -353,15 +473,29 @@ class CalculateFine:
         Parameters:
         - fine_id (str): The ID of the fine.
         - student_id (str): The ID of the student with fines.
-        - total_balance (float): The total fine balance.
+        - total_balance (int): The total fine balance, in cents.
         """
         self.fine_id = fine_id
         self.student_id = student_id
         self.total_balance = total_balance
 
-    def method(self):
-        """Handles the process of calculating fines."""
-        print("Calculating fines...")
+    def method(self, library):
+        """
+        Works out the student's total fine balance: what they owe for books
+        returned late and what is accruing on books still on loan, as of the
+        last nightly calculation.
+
+        Parameters:
+        - library (Library): The library.
+
+        Returns:
+        - int: The total fine balance, in cents.
+        """
+        fines = library.fines_of(self.student_id)
+        self.total_balance = fines['owed'] + fines['accruing']
+        print(f"Fines of {self.student_id}: {format_cents(fines['owed'])} owed, "
+              f"{format_cents(fines['accruing'])} accruing.")
+        return self.total_balance
 
 class SearchBook:
     """
@@ -383,6 +517,23 @@ class SearchBook:
         self.book_id = book_id
         self.book_title = book_title
 
+    def search(self, library, limit=20):
+        """
+        Looks the book up in a library: by ID if one was given, otherwise by
+        title, forgiving typos.
+
+        Parameters:
+        - library (Library): The library.
+        - limit (int): The largest number of books to return for a title.
+
+        Returns:
+        - List[Book]: The matching books, best match first.
+        """
+        if self.book_id:
+            book = library.find_book_by_id(self.book_id)
+            return [book] if book else []
+        return [book for distance, book in library.fuzzy_search_books(self.book_title, limit=limit)]
+
     def availability_status(self):
         """Handles the process of checking book availability status."""
         print("Checking book availability status...")
@@ -399,8 +550,17 @@ class ReserveBook:
         self.book_id = book_id
         self.student_id = student_id
 
-    def reserved(self):
-        print("Reserving a book...")
+    def reserved(self, library):
+        """
+        Places the hold in a library.
+
+        Parameters:
+        - library (Library): The library.
+
+        Returns:
+        - Tuple[str, Book or None]: The status and the book; see Library.reserve_book().
+        """
+        return library.reserve_book(self.book_id, self.student_id)
 
 class IssueBook:
     """
@@ -426,6 +586,212 @@ class IssueBook:
         """Handles the process of issuing a book."""
         print("Issuing a book...")
 
+BOOK_FIELDS = ['book_id', 'book_title', 'book_author', 'availability', 'reserved', 'due_return']
+USER_FIELDS = ['user_name', 'user_type', 'user_phone', 'user_email', 'password']
+HOLD_FIELDS = ['book_id', 'user_name', 'ready_until']
+LOAN_FIELDS = ['book_id', 'loans']
+FINE_FIELDS = ['user_name', 'balance']
+BORROWER_FIELDS = ['book_id', 'user_name', 'user_type']
+
+def parse_bool(value):
+    """
+    Parses a true/false value from the book file.
+
+    Parameters:
+    - value (str): The stored value, e.g. 'True', 'False', '1', '0' or ''.
+
+    Returns:
+    - bool: The parsed value.
+    """
+    return str(value).strip().lower() in ('true', '1', 'yes')
+
+def parse_date(value):
+    """
+    Parses a date from the book file.
+
+    Parameters:
+    - value (str): The stored value, in YYYY-MM-DD format, or ''.
+
+    Returns:
+    - date or None: The parsed date, or None if there is none.
+    """
+    return date.fromisoformat(value[:10]) if value else None
+
+def book_from_row(row):
+    """
+    Creates a book from a row of the book file.
+
+    Parameters:
+    - row (dict): The CSV row.
+
+    Returns:
+    - Book: The Book object.
+    """
+    return Book(row['book_id'], row['book_title'], row.get('book_author', ''), parse_bool(row['availability']),
+                parse_bool(row['reserved']), parse_date(row['due_return']))
+
+def book_to_row(book):
+    """
+    Converts a book to a row of the book file.
+
+    Parameters:
+    - book (Book): The Book object to convert.
+
+    Returns:
+    - dict: The CSV row.
+    """
+    return {
+        'book_id': book.book_id,
+        'book_title': book.book_title,
+        'book_author': book.book_author,
+        'availability': book.availability,
+        'reserved': book.reserved,
+        'due_return': book.due_return.strftime('%Y-%m-%d') if book.due_return else ''
+    }
+
+def book_fields(book):
+    """
+    Gets the fields of a book, in the order Book() takes them. Tuples of
+    fields pickle much faster than Book objects.
+
+    Parameters:
+    - book (Book): The book.
+
+    Returns:
+    - tuple: The fields.
+    """
+    return (book.book_id, book.book_title, book.book_author, book.availability, book.reserved, book.due_return)
+
+def user_from_row(row):
+    """
+    Creates a user from a row of the user file.
+
+    Parameters:
+    - row (dict): The CSV row.
+
+    Returns:
+    - User: An Admin object for admin rows, otherwise a User object.
+    """
+    user_class = Admin if row['user_type'] == 'admin' else User
+    return user_class(row['user_name'], row['user_type'], row['user_phone'], row['user_email'], row['password'])
+
+def user_from_fields(user_name, user_type, user_phone, user_email, password):
+    """
+    Creates a user from its fields, as returned by user_fields().
+
+    Parameters:
+    - user_name (str): The name of the user.
+    - user_type (str): 'user' or 'admin'.
+    - user_phone (str): The phone number of the user.
+    - user_email (str): The email address of the user.
+    - password (str): The password of the user.
+
+    Returns:
+    - User: An Admin object for admins, otherwise a User object.
+    """
+    user_class = Admin if user_type == 'admin' else User
+    return user_class(user_name, user_type, user_phone, user_email, password)
+
+def user_fields(user):
+    """
+    Gets the fields of a user, in the order User() takes them.
+
+    Parameters:
+    - user (User): The user.
+
+    Returns:
+    - tuple: The fields.
+    """
+    return (user.user_name, user.user_type, user.user_phone, user.user_email, user.password)
+
+def user_info(user):
+    """
+    Describes a user in one line, without the password.
+
+    Parameters:
+    - user (User): The User object.
+
+    Returns:
+    - str: The user's name, type, phone and email.
+    """
+    return f"User Name: {user.user_name}, User Type: {user.user_type}, Phone: {user.user_phone}, Email: {user.user_email}"
+
+def user_to_row(user):
+    """
+    Converts a user to a row of the user file.
+
+    Parameters:
+    - user (User): The User object to convert.
+
+    Returns:
+    - dict: The CSV row.
+    """
+    return {
+        'user_name': user.user_name,
+        'user_type': user.user_type,
+        'user_phone': user.user_phone,
+        'user_email': user.user_email,
+        'password': user.password
+    }
+
+def stream_books(book_file):
+    """
+    Yields books from a book file one at a time, without loading the whole file.
+
+    Parameters:
+    - book_file (str): The CSV file to read.
+
+    Returns:
+    - Iterator[Book]: The books in the file.
+    """
+    return map(book_from_row, read_rows(book_file))
+
+def search_books(books, search_query):
+    """
+    Filters a stream of books by title or author, ignoring case.
+
+    Parameters:
+    - books (Iterable[Book]): The books to search, e.g. from stream_books().
+    - search_query (str): The text to look for.
+
+    Returns:
+    - Iterator[Book]: The matching books.
+    """
+    search_query = search_query.lower()
+    return (book for book in books if search_query in book.book_title.lower() or search_query in book.book_author.lower())
+
+def count_books(books):
+    """
+    Counts a stream of books without keeping them.
+
+    Parameters:
+    - books (Iterable[Book]): The books to count.
+
+    Returns:
+    - int: The number of books.
+    """
+    return sum(1 for _ in books)
+
+def export_books(books, path):
+    """
+    Writes a stream of books to a CSV file in the book file layout.
+
+    Parameters:
+    - books (Iterable[Book]): The books to write.
+    - path (str): The CSV file to write.
+
+    Returns:
+    - int: The number of books written.
+    """
+    count = 0
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=BOOK_FIELDS)
+        writer.writeheader()
+        for book in books:
+            writer.writerow(book_to_row(book))
+            count += 1
+    return count
+
 def load_books_from_file():
     """
     Loads books from the 'books.csv' file.
@@ -433,15 +799,7 @@ def load_books_from_file():
     Returns:
     - List[Book]: List of Book objects.
     """
-    books = []
-    try:
-        with open('books.csv', 'r') as file:
-            reader = csv.reader(file)
-            for row in reader:
-                books.append(Book(*row))
-    except FileNotFoundError:
-        pass
-    return books
+    return list(stream_books('books.csv'))
 
 def load_users_from_file():
     """
@@ -450,18 +808,7 @@ def load_users_from_file():
     Returns:
     - List[User]: List of User objects.
     """
-    users = []
-    try:
-        with open('users.csv', 'r') as file:
-            reader = csv.reader(file)
-            for row in reader:
-                if row[1] == 'user':
-                    users.append(User(*row))
-                elif row[1] == 'admin':
-                    users.append(Admin(*row))
-    except FileNotFoundError:
-        pass
-    return users
+    return [user_from_row(row) for row in read_rows('users.csv')]
 
 
 def display_menu(user, library):
@@ -488,6 +835,7 @@ def display_menu(user, library):
         print("8. View Users")
 
     print("9. Exit")
+    print("Type 'stats' to see operation timings and search cache hits.")
 
 class Library:
     """
@@ -497,24 +845,133 @@ class Library:
     - name (str): The name of the library.
     - book_file (str): The file path for book data.
     - user_file (str): The file path for user data.
+    - storage (CSVStorage or SQLiteStorage): The storage backend.
+    - search_index (SearchIndex): The title and author index used by search_books.
+    - due_index (DueDateIndex): The books with a due return date, by due date.
+    - books_by_id (dict): The books by ID. If an ID appears more than once,
+      the first book wins.
+    - users_by_name (dict): The registered users by case-folded user name.
+    - user_order (Sequence): The order the users registered in, for users_page().
+    - holds (dict): The queue of patrons waiting for each book, by book ID.
+    - ready_holds (dict): The (patron, hold expiry date) of each book on the
+      shelf and kept for a patron, by book ID.
+    - hold_expiry (TimerWheel): The expiry dates of the ready holds.
+    - inventory (Inventory): The number of books in each state, in total and per author.
+    - loan_counts (dict): The number of times each book was lent, by book ID.
+    - completions (CompletionTrie or None): The prefix index used by
+      autocomplete(); None until it is built. See start_completions().
+    - search_cache (SearchCache): The recent results of search_books().
+    - fines (FineEngine): The fines accruing on the books on loan and the
+      balances owed for books returned late.
     """
 
-    def __init__(self, name, book_file, user_file):
+    def __init__(self, name, book_file, user_file, journaled=False, storage=None, thread_safe=False, snapshot=False,
+                 durability=PER_OP, flush_interval=1.0, hold_file=None, hold_days=7, metrics=None, loan_file=None,
+                 search_cache_size=SEARCH_CACHE_SIZE, search_cache_ttl=SEARCH_CACHE_TTL, fine_file=None, fine_rules=None,
+                 borrower_file=None):
         """
         Initializes a new Library object.
 
         Parameters:
         - name (str): The name of the library.
-        - book_file (str): The file path for book data.
-        - user_file (str): The file path for user data.
+        - book_file (str or None): The file path for book data; None keeps
+          books in memory only.
+        - user_file (str or None): The file path for user data; None keeps
+          users in memory only.
+        - journaled (bool): Append each change to a journal instead of
+          rewriting the CSV files; save_books() compacts the journal.
+        - storage (CSVStorage or SQLiteStorage): The storage backend (default CSV files).
+        - thread_safe (bool): Allow the library to be shared between threads.
+          Reservations and renewals lock only the book involved; changes to
+          the catalogue, the indexes and storage are serialized by a single
+          catalogue lock, always taken after any book lock.
+        - snapshot (bool): Keep a parsed snapshot of each CSV file next to
+          it (books.csv.snapshot), and load from it instead of parsing the
+          file again while the file's size and modification time are
+          unchanged. The search index is snapshotted the same way.
+        - durability (str): When changes reach storage: write_behind.PER_OP
+          (before each call returns), INTERVAL (in groups, flush_interval
+          seconds after the first change of each group) or ON_EXIT (at
+          close() or when the program exits).
+        - flush_interval (float): The INTERVAL window, in seconds.
+        - hold_file (str or None): The file path for reservation queues;
+          None keeps them in memory only.
+        - hold_days (int): How long a returned book is kept for the next
+          patron in its queue before the hold passes on.
+        - metrics (Metrics or None): Records the calls and latencies of the
+          operations in METRIC_OPERATIONS, and the rows and bytes each table
+          reads and writes. Without it, nothing is recorded.
+        - loan_file (str or None): The file path for the number of times
+          each book was lent, which ranks autocomplete() suggestions; None
+          keeps the counts in memory only.
+        - search_cache_size (int): The number of search results kept for
+          repeated queries; 0 turns the cache off.
+        - search_cache_ttl (float or None): How long a cached search result
+          is used, in seconds, or None for no limit.
+        - fine_file (str or None): The file path for the fines members owe
+          for books returned late; None keeps them in memory only.
+        - fine_rules (dict or None): The fines.FineRule of each member type
+          (default fines.FINE_RULES).
+        - borrower_file (str or None): The file path for the borrower and
+          member type of each book on loan, which the book file does not
+          record; None keeps them in memory only, and loans loaded again
+          are then fined at the default rule and charged to nobody.
         """
         self.name = name
-        self.book_file = os.path.join(os.getcwd(), book_file)
-        self.user_file = os.path.join(os.getcwd(), user_file)
+        self.metrics = metrics
+        if metrics:
+            metrics.instrument(self, METRIC_OPERATIONS)
+        self.book_file = os.path.join(os.getcwd(), book_file) if book_file else None
+        self.user_file = os.path.join(os.getcwd(), user_file) if user_file else None
+        self.book_locks = StripedLock() if thread_safe else NO_LOCK
+        # INTERVAL flushes run on a timer thread, which must not save the
+        # catalogue while it is being changed.
+        self.catalogue_lock = threading.RLock() if thread_safe or durability == INTERVAL else NO_LOCK
+        self.snapshot = snapshot
+        self.write_behind = WriteBehind(self.flush_tables, durability, flush_interval)
+        self.storage = storage or CSVStorage(journaled)
+        self.book_store = self.storage.table('books', self.book_file, BOOK_FIELDS, 'book_id', indexes=['due_return'])
+        self.user_store = self.storage.table('users', self.user_file, USER_FIELDS, 'user_name')
+        self.hold_file = os.path.join(os.getcwd(), hold_file) if hold_file else None
+        self.hold_store = self.storage.table('holds', self.hold_file, HOLD_FIELDS, ('book_id', 'user_name'))
+        self.loan_file = os.path.join(os.getcwd(), loan_file) if loan_file else None
+        self.loan_store = self.storage.table('loans', self.loan_file, LOAN_FIELDS, 'book_id')
+        self.fine_file = os.path.join(os.getcwd(), fine_file) if fine_file else None
+        self.fine_store = self.storage.table('fines', self.fine_file, FINE_FIELDS, 'user_name')
+        self.borrower_file = os.path.join(os.getcwd(), borrower_file) if borrower_file else None
+        self.borrower_store = self.storage.table('borrowers', self.borrower_file, BORROWER_FIELDS, 'book_id')
+        if metrics:
+            for table, store in (('books', self.book_store), ('users', self.user_store), ('holds', self.hold_store),
+                                 ('loans', self.loan_store), ('fines', self.fine_store),
+                                 ('borrowers', self.borrower_store)):
+                metrics.instrument_table(table, store)
         self.books = self.load_books()
+        self.rebuild_book_directory()
         self.users = self.load_users()
-
-    
+        self.user_order = Sequence('users', len(self.users))
+        self.rebuild_user_directory()
+        self.search_index = self.build_search_index()
+        self.due_index = DueDateIndex((book, book.due_return) for book in self.books)
+        self.inventory = Inventory(self.books)
+        self.hold_days = hold_days
+        self.load_holds()
+        self.loan_counts = {row['book_id']: int(row['loans']) for row in self.loan_store.iter_rows()} if self.loan_store else {}
+        self.completions = None
+        self.search_cache = SearchCache(search_cache_size, search_cache_ttl)
+        self.fines = FineEngine(fine_rules, ((book.book_id, book.due_return) for book in self.books
+                                             if not book.availability and book.due_return))
+        if self.fine_store:
+            self.fines.balances = {row['user_name']: int(row['balance']) for row in self.fine_store.iter_rows()}
+        if self.borrower_store:
+            for row in self.borrower_store.iter_rows():
+                book = self.find_book_by_id(row['book_id'])
+                if book and not book.availability and book.due_return:
+                    self.fines.lend(book.book_id, book.due_return, row['user_name'], row['user_type'])
+        self.completion_changes = None
+        self.completions_built = None
+        if self.catalogue_lock is not NO_LOCK:
+            with self.catalogue_lock:
+                self.start_completions()
 
     def load_books(self):
         """
@@ -523,13 +980,58 @@ class Library:
         Returns:
         - List[Book]: List of Book objects.
         """
+        if self.snapshot and isinstance(self.book_store, CSVTable):
+            fields = load_snapshot(self.book_file + '.snapshot', [self.book_file, self.book_file + '.journal'],
+                                   lambda: [book_fields(book) for book in self.iter_books()], 'new.books')
+            return list(starmap(Book, fields))
+        return list(self.iter_books())
+
+    def build_search_index(self):
+        """
+        Builds the search index over the books, or restores it from its
+        snapshot when snapshots are enabled and the book file is unchanged.
+
+        Returns:
+        - SearchIndex: The index.
+        """
+        if not (self.snapshot and isinstance(self.book_store, CSVTable)):
+            return SearchIndex(self.books)
+        built = []
+
+        def build():
+            built.append(SearchIndex(self.books))
+            return built[0].state()
+
+        state = load_snapshot(self.book_file + '.index', [self.book_file, self.book_file + '.journal'],
+                              build, 'new.search_index')
+        if built:
+            return built[0]
+        index = SearchIndex()
         try:
-            with open(self.book_file, 'r') as file:
-                reader = csv.DictReader(file)
-                books = [Book(row['book_id'], row['book_title'], row['availability'], row['reserved'], row['due_return']) for row in reader]
-            return books
-        except FileNotFoundError:
-            return []
+            index.restore(self.books, state)
+        except ValueError:
+            index.rebuild(self.books)
+        return index
+
+    def iter_books(self):
+        """
+        Yields the stored books one at a time, without loading the whole
+        catalogue. Use it with search_books(), count_books() and
+        export_books() to process very large catalogues.
+
+        Returns:
+        - Iterator[Book]: The stored books.
+        """
+        if not self.book_store:
+            return iter(())
+        return map(book_from_row, self.book_store.iter_rows())
+
+    def close(self):
+        """
+        Writes any pending changes and closes the storage backend.
+        """
+        self.write_behind.close()
+        self.storage.close()
         
     def find_book_by_id(self, book_id):
         """
@@ -541,28 +1043,148 @@ class Library:
         Returns:
         - Book or None: The Book object if found, otherwise None.
         """
+        return self.books_by_id.get(book_id)
+
+    def rebuild_book_directory(self):
+        """
+        Rebuilds the directory of books by ID.
+        """
+        self.books_by_id = {}
+        # The number of other books with each repeated ID.
+        self.duplicate_ids = {}
         for book in self.books:
-            if book.book_id == book_id:
-                return book
-        return None
+            self.index_book(book)
+
+    def index_book(self, book):
+        """
+        Adds a book to the directory of books by ID.
+
+        Parameters:
+        - book (Book): The book.
+        """
+        if self.books_by_id.setdefault(book.book_id, book) is not book:
+            self.duplicate_ids[book.book_id] = self.duplicate_ids.get(book.book_id, 0) + 1
+
+    def unindex_book(self, book):
+        """
+        Removes a book that was deleted from the directory of books by ID.
+        If its ID was repeated, the next book with it takes its place.
+
+        Parameters:
+        - book (Book): The book, already removed from the book list.
+        """
+        book_id = book.book_id
+        others = self.duplicate_ids.pop(book_id, 0)
+        if not others:
+            del self.books_by_id[book_id]
+            return
+        if others > 1:
+            self.duplicate_ids[book_id] = others - 1
+        if self.books_by_id[book_id] is book:
+            # IDs are only repeated by hand-edited files, so this scan is rare.
+            self.books_by_id[book_id] = next(other for other in self.books if other.book_id == book_id)
 
-    
-        
     def load_users(self):
         """
-        Loads users from the CSV file.
+        Loads users from storage.
 
         Returns:
         - List[User]: List of User objects.
         """
-        try:
-            with open(self.user_file, 'r') as file:
-                reader = csv.DictReader(file)
-                users = [User(row['user_name'], row['user_type'], row['user_phone'], row['user_email'], row['password']) for row in reader]
-            return users
-        except FileNotFoundError:
+        if not self.user_store:
             return []
-        
+        if self.snapshot and isinstance(self.user_store, CSVTable):
+            fields = load_snapshot(self.user_file + '.snapshot', [self.user_file, self.user_file + '.journal'],
+                                   lambda: [user_fields(user_from_row(row)) for row in self.user_store.iter_rows()],
+                                   'new.users')
+            return list(starmap(user_from_fields, fields))
+        return [user_from_row(row) for row in self.user_store.iter_rows()]
+
+    def rebuild_user_directory(self):
+        """
+        Rebuilds the directory of users by case-folded user name. If a name
+        appears more than once in the user file, the first user wins.
+        """
+        self.users_by_name = {}
+        for user in self.users:
+            self.users_by_name.setdefault(user.user_name.casefold(), user)
+
+    def find_user(self, user_name):
+        """
+        Finds a registered user by name, ignoring case.
+
+        Parameters:
+        - user_name (str): The user name.
+
+        Returns:
+        - User or None: The User object if found, otherwise None.
+        """
+        return self.users_by_name.get(user_name.casefold())
+
+    def add_user(self, user):
+        """
+        Adds a registered user to the library.
+
+        Parameters:
+        - user (User): The User object to add.
+
+        Returns:
+        - bool: True if added, False if the user name (ignoring case) is already taken.
+        """
+        key = user.user_name.casefold()
+        with self.catalogue_lock:
+            if key in self.users_by_name:
+                return False
+            self.users.append(user)
+            self.user_order.append()
+            self.users_by_name[key] = user
+            self.record_user('add', user)
+            return True
+
+    def users_page(self, cursor=None, limit=PAGE_SIZE):
+        """
+        Gets a page of the registered users, in the order they registered.
+        A cursor stays valid while the library runs, whatever is added.
+
+        Parameters:
+        - cursor (str or None): The cursor returned with the previous page,
+          or None for the first page.
+        - limit (int): The most users on the page.
+
+        Returns:
+        - Tuple[List[User], str or None]: The users, and the cursor of the
+          next page, or None after the last page.
+
+        Raises:
+        - ValueError: If the cursor is not a cursor of the users.
+        """
+        with self.catalogue_lock:
+            return self.user_order.page(self.users, cursor, limit)
+
+    def record_user(self, op, user):
+        """
+        Persists a single change to a user, or leaves it for the next group
+        write, as the durability setting says.
+
+        Parameters:
+        - op (str): 'add', 'update' or 'delete'.
+        - user (User): The User object that changed.
+        """
+        if not self.user_store:
+            return
+        if self.write_behind.deferred:
+            self.write_behind.changed('users')
+        elif self.user_store.record(op, user_to_row(user)):
+            self.save_users()
+
+    def save_users(self):
+        """
+        Saves users to storage.
+        """
+        if self.user_store:
+            with self.catalogue_lock:
+                self.user_store.save(user_to_row(user) for user in self.users)
+
     def add_book(self, book):
         """
         Adds a book to the library.
@@ -570,8 +1192,140 @@ class Library:
         Parameters:
         - book (Book): The Book object to add.
         """
-        self.books.append(book)
-        self.save_books()
+        with self.book_locks.hold(book.book_id), self.catalogue_lock:
+            self.books.append(book)
+            self.index_book(book)
+            self.search_index.add(book)
+            self.due_index.set(book, book.due_return)
+            self.inventory.add(book)
+            entry = self.search_index.entry(book)
+            self.change_completions('add', entry)
+            self.search_cache.invalidate(entry[1], entry[2])
+            if not book.availability and book.due_return:
+                self.fines.lend(book.book_id, book.due_return)
+            self.record_book('add', book)
+
+    def add_books(self, books):
+        """
+        Adds many books to the library at once, with a single write to storage.
+
+        Parameters:
+        - books (List[Book]): The Book objects to add.
+        """
+        with self.book_locks.hold(*[book.book_id for book in books]), self.catalogue_lock:
+            # Checking a large batch against every cached query costs more
+            # than searching again.
+            if len(books) > len(self.search_cache):
+                self.search_cache.clear()
+            # So is adding a large batch to the autocomplete() trie one book
+            # at a time, compared with building it again.
+            rebuild = len(books) > max(1000, len(self.books) // 8)
+            if rebuild:
+                self.completions = self.completion_changes = None
+            for book in books:
+                self.books.append(book)
+                self.index_book(book)
+                self.search_index.add(book)
+                self.due_index.set(book, book.due_return)
+                self.inventory.add(book)
+                entry = self.search_index.entry(book)
+                self.change_completions('add', entry)
+                self.search_cache.invalidate(entry[1], entry[2])
+                if not book.availability and book.due_return:
+                    self.fines.lend(book.book_id, book.due_return)
+            if rebuild and self.catalogue_lock is not NO_LOCK:
+                self.start_completions()
+            if not (self.book_store and books):
+                return
+            if self.write_behind.deferred:
+                self.write_behind.changed('books')
+            elif self.book_store.record_many('add', [book_to_row(book) for book in books]):
+                self.save_books()
+
+    def delete_book(self, book_id):
+        """
+        Deletes a book from the library.
+
+        Parameters:
+        - book_id (str): The ISBN of the book to delete.
+
+        Returns:
+        - bool: True if the book was found and deleted.
+        """
+        with self.book_locks.hold(book_id), self.catalogue_lock:
+            book = self.find_book_by_id(book_id)
+            if not book:
+                return False
+            self.books.remove(book)
+            self.unindex_book(book)
+            entry = self.search_index.entry(book)
+            self.change_completions('remove', entry)
+            self.search_cache.invalidate(entry[1], entry[2])
+            self.search_index.remove(book)
+            self.due_index.remove(book)
+            if self.fines.borrower_of(book_id) is not None:
+                self.record_borrower('delete', book_id)
+            self.fines.forget(book_id)
+            self.inventory.remove(book)
+            holds = self.drop_holds(book_id)
+            self.record_book('delete', book)
+            self.record_holds('delete', holds)
+            return True
+
+    def save_book(self, book):
+        """
+        Saves a change to a single book.
+
+        Parameters:
+        - book (Book): The Book object that changed.
+        """
+        with self.catalogue_lock:
+            self.due_index.set(book, book.due_return)
+            self.inventory.update(book)
+            self.record_book('update', book)
+
+    def record_book(self, op, book):
+        """
+        Persists a single change to a book, saving all books if the storage
+        backend asks for it, or leaves it for the next group write, as the
+        durability setting says.
+
+        Parameters:
+        - op (str): 'add', 'update' or 'delete'.
+        - book (Book): The Book object that changed.
+        """
+        if not self.book_store:
+            return
+        if self.write_behind.deferred:
+            self.write_behind.changed('books')
+        elif self.book_store.record(op, book_to_row(book)):
+            self.save_books()
+
+    def flush_tables(self, tables):
+        """
+        Writes a group of changes, saving each changed table once.
+
+        Parameters:
+        - tables (Set[str]): The changed tables: 'books', 'users', 'holds', 'loans', 'fines' and/or 'borrowers'.
+        """
+        if 'books' in tables:
+            self.save_books()
+        if 'users' in tables:
+            self.save_users()
+        if 'holds' in tables:
+            self.save_holds()
+        if 'loans' in tables:
+            self.save_loan_counts()
+        if 'fines' in tables:
+            self.save_fines()
+        if 'borrowers' in tables:
+            self.save_borrowers()
+
+    def flush(self):
+        """
+        Writes any pending changes now.
+        """
+        self.write_behind.flush()
 
     def add_member(self, member):
         """
@@ -579,33 +1333,595 @@ class Library:
 
         Parameters:
         - member (User): The User object to add.
+
+        Returns:
+        - bool: True if added, False if the user name is already taken.
         """
-        self.members.append(member)
-        self.save_members()
+        return self.add_user(member)
 
     def save_books(self):
         """
-        Saves books to the CSV file.
+        Saves books to storage.
         """
+        if not self.book_store:
+            return
         try:
-            with open(self.book_file, 'w', newline='') as file:
-                fieldnames = ['book_id', 'book_title', 'availability', 'reserved', 'due_return']
-                writer = csv.DictWriter(file, fieldnames=fieldnames)
-                writer.writeheader()
-                for book in self.books:
-                    writer.writerow({
-                        'book_id': book.book_id,
-                        'book_title': book.book_title,
-                        'availability': book.availability,
-                        'reserved': book.reserved,
-                        'due_return': book.due_return.strftime('%Y-%m-%d') if book.due_return else ''
-                    })
+            with self.catalogue_lock:
+                self.book_store.save(book_to_row(book) for book in self.books)
         except Exception as e:
             print(f"Error saving books: {e}")
 
+    def reserve_book(self, book_id, user_name=None, as_of=None):
+        """
+        Reserves a book for a patron. If the book is on the shelf it is kept
+        for them for hold_days; otherwise they join the back of its queue,
+        and the book is kept for them when their turn comes.
+
+        Without a patron, the book is only marked as reserved, and only if
+        it is on the shelf and not already reserved. A book marked that way
+        is kept for nobody in particular, so patrons cannot queue for it
+        until the mark is lifted; nor can a patron queue for a book they
+        have on loan themselves.
+
+        Parameters:
+        - book_id (str): The ISBN of the book to reserve.
+        - user_name (str or None): The patron.
+        - as_of (date): The date of the reservation (default today).
+
+        Returns:
+        - Tuple[str, Book or None]: The status (OK, WAITLISTED, NOT_FOUND,
+          ALREADY_RESERVED, or NOT_AVAILABLE if the patron has the book on
+          loan or, without a patron, if it is on loan) and the book, if found.
+        """
+        self.expire_holds(as_of)
+        # The checks and the reservation must not be split by another
+        # reservation of the same book.
+        with self.book_locks.hold(book_id):
+            book = self.find_book_by_id(book_id)
+            if not book:
+                return NOT_FOUND, None
+            if user_name is None:
+                if not book.availability:
+                    return NOT_AVAILABLE, book
+                if book.reserved:
+                    return ALREADY_RESERVED, book
+                book.reserved = True
+                self.save_book(book)
+                return OK, book
+            if self.hold_position(book_id, user_name) is not None:
+                return ALREADY_RESERVED, book
+            if book.availability and book.reserved and book_id not in self.ready_holds:
+                return ALREADY_RESERVED, book
+            if not book.availability:
+                with self.catalogue_lock:
+                    if self.fines.borrower_of(book_id) == user_name:
+                        return NOT_AVAILABLE, book
+            if book.availability and not book.reserved:
+                self.start_hold(book, user_name, 'add', as_of)
+                return OK, book
+            self.holds.setdefault(book_id, HoldQueue()).join(user_name)
+            self.record_hold('add', book_id, user_name)
+            return WAITLISTED, book
+
+    def hold_position(self, book_id, user_name):
+        """
+        Gets a patron's place in the queue for a book.
+
+        Parameters:
+        - book_id (str): The ISBN of the book.
+        - user_name (str): The patron.
+
+        Returns:
+        - int or None: 0 if the book is being kept for the patron, their
+          position in the queue (1 for the front), or None if they have no hold.
+        """
+        ready = self.ready_holds.get(book_id)
+        if ready and ready[0] == user_name:
+            return 0
+        queue = self.holds.get(book_id)
+        return queue.position(user_name) if queue else None
+
+    def cancel_reservation(self, book_id, user_name, as_of=None):
+        """
+        Cancels a patron's hold on a book. If the book was being kept for
+        them, it passes to the next patron in the queue.
+
+        Parameters:
+        - book_id (str): The ISBN of the book.
+        - user_name (str): The patron.
+        - as_of (date): The date of the cancellation (default today).
+
+        Returns:
+        - bool: True if the patron had a hold.
+        """
+        with self.book_locks.hold(book_id):
+            ready = self.ready_holds.get(book_id)
+            if ready and ready[0] == user_name:
+                del self.ready_holds[book_id]
+                self.record_hold('delete', book_id, user_name)
+                book = self.find_book_by_id(book_id)
+                if book:
+                    self.promote_hold(book, as_of)
+                return True
+            queue = self.holds.get(book_id)
+            if not (queue and queue.cancel(user_name)):
+                return False
+            if not queue:
+                del self.holds[book_id]
+            self.record_hold('delete', book_id, user_name)
+            return True
+
+    def check_out_book(self, book_id, user_name, loan_days=14, as_of=None, user_type=None):
+        """
+        Lends a book to a patron. A book being kept for a patron can only be
+        lent to them, which fulfils their hold.
+
+        Parameters:
+        - book_id (str): The ISBN of the book.
+        - user_name (str): The patron.
+        - loan_days (int): The length of the loan, in days.
+        - as_of (date): The date of the loan (default today).
+        - user_type (str or None): The patron's member type, which sets the
+          fine rule of the loan, for a library that does not hold its users;
+          None looks the patron up.
+
+        Returns:
+        - Tuple[str, Book or None]: The status (OK, NOT_FOUND or
+          NOT_AVAILABLE) and the book, if found.
+        """
+        self.expire_holds(as_of)
+        with self.book_locks.hold(book_id):
+            book = self.find_book_by_id(book_id)
+            if not book:
+                return NOT_FOUND, None
+            ready = self.ready_holds.get(book_id)
+            if not book.availability or (book.reserved and not (ready and ready[0] == user_name)):
+                return NOT_AVAILABLE, book
+            if ready:
+                del self.ready_holds[book_id]
+                self.record_hold('delete', book_id, ready[0])
+            book.availability = False
+            book.reserved = False
+            book.due_return = (as_of or date.today()) + timedelta(days=loan_days)
+            self.save_book(book)
+            self.count_loan(book)
+            with self.catalogue_lock:
+                if user_type is None:
+                    user = self.find_user(user_name)
+                    user_type = user.user_type if user else DEFAULT_MEMBER_TYPE
+                self.fines.lend(book_id, book.due_return, user_name, user_type)
+                self.record_borrower('add', book_id, user_name, user_type)
+            return OK, book
+
+    def count_loan(self, book):
+        """
+        Counts a loan of a book, which moves it up the autocomplete() suggestions.
+
+        Parameters:
+        - book (Book): The book lent.
+        """
+        with self.catalogue_lock:
+            loans = self.loan_counts[book.book_id] = self.loan_counts.get(book.book_id, 0) + 1
+            self.change_completions('update', self.search_index.entry(book))
+            if not self.loan_store:
+                return
+            if self.write_behind.deferred:
+                self.write_behind.changed('loans')
+            elif self.loan_store.record('add' if loans == 1 else 'update', {'book_id': book.book_id, 'loans': loans}):
+                self.save_loan_counts()
+
+    def save_loan_counts(self):
+        """
+        Saves the loan counts to storage.
+        """
+        if self.loan_store:
+            with self.catalogue_lock:
+                self.loan_store.save([{'book_id': book_id, 'loans': loans} for book_id, loans in self.loan_counts.items()])
+
+    def assess_fines(self, as_of=None):
+        """
+        Works out the fines of all the books on loan, in one pass; run it
+        nightly. Until the next run, loans, renewals and returns keep the
+        totals up to date.
+
+        Parameters:
+        - as_of (date): The date to fine up to (default today).
+
+        Returns:
+        - dict: The number of loans, the number overdue (with a fine) and
+          the total of their fines, in cents.
+        """
+        with self.catalogue_lock:
+            return self.fines.assess((as_of or date.today()).toordinal())
+
+    def fines_of(self, user_name):
+        """
+        Gets what a member owes in fines.
+
+        Parameters:
+        - user_name (str): The member.
+
+        Returns:
+        - dict: 'owed', the fines for books returned late, and 'accruing',
+          the fines on books still on loan as of the last assessment, in cents.
+        """
+        with self.catalogue_lock:
+            return {'owed': self.fines.balances.get(user_name, 0), 'accruing': self.fines.accrued.get(user_name, 0)}
+
+    def pay_fine(self, user_name, amount):
+        """
+        Pays off some of the fines a member owes for books returned late.
+
+        Parameters:
+        - user_name (str): The member.
+        - amount (int): The amount paid, in cents; anything over what is owed is not taken.
+
+        Returns:
+        - Tuple[int, int]: The amount taken and the amount still owed, in cents.
+
+        Raises:
+        - ValueError: If the amount is not positive.
+        """
+        with self.catalogue_lock:
+            before = self.fines.balances.get(user_name, 0)
+            paid, owed = self.fines.pay(user_name, amount)
+            if paid:
+                self.record_balance(user_name, before)
+            return paid, owed
+
+    def record_balance(self, user_name, before):
+        """
+        Persists a change to what a member owes, or leaves it for the next
+        group write, as the durability setting says. The caller holds the
+        catalogue lock.
+
+        Parameters:
+        - user_name (str): The member.
+        - before (int): What the member owed before the change, in cents.
+        """
+        if not self.fine_store:
+            return
+        balance = self.fines.balances.get(user_name, 0)
+        op = 'add' if not before else 'delete' if not balance else 'update'
+        if self.write_behind.deferred:
+            self.write_behind.changed('fines')
+        elif self.fine_store.record(op, {'user_name': user_name, 'balance': balance}):
+            self.save_fines()
+
+    def save_fines(self):
+        """
+        Saves what members owe in fines to storage.
+        """
+        if self.fine_store:
+            with self.catalogue_lock:
+                self.fine_store.save([{'user_name': user_name, 'balance': balance}
+                                      for user_name, balance in self.fines.balances.items()])
+
+    def record_borrower(self, op, book_id, user_name='', user_type=''):
+        """
+        Persists the borrower of a loan as it starts ('add') or ends
+        ('delete'), or leaves it for the next group write, as the durability
+        setting says. The caller holds the catalogue lock.
+
+        Parameters:
+        - op (str): 'add' or 'delete'.
+        - book_id (str): The ISBN of the book on loan.
+        - user_name (str): The borrower.
+        - user_type (str): The borrower's member type.
+        """
+        if not self.borrower_store:
+            return
+        if self.write_behind.deferred:
+            self.write_behind.changed('borrowers')
+        elif self.borrower_store.record(op, {'book_id': book_id, 'user_name': user_name, 'user_type': user_type}):
+            self.save_borrowers()
+
+    def save_borrowers(self):
+        """
+        Saves the borrowers of the books on loan to storage.
+        """
+        if self.borrower_store:
+            with self.catalogue_lock:
+                self.borrower_store.save([{'book_id': book_id, 'user_name': user_name, 'user_type': user_type}
+                                          for book_id, user_name, user_type in self.fines.borrowed()])
+
+    def return_book(self, book_id, as_of=None):
+        """
+        Takes back a book on loan, charging any fine to its borrower. If
+        patrons are waiting for it, it is kept for the first of them.
+
+        Parameters:
+        - book_id (str): The ISBN of the book.
+        - as_of (date): The date of the return (default today).
+
+        Returns:
+        - Tuple[str, Book or None]: The status (OK, NOT_FOUND or
+          NOT_CHECKED_OUT) and the book, if found.
+        """
+        self.expire_holds(as_of)
+        with self.book_locks.hold(book_id):
+            book = self.find_book_by_id(book_id)
+            if not book:
+                return NOT_FOUND, None
+            if book.availability:
+                return NOT_CHECKED_OUT, book
+            book.availability = True
+            book.due_return = None
+            with self.catalogue_lock:
+                user_name, fine = self.fines.settle(book_id, (as_of or date.today()).toordinal())
+                if user_name is not None:
+                    self.record_borrower('delete', book_id)
+                if user_name is not None and fine:
+                    self.record_balance(user_name, self.fines.balances[user_name] - fine)
+            self.promote_hold(book, as_of)
+            return OK, book
+
+    def start_hold(self, book, user_name, op, as_of=None):
+        """
+        Keeps a book on the shelf for a patron until the hold expires. The
+        caller holds the book's lock.
+
+        Parameters:
+        - book (Book): The book, which is on the shelf.
+        - user_name (str): The patron.
+        - op (str): 'add' for a new hold, 'update' for a patron promoted from the queue.
+        - as_of (date): The start of the hold (default today).
+        """
+        until = (as_of or date.today()) + timedelta(days=self.hold_days)
+        self.ready_holds[book.book_id] = (user_name, until)
+        with self.catalogue_lock:
+            self.hold_expiry.schedule(until.toordinal(), (book.book_id, user_name, until))
+        book.reserved = True
+        self.save_book(book)
+        self.record_hold(op, book.book_id, user_name, until)
+
+    def promote_hold(self, book, as_of=None):
+        """
+        Keeps a book on the shelf for the next patron in its queue, or
+        releases it if nobody is waiting. The caller holds the book's lock.
+
+        Parameters:
+        - book (Book): The book, which is on the shelf.
+        - as_of (date): The start of the new hold (default today).
+        """
+        queue = self.holds.get(book.book_id)
+        user_name = queue.pop() if queue else None
+        if queue is not None and not queue:
+            del self.holds[book.book_id]
+        if user_name is None:
+            book.reserved = False
+            self.save_book(book)
+        else:
+            self.start_hold(book, user_name, 'update', as_of)
+
+    def expire_holds(self, as_of=None):
+        """
+        Passes on the holds of books kept for patrons who did not collect
+        them in time. Only the holds due to expire are visited.
+
+        Parameters:
+        - as_of (date): The date to check against (default today).
+
+        Returns:
+        - List[Tuple[str, str]]: The (book ID, patron) of each expired hold.
+        """
+        as_of = as_of or date.today()
+        with self.catalogue_lock:
+            due = self.hold_expiry.advance(as_of.toordinal())
+        expired = []
+        for book_id, user_name, until in due:
+            with self.book_locks.hold(book_id):
+                # Holds collected or cancelled since are left in the wheel.
+                if self.ready_holds.get(book_id) != (user_name, until):
+                    continue
+                del self.ready_holds[book_id]
+                self.record_hold('delete', book_id, user_name)
+                expired.append((book_id, user_name))
+                book = self.find_book_by_id(book_id)
+                if book:
+                    self.promote_hold(book, as_of)
+        return expired
+
+    def drop_holds(self, book_id):
+        """
+        Forgets the ready hold and the queue of a book that was deleted,
+        taking its hold's expiry out of the timer wheel. The caller holds
+        the book's lock and the catalogue lock.
+
+        Parameters:
+        - book_id (str): The ISBN of the book.
+
+        Returns:
+        - List[dict]: The holds table rows of the dropped holds.
+        """
+        rows = []
+        ready = self.ready_holds.pop(book_id, None)
+        if ready:
+            user_name, until = ready
+            self.hold_expiry.cancel(until.toordinal(), (book_id, user_name, until))
+            rows.append({'book_id': book_id, 'user_name': user_name, 'ready_until': until.isoformat()})
+        for user_name in self.holds.pop(book_id, ()):
+            rows.append({'book_id': book_id, 'user_name': user_name, 'ready_until': ''})
+        return rows
+
+    def load_holds(self):
+        """
+        Loads the reservation queues and ready holds from storage.
+        """
+        self.holds = {}
+        self.ready_holds = {}
+        self.hold_expiry = TimerWheel(0)
+        if not self.hold_store:
+            return
+        for row in self.hold_store.iter_rows():
+            if row['ready_until']:
+                until = parse_date(row['ready_until'])
+                self.ready_holds[row['book_id']] = (row['user_name'], until)
+                self.hold_expiry.schedule(until.toordinal(), (row['book_id'], row['user_name'], until))
+            else:
+                self.holds.setdefault(row['book_id'], HoldQueue()).join(row['user_name'])
+
+    def hold_rows(self):
+        """
+        Yields the rows of the holds table: for each book, the ready hold
+        first, then the queue in order.
+
+        Returns:
+        - Iterator[dict]: The rows.
+        """
+        for book_id in list(self.ready_holds.keys() | self.holds.keys()):
+            ready = self.ready_holds.get(book_id)
+            if ready:
+                yield {'book_id': book_id, 'user_name': ready[0], 'ready_until': ready[1].isoformat()}
+            for user_name in self.holds.get(book_id, ()):
+                yield {'book_id': book_id, 'user_name': user_name, 'ready_until': ''}
+
+    def record_hold(self, op, book_id, user_name, ready_until=None):
+        """
+        Persists a single change to a hold, or leaves it for the next group
+        write, as the durability setting says.
+
+        Parameters:
+        - op (str): 'add', 'update' or 'delete'.
+        - book_id (str): The ISBN of the book.
+        - user_name (str): The patron.
+        - ready_until (date or None): The expiry of a ready hold.
+        """
+        if not self.hold_store:
+            return
+        if self.write_behind.deferred:
+            self.write_behind.changed('holds')
+            return
+        row = {'book_id': book_id, 'user_name': user_name, 'ready_until': ready_until.isoformat() if ready_until else ''}
+        with self.catalogue_lock:
+            if self.hold_store.record(op, row):
+                self.save_holds()
+
+    def record_holds(self, op, rows):
+        """
+        Persists the same change to several holds in one write, or leaves
+        it for the next group write, as the durability setting says.
+
+        Parameters:
+        - op (str): 'add', 'update' or 'delete'.
+        - rows (List[dict]): The holds table rows that changed.
+        """
+        if not (self.hold_store and rows):
+            return
+        if self.write_behind.deferred:
+            self.write_behind.changed('holds')
+            return
+        with self.catalogue_lock:
+            if self.hold_store.record_many(op, rows):
+                self.save_holds()
+
+    def save_holds(self):
+        """
+        Saves the reservation queues and ready holds to storage.
+        """
+        if self.hold_store:
+            with self.catalogue_lock:
+                self.hold_store.save(list(self.hold_rows()))
+
+    def renew_book(self, book_id, loan_days=14):
+        """
+        Renews a book that is on loan, moving its due date on.
+
+        Parameters:
+        - book_id (str): The ISBN of the book to renew.
+        - loan_days (int): The number of days to add to the due date.
+
+        Returns:
+        - Tuple[str, Book or None]: The status (OK, NOT_FOUND or NOT_RENEWABLE)
+          and the book, if found.
+        """
+        with self.book_locks.hold(book_id):
+            book = self.find_book_by_id(book_id)
+            if not book:
+                return NOT_FOUND, None
+            if book.availability or not book.due_return:
+                return NOT_RENEWABLE, book
+            book.due_return += timedelta(days=loan_days)
+            self.save_book(book)
+            with self.catalogue_lock:
+                self.fines.renew(book_id, book.due_return)
+            return OK, book
+
+    def overdue_books(self, as_of=None):
+        """
+        Finds the books that are overdue, without scanning the whole catalogue.
+
+        Parameters:
+        - as_of (date): The date to check against (default today).
+
+        Returns:
+        - List[Book]: The overdue books, earliest due date first.
+        """
+        as_of = as_of or date.today()
+        return [book for due_return, book in self.due_index.overdue(as_of)]
+
+    def books_due_within(self, days, as_of=None):
+        """
+        Finds the books that fall due in the next few days.
+
+        Parameters:
+        - days (int): The number of days to look ahead.
+        - as_of (date): The start of the period (default today).
+
+        Returns:
+        - List[Book]: The books due in the period, earliest due date first.
+        """
+        as_of = as_of or date.today()
+        return [book for due_return, book in self.due_index.due_between(as_of, as_of + timedelta(days=days))]
+
+    def inventory_counts(self, author=None, as_of=None):
+        """
+        Counts the books in each state, for the whole library or one author,
+        from counters kept up to date as books change.
+
+        Parameters:
+        - author (str or None): The author, or None for the whole library.
+        - as_of (date): The date overdue loans are counted at (default today).
+
+        Returns:
+        - dict: The number of books in total, available, reserved, on_loan and overdue.
+        """
+        with self.catalogue_lock:
+            return self.inventory.counts(author, as_of)
+
+    def inventory_by_author(self, as_of=None):
+        """
+        Counts the books in each state for every author.
+
+        Parameters:
+        - as_of (date): The date overdue loans are counted at (default today).
+
+        Returns:
+        - dict: The counts of each author (see inventory_counts()), by author.
+        """
+        with self.catalogue_lock:
+            return self.inventory.by_author(as_of)
+
+    def check_inventory(self, as_of=None):
+        """
+        Recounts every book and compares the result with the inventory
+        counters. This visits the whole catalogue; it is meant for tests
+        and troubleshooting.
+
+        Parameters:
+        - as_of (date): The date overdue loans are counted at (default today).
+
+        Returns:
+        - List[str]: A description of each counter that is wrong; empty if all are right.
+        """
+        with self.catalogue_lock:
+            return self.inventory.verify(self.books, as_of)
+
     def search_books(self, search_query):
         """
-        Searches for books based on a search query.
+        Searches for books whose title or author contains the search query,
+        ignoring case, or which contain every word of the query. Repeated
+        queries are answered from the search cache.
 
         Parameters:
         - search_query (str): The search query.
@@ -613,19 +1929,150 @@ class Library:
         Returns:
         - List[Book]: List of matching Book objects.
         """
-        matching_books = [book for book in self.books if search_query.lower() in book.book_title.lower()]
+        query = normalize(search_query)
+        with self.catalogue_lock:
+            books = self.search_cache.get(query)
+            if books is None:
+                books = self.search_index.search(query)
+                self.search_cache.put(query, books)
+            return list(books)
+
+    def search_cache_stats(self):
+        """
+        Gets the hit and miss counts of the search cache.
+
+        Returns:
+        - dict: See SearchCache.stats().
+        """
+        with self.catalogue_lock:
+            return self.search_cache.stats()
 
-        return matching_books
+    def autocomplete(self, prefix, limit=MAX_COMPLETIONS):
+        """
+        Suggests the most borrowed books whose title or author starts with
+        what has been typed so far, ignoring case.
+
+        Parameters:
+        - prefix (str): The text typed so far; a trailing space means the last word is complete.
+        - limit (int): The largest number of suggestions, at most MAX_COMPLETIONS.
+
+        Returns:
+        - List[Tuple[int, Book]]: The loan count and the book of each suggestion, most
+          borrowed first, then by title.
+        """
+        while True:
+            with self.catalogue_lock:
+                if self.completions is None and self.completion_changes is None:
+                    # Nothing is building it: a library without a catalogue
+                    # lock has a single thread, so nothing waits while it is
+                    # built on the first call.
+                    self.completions = CompletionTrie(self.search_index.entries.values(), self.loans_of)
+                if self.completions is not None:
+                    return [(self.loans_of(entry[0]), entry[0]) for entry in self.completions.complete(prefix, limit)]
+                built = self.completions_built
+            built.wait()
+
+    def loans_of(self, book):
+        """
+        Gets the number of times a book was lent.
+
+        Parameters:
+        - book (Book): The book.
+
+        Returns:
+        - int: The loan count.
+        """
+        return self.loan_counts.get(book.book_id, 0)
+
+    def start_completions(self):
+        """
+        Starts building the trie autocomplete() answers from, on a thread
+        of its own, so that building it over a large catalogue never holds
+        up other calls. A library with a catalogue lock starts as soon as it
+        is loaded, and again after a large batch of books is added. Called
+        under the catalogue lock.
+        """
+        self.completions = None
+        # The changes made while the trie is built, passed on to it once it
+        # is; the list also tells a build whether a newer one replaced it.
+        self.completion_changes = []
+        self.completions_built = threading.Event()
+        entries = list(self.search_index.entries.values())
+        threading.Thread(target=self.build_completions, args=(entries, self.completion_changes, self.completions_built),
+                         name='completions', daemon=True).start()
+
+    def build_completions(self, entries, changes, built):
+        """
+        Builds the autocomplete() trie without holding the catalogue lock,
+        and puts it in place with the changes made meanwhile, unless a newer
+        build was started.
+
+        Parameters:
+        - entries (List[tuple]): The (book, title, author) entries when the build started.
+        - changes (List[Tuple[str, tuple]]): The queue of changes made since.
+        - built (threading.Event): Set once the build is over, for autocomplete() to wait on.
+        """
+        try:
+            trie = CompletionTrie(entries, self.loans_of)
+            with self.catalogue_lock:
+                if self.completion_changes is changes:
+                    for change, entry in changes:
+                        getattr(trie, change)(entry)
+                    self.completion_changes = None
+                    self.completions = trie
+        except BaseException:
+            # autocomplete() then builds the trie itself, and raises the error.
+            with self.catalogue_lock:
+                if self.completion_changes is changes:
+                    self.completion_changes = None
+            raise
+        finally:
+            built.set()
+
+    def change_completions(self, change, entry):
+        """
+        Passes a change to the catalogue or to a loan count on to the
+        autocomplete() trie, or queues it while the trie is being built.
+        Called under the catalogue lock.
+
+        Parameters:
+        - change (str): 'add', 'remove' or 'update', the CompletionTrie method to call.
+        - entry (tuple): The book's (book, title, author) entry.
+        """
+        if self.completions is not None:
+            getattr(self.completions, change)(entry)
+        elif self.completion_changes is not None:
+            self.completion_changes.append((change, entry))
+
+    def fuzzy_search_books(self, search_query, max_distance=None, limit=20, budget=FUZZY_BUDGET):
+        """
+        Searches for books with a close match for every word of the search
+        query in their title or author, forgiving a few typos per word.
+
+        Parameters:
+        - search_query (str): The search query.
+        - max_distance (int or None): A cap on the typos forgiven per word, or None for the default.
+        - limit (int): The largest number of results.
+        - budget (float or None): The most time to spend checking candidates, in seconds,
+          or None for no limit.
+
+        Returns:
+        - List[Tuple[int, Book]]: The number of typos and the book of each result, fewest typos first.
+        """
+        with self.catalogue_lock:
+            return self.search_index.fuzzy_search(search_query, max_distance, limit, budget)
     
         
 def main():
     """
     Main function to run the library system.
     """
-    library = Library("My Library", "books.csv", "users.csv")
-    users = load_users_from_file()
-    books = load_books_from_file()
-    user = None 
+    # The library parses each file once, or loads its snapshot, and the
+    # menu works on the library's books and users from then on.
+    library = Library("My Library", "books.csv", "users.csv", snapshot=True, durability=INTERVAL, hold_file="holds.csv",
+                      metrics=Metrics(), loan_file="loans.csv", fine_file="fines.csv",
+                      borrower_file="borrowers.csv")
+    user = None
 
     while True:
         display_menu(user, library)
@@ -644,17 +2091,20 @@ def main():
             elif user_type.lower() == 'admin':
                 user = Admin(user_name, user_type, user_phone, user_email, password)
 
-            user.register()
-            users.append(user)
+            else:
+                print("Invalid user type. Please enter 'user' or 'admin'.")
+                continue
+
+            if not user.register(library):
+                user = None
         elif choice == '2':
             user_name = input("Enter your name: ")
             entered_password = input("Enter your password: ")
 
-            # Find the user in the list of registered users
-            matching_users = [u for u in users if u.user_name == user_name]
+            # Find the user in the directory of registered users
+            user = library.find_user(user_name)
 
-            if matching_users:
-                user = matching_users[0]
+            if user:
                 isCorrect = user.login(entered_password)
                 if not isCorrect:
                     user = None
@@ -687,9 +2137,16 @@ def main():
             user.delete_book(library)
         elif choice == '8' and isinstance(user, Admin):
             user.view_users(library)
+        elif choice == 'stats':
+            print(library.metrics.report())
+            stats = library.search_cache_stats()
+            hit_rate = '-' if stats['hit_rate'] is None else f"{100 * stats['hit_rate']:.1f}%"
+            print(f"\nSearch cache: {stats['size']}/{stats['max_size']} results, {stats['hits']} hits, "
+                  f"{stats['misses']} misses ({hit_rate} hit rate), {stats['invalidations']} invalidated, "
+                  f"{stats['evictions']} evicted, {stats['expirations']} expired")
         elif choice == '9':
+            # Pending changes are written by the library's exit hook.
             print("Exiting program. Thank you!")
-            library.save_books()
             break
         else:
             print("Invalid choice. Please enter a number between 1 and 9.")
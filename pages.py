@@ -0,0 +1,283 @@
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import compress, islice
+
+# The number of records the menus show before asking whether to go on.
+PAGE_SIZE = 20
+
+# The number of lines written to the terminal or a file at a time by
+# write_lines(); one large write costs about as much as one short one.
+BLOCK_LINES = 1000
+
+class Sequence:
+    """
+    Represents the order in which the items of a list were added, kept
+    alongside the list, so a listing can carry on after the last item it
+    showed however the list changed in between.
+
+    Each item gets the next sequence number when it is added, and the
+    numbers are kept in a compact array in the same order as the list. As
+    items are only ever appended, the array stays sorted, and the first
+    item of the next page is found by binary search for the last number
+    shown. Removing earlier items does not shift the listing, items added
+    since appear at its end, and the last item shown need not still exist.
+
+    The list's owner calls append(), extend() and remove() whenever it
+    changes the list.
+
+    Attributes:
+    - name (str): The name of the list, which starts each of its cursors.
+    - seqs (array): The sequence number of each item, in list order.
+    - next_seq (int): The number the next item added gets.
+    """
+
+    def __init__(self, name, count=0):
+        """
+        Initializes a new Sequence object.
+
+        Parameters:
+        - name (str): The name of the list, e.g. 'books'.
+        - count (int): The number of items already in the list.
+        """
+        self.name = name
+        self.seqs = array('q', range(count))
+        self.next_seq = count
+
+    def __len__(self):
+        return len(self.seqs)
+
+    def append(self):
+        """
+        Numbers an item appended to the list.
+        """
+        self.seqs.append(self.next_seq)
+        self.next_seq += 1
+
+    def extend(self, count):
+        """
+        Numbers several items appended to the list.
+
+        Parameters:
+        - count (int): The number of items.
+        """
+        self.seqs.extend(range(self.next_seq, self.next_seq + count))
+        self.next_seq += count
+
+    def remove(self, index):
+        """
+        Forgets an item removed from the list.
+
+        Parameters:
+        - index (int): The position the item had in the list.
+        """
+        del self.seqs[index]
+
+    def page(self, items, cursor=None, limit=PAGE_SIZE):
+        """
+        Gets a page of the list.
+
+        Parameters:
+        - items (list): The list.
+        - cursor (str or None): The cursor returned with the previous page,
+          or None for the first page.
+        - limit (int): The most items on the page.
+
+        Returns:
+        - Tuple[list, str or None]: The items, and the cursor of the next
+          page, or None if this is the last one.
+
+        Raises:
+        - ValueError: If the cursor does not belong to this list.
+        """
+        start = 0 if cursor is None else bisect_right(self.seqs, self.position(cursor))
+        end = start + max(limit, 1)
+        if end >= len(items):
+            return items[start:], None
+        return items[start:end], f'{self.name}:{self.seqs[end - 1]}'
+
+    def position(self, cursor):
+        """
+        Reads the sequence number a cursor carries on after.
+
+        Parameters:
+        - cursor (str): The cursor.
+
+        Returns:
+        - int: The sequence number of the last item shown.
+
+        Raises:
+        - ValueError: If the cursor does not belong to this list.
+        """
+        name, _, seq = str(cursor).rpartition(':')
+        if name != self.name or not seq.isdigit():
+            raise ValueError(f"Not a cursor of the {self.name} list: {cursor!r}")
+        return int(seq)
+
+class Records:
+    """
+    Represents a list of records, such as a library's books, in the order
+    they were added, that records can be removed from without searching
+    the list or shifting the records after them.
+
+    Each record is numbered by a Sequence when it is added, and keeps its
+    number in its own seq attribute, so its place in the list is found by
+    binary search. Removing a record only empties its place; the empty
+    places are dropped in one pass once they outnumber the records, so a
+    removal costs O(log n), amortized. Iterating and len() only see the
+    records; indexing drops the empty places first.
+
+    Attributes:
+    - items (list): The records in order, with None in the places of removed ones.
+    - order (Sequence): The sequence number of each place in items.
+    - removed (int): The number of empty places in items.
+    """
+
+    def __init__(self, name, records=()):
+        """
+        Initializes a new Records object.
+
+        Parameters:
+        - name (str): The name of the list, which starts each of its cursors.
+        - records (Iterable): The records already in the list, each with a seq attribute.
+        """
+        self.items = list(records)
+        self.order = Sequence(name, len(self.items))
+        for seq, record in enumerate(self.items):
+            record.seq = seq
+        self.removed = 0
+
+    def __len__(self):
+        return len(self.items) - self.removed
+
+    def __iter__(self):
+        if not self.removed:
+            return iter(self.items)
+        return (record for record in self.items if record is not None)
+
+    def __getitem__(self, index):
+        self.compact()
+        return self.items[index]
+
+    def append(self, record):
+        """
+        Adds a record at the end of the list.
+
+        Parameters:
+        - record (object): The record, with a seq attribute.
+        """
+        record.seq = self.order.next_seq
+        self.items.append(record)
+        self.order.append()
+
+    def extend(self, records):
+        """
+        Adds several records at the end of the list.
+
+        Parameters:
+        - records (Iterable): The records, each with a seq attribute.
+        """
+        records = list(records)
+        for seq, record in enumerate(records, self.order.next_seq):
+            record.seq = seq
+        self.items.extend(records)
+        self.order.extend(len(records))
+
+    def remove(self, record):
+        """
+        Removes a record from the list.
+
+        Parameters:
+        - record (object): The record, which must be in the list.
+        """
+        index = bisect_left(self.order.seqs, record.seq)
+        self.items[index] = None
+        self.removed += 1
+        if self.removed > len(self.items) // 2:
+            self.compact()
+
+    def compact(self):
+        """
+        Drops the empty places left by removed records.
+        """
+        if not self.removed:
+            return
+        kept = [record is not None for record in self.items]
+        self.items = list(compress(self.items, kept))
+        self.order.seqs = array('q', compress(self.order.seqs, kept))
+        self.removed = 0
+
+    def page(self, cursor=None, limit=PAGE_SIZE):
+        """
+        Gets a page of the list, as Sequence.page() does.
+
+        Parameters:
+        - cursor (str or None): The cursor returned with the previous page,
+          or None for the first page.
+        - limit (int): The most records on the page.
+
+        Returns:
+        - Tuple[list, str or None]: The records, and the cursor of the next
+          page, or None if this is the last one.
+
+        Raises:
+        - ValueError: If the cursor does not belong to this list.
+        """
+        items = self.items
+        index = 0 if cursor is None else bisect_right(self.order.seqs, self.order.position(cursor))
+        limit = max(limit, 1)
+        records = []
+        while index < len(items) and len(records) < limit:
+            if items[index] is not None:
+                records.append(items[index])
+            index += 1
+        last = index - 1
+        while index < len(items) and items[index] is None:
+            index += 1
+        if index >= len(items):
+            return records, None
+        return records, f'{self.order.name}:{self.order.seqs[last]}'
+
+def write_lines(lines, file=None):
+    """
+    Writes lines of text in blocks of BLOCK_LINES, instead of one write
+    per line.
+
+    Parameters:
+    - lines (Iterable[str]): The lines, without line endings.
+    - file (file or None): The file to write to (default standard output).
+
+    Returns:
+    - int: The number of lines written.
+    """
+    file = file or sys.stdout
+    lines = iter(lines)
+    count = 0
+    while True:
+        block = list(islice(lines, BLOCK_LINES))
+        if not block:
+            return count
+        file.write('\n'.join(block) + '\n')
+        count += len(block)
+
+def show_pages(fetch, describe, page_size=PAGE_SIZE, file=None):
+    """
+    Shows a list one page at a time, asking before each page after the first.
+
+    Parameters:
+    - fetch (callable): Gets a page, given a cursor and a limit, as
+      Sequence.page() does.
+    - describe (callable): Gets the line shown for an item.
+    - page_size (int): The number of items on each page.
+    - file (file or None): The file to write to (default standard output).
+
+    Returns:
+    - int: The number of items shown.
+    """
+    shown = 0
+    cursor = None
+    while True:
+        items, cursor = fetch(cursor, page_size)
+        shown += write_lines(map(describe, items), file)
+        if cursor is None or input("Press Enter for more, or q to stop: ").strip().lower() == 'q':
+            return shown
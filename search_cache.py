@@ -0,0 +1,185 @@
+import time
+from collections import OrderedDict
+
+from search_index import matches, tokenize, trigrams
+
+# The number of search results a library keeps by default.
+SEARCH_CACHE_SIZE = 1024
+
+# How long a cached search result is used before it is worked out again,
+# in seconds. Results are dropped as soon as the catalogue changes under
+# them; the limit only bounds how long a change made behind the library's
+# back (editing a book's title directly) can go unnoticed.
+SEARCH_CACHE_TTL = 300.0
+
+class SearchCache:
+    """
+    Represents a bounded cache of search results, by normalized query,
+    dropping the least recently used result when it is full.
+
+    A result only changes when a book that matches the query is added or
+    deleted; reserving, renewing, lending and returning books change the
+    books' state but not which books match, and a result holds the books
+    themselves, so it always shows their current state. When a book is
+    added or deleted, only the cached queries it matches are dropped. Each
+    query is filed under the first trigram of its longest word, which every
+    matching book contains, so a change only checks the queries filed
+    under one of the book's own trigrams, and those with no word long
+    enough to have one.
+
+    It is not thread-safe; a Library uses it under its catalogue lock.
+
+    Attributes:
+    - max_size (int): The most results kept; 0 keeps none.
+    - ttl (float or None): How long a result is used, in seconds, or None for no limit.
+    - hits (int): The lookups answered from the cache.
+    - misses (int): The lookups that were not.
+    - evictions (int): The results dropped to make room.
+    - expirations (int): The results dropped for being too old.
+    - invalidations (int): The results dropped because a book they match was added or deleted.
+    """
+
+    def __init__(self, max_size=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL, clock=time.monotonic):
+        """
+        Initializes a new SearchCache object.
+
+        Parameters:
+        - max_size (int): The most results kept; 0 keeps none.
+        - ttl (float or None): How long a result is used, in seconds, or None for no limit.
+        - clock (callable): Gets the current time, in seconds.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.results = OrderedDict()
+        self.by_gram = {}
+        self.unfiled = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self.results)
+
+    def get(self, query):
+        """
+        Looks up the result of a query.
+
+        Parameters:
+        - query (str): The normalized query.
+
+        Returns:
+        - tuple or None: The matching books, or None if the result is not cached.
+        """
+        cached = self.results.get(query)
+        if cached is None:
+            self.misses += 1
+            return None
+        expires, books = cached
+        if expires is not None and self.clock() >= expires:
+            self.drop(query)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self.results.move_to_end(query)
+        self.hits += 1
+        return books
+
+    def put(self, query, books):
+        """
+        Caches the result of a query, dropping the least recently used
+        results if the cache is full.
+
+        Parameters:
+        - query (str): The normalized query.
+        - books (Iterable[Book]): The matching books.
+        """
+        if self.max_size <= 0:
+            return
+        if query in self.results:
+            self.drop(query)
+        while len(self.results) >= self.max_size:
+            self.drop(next(iter(self.results)))
+            self.evictions += 1
+        expires = None if self.ttl is None else self.clock() + self.ttl
+        self.results[query] = (expires, tuple(books))
+        gram = self.gram_of(query)
+        if gram is None:
+            self.unfiled.add(query)
+        else:
+            self.by_gram.setdefault(gram, set()).add(query)
+
+    def gram_of(self, query):
+        """
+        Gets the trigram a query is filed under.
+
+        Parameters:
+        - query (str): The normalized query.
+
+        Returns:
+        - str or None: The first trigram of the query's longest word, or
+          None if no word is three characters long.
+        """
+        words = tokenize(query)
+        longest = max(words, key=len) if words else ''
+        return longest[:3] if len(longest) >= 3 else None
+
+    def drop(self, query):
+        """
+        Removes a cached result.
+
+        Parameters:
+        - query (str): The normalized query.
+        """
+        del self.results[query]
+        gram = self.gram_of(query)
+        if gram is None:
+            self.unfiled.discard(query)
+            return
+        queries = self.by_gram[gram]
+        queries.discard(query)
+        if not queries:
+            del self.by_gram[gram]
+
+    def invalidate(self, title, author):
+        """
+        Drops the results a book that was added or deleted could change.
+
+        Parameters:
+        - title (str): The book's normalized title.
+        - author (str): The book's normalized author.
+        """
+        if not self.results:
+            return
+        affected = [query for query in self.unfiled if matches(query, title, author)]
+        for gram in trigrams(title) | trigrams(author):
+            queries = self.by_gram.get(gram)
+            if queries:
+                affected.extend(query for query in queries if matches(query, title, author))
+        for query in affected:
+            self.drop(query)
+        self.invalidations += len(affected)
+
+    def clear(self):
+        """
+        Drops every cached result, counting them as invalidated.
+        """
+        self.invalidations += len(self.results)
+        self.results.clear()
+        self.by_gram.clear()
+        self.unfiled.clear()
+
+    def stats(self):
+        """
+        Gets the cache's counters.
+
+        Returns:
+        - dict: The size, max_size, hits, misses, hit_rate (None before the
+          first lookup), evictions, expirations and invalidations.
+        """
+        lookups = self.hits + self.misses
+        return {'size': len(self.results), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None, 'evictions': self.evictions,
+                'expirations': self.expirations, 'invalidations': self.invalidations}
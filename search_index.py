@@ -0,0 +1,492 @@
+import heapq
+import re
+import time
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# How many typos a fuzzy search forgives in a query word, by word length:
+# none in words of up to two characters, one in words of up to five and
+# two in longer words.
+FUZZY_EDITS = ((2, 0), (5, 1))
+MAX_FUZZY_EDITS = 2
+
+def normalize(text):
+    """
+    Normalizes text for searching.
+
+    Parameters:
+    - text (str): The text to normalize.
+
+    Returns:
+    - str: The case-folded text with runs of whitespace collapsed.
+    """
+    return ' '.join(str(text or '').casefold().split())
+
+def tokenize(text):
+    """
+    Splits normalized text into word tokens.
+
+    Parameters:
+    - text (str): The normalized text.
+
+    Returns:
+    - List[str]: The word tokens.
+    """
+    return TOKEN_PATTERN.findall(text)
+
+def trigrams(text):
+    """
+    Gets the set of three-character substrings of a text.
+
+    Parameters:
+    - text (str): The normalized text.
+
+    Returns:
+    - Set[str]: The trigrams.
+    """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def matches(query, title, author):
+    """
+    Checks whether a book matches a search query, as SearchIndex.search() decides.
+
+    Parameters:
+    - query (str): The normalized search query.
+    - title (str): The book's normalized title.
+    - author (str): The book's normalized author.
+
+    Returns:
+    - bool: True if the title or author contains the query, or if the query
+      is at least three characters long and the book contains every one of
+      its words.
+    """
+    if query in title or query in author:
+        return True
+    if len(query) < 3:
+        return False
+    words = tokenize(query)
+    return len(words) > 1 and set(words) <= set(tokenize(title)) | set(tokenize(author))
+
+def deletions(word):
+    """
+    Gets the words made by dropping one letter from a word.
+
+    Parameters:
+    - word (str): The word.
+
+    Returns:
+    - Set[str]: The shorter words.
+    """
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+def allowed_edits(word, max_distance=None):
+    """
+    Gets how many typos a fuzzy search forgives in a query word. Words
+    with digits in them, such as years and numbers, must match exactly.
+
+    Parameters:
+    - word (str): The word token.
+    - max_distance (int or None): A cap on the number of typos, or None for the default.
+
+    Returns:
+    - int: The number of typos.
+    """
+    if not word.isalpha():
+        return 0
+    edits = next((edits for length, edits in FUZZY_EDITS if len(word) <= length), MAX_FUZZY_EDITS)
+    return edits if max_distance is None else min(edits, max_distance)
+
+def edit_distance(a, b, limit):
+    """
+    Computes the edit distance between two words: the fewest insertions,
+    deletions, substitutions and swaps of adjacent letters that turn one
+    into the other. Gives up as soon as it is certain to be more than a limit.
+
+    Parameters:
+    - a (str): The first word.
+    - b (str): The second word.
+    - limit (int): The largest distance of interest.
+
+    Returns:
+    - int: The distance, or limit + 1 if it is more than the limit.
+    """
+    if a == b:
+        return 0
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    # Letters the words share at either end cost nothing.
+    shortest = min(len(a), len(b))
+    start = 0
+    while start < shortest and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < shortest - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a = a[start:len(a) - end]
+    b = b[start:len(b) - end]
+    if not a or not b:
+        return min(len(a) + len(b), limit + 1)
+    before, previous = None, list(range(len(b) + 1))
+    for i, char in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other))
+            if before and j > 1 and char == b[j - 2] and a[i - 2] == other:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit and (not before or min(previous) > limit):
+            return limit + 1
+        before, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+class SearchIndex:
+    """
+    Represents an inverted index over book titles and authors.
+
+    Each book is given a sequence number in the order it was added. Two
+    posting tables map a word token or a trigram to the sequence numbers of
+    the books containing it. A query reads only the shortest posting list
+    that applies and checks those candidates, so its cost depends on how
+    rare the query is rather than on the size of the catalogue. Posting
+    lists are appended to in sequence order, which keeps results in
+    catalogue order. Deleted books are dropped from the entry table straight
+    away and from the posting lists when the index is next rebuilt.
+
+    Fuzzy searches use a second, much smaller index over the distinct words
+    rather than the books, mapping each word and each way of dropping one
+    letter from it to the word. Two words one typo apart always have such a
+    variant in common, so the words within one typo of a query word are
+    found by looking up the query word's own variants, and those within two
+    by looking up the variants of every word one typo from it. Each lookup
+    is a dict access, so only a handful of real near misses ever have their
+    edit distance computed. It is built on the first fuzzy search and kept
+    up to date from then on.
+
+    Attributes:
+    - title_of (callable): Gets the title of a book.
+    - author_of (callable): Gets the author of a book.
+    """
+
+    def __init__(self, books=(), title_of=lambda book: book.book_title, author_of=lambda book: book.book_author):
+        """
+        Initializes a new SearchIndex object.
+
+        Parameters:
+        - books (Iterable[Book]): The books to index.
+        - title_of (callable): Gets the title of a book.
+        - author_of (callable): Gets the author of a book.
+        """
+        self.title_of = title_of
+        self.author_of = author_of
+        self.rebuild(books)
+
+    def rebuild(self, books):
+        """
+        Rebuilds the index from scratch.
+
+        Parameters:
+        - books (Iterable[Book]): The books to index.
+        """
+        self.entries = {}
+        self.seq_of = {}
+        self.token_postings = {}
+        self.trigram_postings = {}
+        self.next_seq = 0
+        self.dead = 0
+        self.vocabulary = None
+        for book in books:
+            self.add(book)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def state(self):
+        """
+        Gets the contents of the index, without the books, for saving in a
+        snapshot. Use it only on an index with no deleted books.
+
+        Returns:
+        - tuple: The normalized (title, author) of each book in sequence
+          order, and the token and trigram posting tables.
+        """
+        texts = [(title, author) for book, title, author in self.entries.values()]
+        return texts, self.token_postings, self.trigram_postings
+
+    def restore(self, books, state):
+        """
+        Replaces the contents of the index with a saved state, instead of
+        normalizing and tokenizing every book again.
+
+        Parameters:
+        - books (List[Book]): The books the state was taken from, in the same order.
+        - state (tuple): The state, from state().
+
+        Raises:
+        - ValueError: If the state does not have one entry per book.
+        """
+        texts, token_postings, trigram_postings = state
+        if len(texts) != len(books):
+            raise ValueError("The index state does not match the books")
+        self.entries = {seq: (book, title, author) for seq, (book, (title, author)) in enumerate(zip(books, texts))}
+        self.seq_of = {book: seq for seq, book in enumerate(books)}
+        self.token_postings = token_postings
+        self.trigram_postings = trigram_postings
+        self.next_seq = len(books)
+        self.dead = 0
+        self.vocabulary = None
+
+    def add(self, book):
+        """
+        Adds a book to the index.
+
+        Parameters:
+        - book (Book): The book to add.
+        """
+        seq = self.next_seq
+        self.next_seq += 1
+        title = normalize(self.title_of(book))
+        author = normalize(self.author_of(book))
+        self.entries[seq] = (book, title, author)
+        self.seq_of[book] = seq
+        for token in set(tokenize(title)) | set(tokenize(author)):
+            postings = self.token_postings.get(token)
+            if postings is None:
+                postings = self.token_postings[token] = []
+                if self.vocabulary is not None:
+                    self.add_word(token)
+            postings.append(seq)
+        for gram in trigrams(title) | trigrams(author):
+            self.trigram_postings.setdefault(gram, []).append(seq)
+
+    def entry(self, book):
+        """
+        Gets the index entry of a book.
+
+        Parameters:
+        - book (Book): The book.
+
+        Returns:
+        - tuple or None: The book's (book, title, author) entry, with the
+          title and author normalized, or None if it is not indexed.
+        """
+        seq = self.seq_of.get(book)
+        return None if seq is None else self.entries[seq]
+
+    def remove(self, book):
+        """
+        Removes a book from the index.
+
+        Parameters:
+        - book (Book): The book to remove.
+        """
+        seq = self.seq_of.pop(book, None)
+        if seq is None:
+            return
+        del self.entries[seq]
+        self.dead += 1
+        if self.dead > max(1000, len(self.entries)):
+            self.rebuild([entry[0] for entry in self.entries.values()])
+
+    def search(self, query):
+        """
+        Finds the books whose title or author contains the query, or which
+        contain every word of the query in any order.
+
+        Parameters:
+        - query (str): The search query.
+
+        Returns:
+        - List[Book]: The matching books, in catalogue order.
+        """
+        query = normalize(query)
+        if len(query) < 3:
+            # Too short for trigrams; these queries match most of the
+            # catalogue anyway.
+            return [book for book, title, author in self.entries.values() if query in title or query in author]
+
+        matches = set(self.substring_matches(query))
+        words = tokenize(query)
+        if len(words) > 1:
+            matches.update(self.token_matches(words))
+        return [self.entries[seq][0] for seq in sorted(matches)]
+
+    def substring_matches(self, query):
+        """
+        Gets the sequence numbers of books whose title or author contains the query.
+
+        Parameters:
+        - query (str): The normalized query, at least three characters long.
+
+        Returns:
+        - Iterator[int]: The matching sequence numbers.
+        """
+        postings = [self.trigram_postings.get(gram, ()) for gram in trigrams(query)]
+        for seq in min(postings, key=len):
+            entry = self.entries.get(seq)
+            if entry and (query in entry[1] or query in entry[2]):
+                yield seq
+
+    def token_matches(self, words):
+        """
+        Gets the sequence numbers of books containing every given word.
+
+        Parameters:
+        - words (List[str]): The query words.
+
+        Returns:
+        - Iterator[int]: The matching sequence numbers.
+        """
+        postings = [self.token_postings.get(word, ()) for word in words]
+        wanted = set(words)
+        for seq in min(postings, key=len):
+            entry = self.entries.get(seq)
+            if entry and wanted <= set(tokenize(entry[1])) | set(tokenize(entry[2])):
+                yield seq
+
+    def build_vocabulary(self):
+        """
+        Builds the index of words used by fuzzy searches.
+        """
+        self.vocabulary = {}
+        self.letters = set()
+        for token in self.token_postings:
+            self.add_word(token)
+
+    def add_word(self, token):
+        """
+        Adds a new word token to the index used by fuzzy searches. Tokens
+        with digits or underscores in them are left out.
+
+        Parameters:
+        - token (str): The word token.
+        """
+        if not token.isalpha():
+            return
+        self.letters.update(token)
+        for variant in deletions(token) | {token}:
+            # Most variants belong to one word, which is stored bare
+            # rather than in a list to save memory.
+            words = self.vocabulary.get(variant)
+            if words is None:
+                self.vocabulary[variant] = token
+            elif type(words) is str:
+                self.vocabulary[variant] = [words, token]
+            else:
+                words.append(token)
+
+    def variants(self, word, edits):
+        """
+        Gets the variants to look up to find the words within one or two
+        typos of a word.
+
+        Parameters:
+        - word (str): The word.
+        - edits (int): The largest edit distance, 1 or 2.
+
+        Returns:
+        - Set[str]: The variants.
+        """
+        if edits == 1:
+            return deletions(word) | {word}
+        letters = self.letters
+        one_typo = (deletions(word)
+                    | {word[:i] + letter + word[i + 1:] for i in range(len(word)) for letter in letters}
+                    | {word[:i] + letter + word[i:] for i in range(len(word) + 1) for letter in letters}
+                    | {word[:i] + word[i + 1] + word[i] + word[i + 2:] for i in range(len(word) - 1)})
+        return {variant for near in one_typo for variant in deletions(near)} | one_typo | {word}
+
+    def similar_words(self, word, edits):
+        """
+        Finds the word tokens in the index within an edit distance of a word.
+
+        Parameters:
+        - word (str): The word.
+        - edits (int): The largest edit distance, at most MAX_FUZZY_EDITS.
+
+        Returns:
+        - dict: The edit distance of each similar token, by token.
+        """
+        if not edits:
+            return {word: 0} if word in self.token_postings else {}
+        candidates = set()
+        for variant in self.variants(word, edits):
+            words = self.vocabulary.get(variant)
+            if words is None:
+                continue
+            if type(words) is str:
+                candidates.add(words)
+            else:
+                candidates.update(words)
+        similar = {}
+        for token in candidates:
+            distance = edit_distance(word, token, edits)
+            if distance <= edits:
+                similar[token] = distance
+        return similar
+
+    def fuzzy_search(self, query, max_distance=None, limit=20, budget=None):
+        """
+        Finds the books containing a close match for every word of the query,
+        forgiving a few typos per word (see FUZZY_EDITS).
+
+        The words are matched rarest first: the books containing a match for
+        the rarest word are the candidates, and each other word narrows them
+        down, either by its posting lists or, when those are much longer than
+        the candidates left, by checking each candidate's text. A book scores
+        the sum of the edit distances of its best matches, and the lowest
+        scores are returned first.
+
+        Parameters:
+        - query (str): The search query.
+        - max_distance (int or None): A cap on the typos forgiven per word, or None for the default.
+        - limit (int): The largest number of results.
+        - budget (float or None): The most time to spend checking candidates, in seconds, or
+          None for no limit. If it runs out, the best of the candidates checked so far are
+          returned.
+
+        Returns:
+        - List[Tuple[int, Book]]: The score and book of each result, best first, and in
+          catalogue order among equal scores.
+        """
+        deadline = None if budget is None else time.perf_counter() + budget
+        words = tokenize(normalize(query))
+        if not words:
+            return []
+        if self.vocabulary is None:
+            self.build_vocabulary()
+
+        matches = []
+        for word in dict.fromkeys(words):
+            similar = self.similar_words(word, allowed_edits(word, max_distance))
+            if not similar:
+                return []
+            matches.append((sum(len(self.token_postings[token]) for token in similar), similar))
+        matches.sort(key=lambda match: match[0])
+
+        scores = {}
+        for token, distance in matches[0][1].items():
+            for seq in self.token_postings[token]:
+                if seq in self.entries and scores.get(seq, MAX_FUZZY_EDITS + 1) > distance:
+                    scores[seq] = distance
+        for size, similar in matches[1:]:
+            if size <= 8 * len(scores):
+                # Cheaper to read the word's postings than every candidate's text.
+                distances = {}
+                for token, distance in similar.items():
+                    for seq in self.token_postings[token]:
+                        if distances.get(seq, MAX_FUZZY_EDITS + 1) > distance:
+                            distances[seq] = distance
+                scores = {seq: score + distances[seq] for seq, score in scores.items() if seq in distances}
+                continue
+            checked = {}
+            for count, (seq, score) in enumerate(scores.items()):
+                if deadline is not None and not count % 256 and time.perf_counter() > deadline:
+                    break
+                book, title, author = self.entries[seq]
+                best = min((similar[token] for token in tokenize(title) + tokenize(author) if token in similar),
+                           default=None)
+                if best is not None:
+                    checked[seq] = score + best
+            scores = checked
+        best = heapq.nsmallest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return [(score, self.entries[seq][0]) for seq, score in best]
@@ -0,0 +1,535 @@
+"""
+Network service for the library management system.
+
+The service speaks line-delimited JSON over TCP. Each request is one line
+holding a JSON object with an "op" field and the operation's arguments, and
+optionally an "id" that is echoed back. Each response is one line:
+
+    {"id": ..., "ok": true, "result": ...}
+    {"id": ..., "ok": false, "error": "..."}
+
+All connections share one Library instance. Operations run on the event loop
+one at a time, so they never interleave; with --shards they run on a thread
+pool instead, so requests for books on different shards are answered in
+parallel by the shard processes. Searches of the library app scan the whole
+catalogue, so they run on the thread pool too, alongside the operations on
+the event loop. Anyone can register as a user; only a logged-in admin can
+register an admin.
+
+Usage:
+    python server.py serve --app new --books books.csv --users users.csv
+    python server.py serve --app new --books books.csv --users users.csv --shards 4
+    python server.py serve --app library --books books.csv --members members.csv
+    python server.py serve --app new --metrics-file library.prom
+    python server.py load-test --connections 2000 --requests 20 --op search --query harry
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import library
+import new
+import shards
+from metrics import Metrics
+from write_behind import DURABILITY_MODES, INTERVAL
+
+class RequestError(Exception):
+    """
+    Raised by an operation to send an error response to the client.
+    """
+
+def library_book(book):
+    """
+    Converts a library.Book to JSON.
+
+    Parameters:
+    - book (library.Book): The book.
+
+    Returns:
+    - dict: The book's fields.
+    """
+    return {
+        'title': book.title,
+        'author': book.author,
+        'ISBN': book.ISBN,
+        'checked_out_by': book.checked_out_by.member_id if book.checked_out_by else None,
+        'due_date': book.due_date.isoformat() if book.due_date else None,
+    }
+
+def new_book(book):
+    """
+    Converts a new.Book to JSON.
+
+    Parameters:
+    - book (new.Book): The book.
+
+    Returns:
+    - dict: The book's fields.
+    """
+    return {
+        'book_id': book.book_id,
+        'book_title': book.book_title,
+        'book_author': book.book_author,
+        'availability': book.availability,
+        'reserved': book.reserved,
+        'due_return': book.due_return.isoformat() if book.due_return else None,
+    }
+
+def page(items, request):
+    """
+    Takes the page of a list asked for by the request's 'offset' and 'limit'.
+
+    Parameters:
+    - items (list): The full list.
+    - request (dict): The request.
+
+    Returns:
+    - list: The page.
+    """
+    offset = int(request.get('offset', 0))
+    limit = int(request.get('limit', 100))
+    return items[offset:offset + limit]
+
+def listing(items, fetch, describe, request):
+    """
+    Takes the page of a list asked for by the request. With a 'cursor'
+    (null for the first page), the page carries on after the last record
+    of the previous one however the list changed, and comes back with the
+    cursor of the next page; otherwise it is taken by 'offset' and 'limit'.
+
+    Parameters:
+    - items (list): The full list.
+    - fetch (callable): Gets a page of the list by cursor and limit.
+    - describe (callable): Turns a record into its JSON form.
+    - request (dict): The request.
+
+    Returns:
+    - dict or list: {'items': [...], 'next_cursor': ...} with a cursor, or the page.
+    """
+    if 'cursor' not in request:
+        return [describe(item) for item in page(items, request)]
+    records, cursor = fetch(request['cursor'], int(request.get('limit', 100)))
+    return {'items': [describe(record) for record in records], 'next_cursor': cursor}
+
+class LibraryService:
+    """
+    Represents the operations of the library.py menu over a shared library.Library.
+
+    Attributes:
+    - library (library.Library): The shared library.
+    - concurrent (bool): Whether requests can run on several threads at once.
+    - blocking_ops (frozenset): The operations that run on the event loop's
+      thread pool even so, as they scan the whole catalogue and would hold
+      up every other connection. They only read it.
+    """
+
+    def __init__(self, shared_library):
+        """
+        Initializes a new LibraryService object.
+
+        Parameters:
+        - shared_library (library.Library): The shared library.
+        """
+        self.library = shared_library
+        self.concurrent = False
+        self.blocking_ops = frozenset({'search'})
+
+    def new_session(self):
+        """
+        Creates the state kept for one connection; library.py has no logins.
+
+        Returns:
+        - dict: The session.
+        """
+        return {}
+
+    def handle(self, session, request):
+        """
+        Runs one request.
+
+        Parameters:
+        - session (dict): The connection's session.
+        - request (dict): The request.
+
+        Returns:
+        - object: The JSON result.
+        """
+        lib = self.library
+        op = request.get('op')
+        if op == 'search':
+            # Runs off the event loop (see blocking_ops) while other requests
+            # change the catalogue, so places emptied meanwhile are skipped.
+            # The scan stops at the end of the page asked for.
+            books = (book for book in lib.books if book is not None)
+            offset = int(request.get('offset', 0))
+            found = itertools.islice(library.search_books(books, request['query']),
+                                     offset, offset + int(request.get('limit', 100)))
+            return [library_book(book) for book in found]
+        if op == 'stats':
+            return lib.metrics.prometheus() if lib.metrics else ''
+        if op == 'display_books':
+            return listing(lib.books, lib.books_page, library_book, request)
+        if op == 'display_members':
+            return listing(lib.members, lib.members_page, lambda m: {'member_id': m.member_id, 'name': m.name}, request)
+        if op in ('check_out', 'return'):
+            pairs = [(int(request['member_id']), str(request['ISBN']))]
+            result = (lib.check_out_books if op == 'check_out' else lib.return_books)(pairs)[0]
+            due_date = result.get('due_date')
+            return {'status': result['status'], 'due_date': due_date.isoformat() if due_date else None}
+        if op == 'add_book':
+            lib.add_book(library.Book(request['title'], request['author'], str(request['ISBN'])))
+            return {'status': library.OK}
+        if op == 'delete_book':
+            if lib.remove_book(str(request['ISBN'])):
+                return {'status': library.OK}
+            return {'status': library.NOT_AVAILABLE if lib.find_book(str(request['ISBN'])) else 'not-found'}
+        if op == 'add_member':
+            added = lib.add_member(library.Member(request['name'], int(request['member_id'])))
+            return {'status': library.OK if added else 'already-exists'}
+        if op == 'delete_member':
+            return {'status': library.OK if lib.remove_member(int(request['member_id'])) else 'not-found'}
+        raise RequestError(f"Unknown operation: {op}")
+
+class NewLibraryService:
+    """
+    Represents the operations of the new.py menu over a shared new.Library.
+
+    As in the menu, searching, reserving and renewing need a logged-in user,
+    and adding/deleting books, lending, returns, viewing users, inventory
+    counts and stats need an admin.
+
+    Attributes:
+    - library (new.Library or shards.ShardedLibrary): The shared library.
+    - concurrent (bool): Whether requests can run on several threads at
+      once, which a ShardedLibrary allows: its per-shard locks let calls
+      to different shards wait on their shards in parallel.
+    - blocking_ops (frozenset): The operations that run on the event loop's
+      thread pool when the service is not concurrent; none, as an unsharded
+      new.Library is not shared between threads.
+    """
+
+    def __init__(self, shared_library):
+        """
+        Initializes a new NewLibraryService object.
+
+        Parameters:
+        - shared_library (new.Library or shards.ShardedLibrary): The shared library.
+        """
+        self.library = shared_library
+        self.concurrent = isinstance(shared_library, shards.ShardedLibrary)
+        self.blocking_ops = frozenset()
+
+    def new_session(self):
+        """
+        Creates the state kept for one connection.
+
+        Returns:
+        - dict: The session, holding the logged-in user.
+        """
+        return {'user': None}
+
+    def handle(self, session, request):
+        """
+        Runs one request.
+
+        Parameters:
+        - session (dict): The connection's session.
+        - request (dict): The request.
+
+        Returns:
+        - object: The JSON result.
+        """
+        lib = self.library
+        op = request.get('op')
+        user = session['user']
+        if op == 'register':
+            # Anyone can register themselves as a user, but only an admin
+            # can create another admin.
+            admin = request.get('user_type') == 'admin'
+            if admin and not isinstance(user, new.Admin):
+                raise RequestError("Only an admin can register an admin.")
+            user_class = new.Admin if admin else new.User
+            candidate = user_class(request['user_name'], 'admin' if admin else 'user', request.get('user_phone', ''),
+                                   request.get('user_email', ''), request['password'])
+            if not lib.add_user(candidate):
+                return {'status': 'already-exists'}
+            if not admin:
+                session['user'] = candidate
+            return {'status': new.OK}
+        if op == 'login':
+            found = lib.find_user(request['user_name'])
+            if not found or found.password != request['password']:
+                session['user'] = None
+                return {'status': 'login-failed'}
+            session['user'] = found
+            return {'status': new.OK, 'user_type': found.user_type}
+        if op == 'logout':
+            session['user'] = None
+            return {'status': new.OK}
+
+        if user is None:
+            raise RequestError("Please log in first.")
+        if op == 'search':
+            return [new_book(book) for book in page(lib.search_books(request['query']), request)]
+        if op == 'autocomplete':
+            suggestions = lib.autocomplete(request['prefix'], int(request.get('limit', new.MAX_COMPLETIONS)))
+            return [{'loans': loans, 'book': new_book(book)} for loans, book in suggestions]
+        if op == 'fuzzy_search':
+            results = lib.fuzzy_search_books(request['query'], request.get('max_distance'), int(request.get('limit', 20)))
+            return [{'distance': distance, 'book': new_book(book)} for distance, book in results]
+        if op == 'reserve':
+            status, book = lib.reserve_book(str(request['book_id']), user.user_name)
+            return {'status': status, 'book': new_book(book) if book else None,
+                    'position': lib.hold_position(str(request['book_id']), user.user_name)}
+        if op == 'renew':
+            status, book = lib.renew_book(str(request['book_id']))
+            return {'status': status, 'book': new_book(book) if book else None}
+        if op == 'hold_position':
+            return {'position': lib.hold_position(str(request['book_id']), user.user_name)}
+        if op == 'cancel_reservation':
+            return {'status': new.OK if lib.cancel_reservation(str(request['book_id']), user.user_name) else new.NOT_FOUND}
+        if op == 'fines':
+            return lib.fines_of(user.user_name)
+        if op == 'pay_fine':
+            paid, owed = lib.pay_fine(user.user_name, int(request['amount']))
+            return {'paid': paid, 'owed': owed}
+
+        if not isinstance(user, new.Admin):
+            raise RequestError("This operation needs an admin.")
+        if op == 'add_book':
+            lib.add_book(new.Book(str(request['book_id']), request['book_title'], request.get('book_author', ''), True, False, None))
+            return {'status': new.OK}
+        if op == 'delete_book':
+            return {'status': new.OK if lib.delete_book(str(request['book_id'])) else new.NOT_FOUND}
+        if op in ('check_out', 'return'):
+            if op == 'check_out':
+                status, book = lib.check_out_book(str(request['book_id']), request['user_name'])
+            else:
+                status, book = lib.return_book(str(request['book_id']))
+            return {'status': status, 'book': new_book(book) if book else None}
+        if op == 'stats':
+            return lib.metrics.prometheus() if lib.metrics else ''
+        if op == 'search_cache':
+            return lib.search_cache_stats()
+        if op == 'assess_fines':
+            return lib.assess_fines()
+        if op == 'inventory':
+            if request.get('by_author'):
+                return lib.inventory_by_author()
+            return lib.inventory_counts(request.get('author'))
+        if op == 'view_users':
+            return listing(lib.users, lib.users_page, lambda u: {'user_name': u.user_name, 'user_type': u.user_type,
+                                                                 'user_phone': u.user_phone, 'user_email': u.user_email},
+                           request)
+        raise RequestError(f"Unknown operation: {op}")
+
+async def serve_client(service, reader, writer):
+    """
+    Serves the requests of one connection until it closes. A connection's
+    requests are answered in order; if the service is concurrent, each one
+    runs on the event loop's thread pool, so requests of other connections
+    go on meanwhile.
+
+    Parameters:
+    - service (LibraryService or NewLibraryService): The service.
+    - reader (asyncio.StreamReader): The connection's reader.
+    - writer (asyncio.StreamWriter): The connection's writer.
+    """
+    session = service.new_session()
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            request = {}
+            try:
+                request = json.loads(line)
+                if service.concurrent or request.get('op') in service.blocking_ops:
+                    result = await loop.run_in_executor(None, service.handle, session, request)
+                else:
+                    result = service.handle(session, request)
+                response = {'ok': True, 'result': result}
+            except RequestError as e:
+                response = {'ok': False, 'error': str(e)}
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                response = {'ok': False, 'error': f"Bad request: {e!r}"}
+            if isinstance(request, dict) and 'id' in request:
+                response['id'] = request['id']
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+def raise_file_limit():
+    """
+    Raises the soft limit on open files to the hard limit, so the process
+    can hold thousands of connections.
+    """
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or hard > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY else max(soft, 65536), hard))
+
+async def write_metrics(metrics, path, interval):
+    """
+    Writes the metrics to a Prometheus text file every few seconds.
+
+    Parameters:
+    - metrics (Metrics): The metrics.
+    - path (str): The file.
+    - interval (float): The seconds between writes.
+    """
+    while True:
+        metrics.write(path)
+        await asyncio.sleep(interval)
+
+async def serve(service, host, port, metrics_file=None, metrics_interval=10.0):
+    """
+    Runs the service until it is interrupted.
+
+    Parameters:
+    - service (LibraryService or NewLibraryService): The service.
+    - host (str): The address to listen on.
+    - port (int): The port to listen on.
+    - metrics_file (str or None): A file to keep the library's metrics in, in the Prometheus text format.
+    - metrics_interval (float): The seconds between writes of the metrics file.
+    """
+    if service.concurrent:
+        # Enough threads to keep every shard busy while others wait on theirs.
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=4 * service.library.shards))
+    server = await asyncio.start_server(lambda r, w: serve_client(service, r, w), host, port, backlog=4096)
+    print(f"Serving on {', '.join(str(s.getsockname()) for s in server.sockets)}")
+    if metrics_file:
+        # Held in a variable, as the event loop only keeps weak references to tasks.
+        writer = asyncio.create_task(write_metrics(service.library.metrics, metrics_file, metrics_interval))
+    async with server:
+        await server.serve_forever()
+
+async def load_test(host, port, connections, requests, request):
+    """
+    Opens many concurrent connections and sends the same request on each
+    several times, measuring latency and throughput.
+
+    Parameters:
+    - host (str): The server address.
+    - port (int): The server port.
+    - connections (int): The number of concurrent connections.
+    - requests (int): The number of requests per connection.
+    - request (dict): The request to send; a login can be sent first with the 'login' key.
+
+    Returns:
+    - dict: The number of requests, errors, throughput and latency percentiles.
+    """
+    login = request.pop('login', None)
+    payload = json.dumps(request).encode() + b'\n'
+    latencies = []
+    errors = 0
+
+    async def client():
+        nonlocal errors
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            errors += requests
+            return
+        try:
+            if login:
+                writer.write(json.dumps(dict(login, op='login')).encode() + b'\n')
+                await reader.readline()
+            for _ in range(requests):
+                start = time.perf_counter()
+                writer.write(payload)
+                line = await reader.readline()
+                latencies.append(time.perf_counter() - start)
+                if not line or not json.loads(line).get('ok'):
+                    errors += 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def percentile(fraction):
+        return round(1000 * latencies[min(len(latencies) - 1, int(fraction * len(latencies)))], 3) if latencies else None
+
+    return {
+        'connections': connections,
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'requests_per_sec': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'latency_ms': {'p50': percentile(0.50), 'p95': percentile(0.95), 'p99': percentile(0.99), 'max': percentile(1)},
+    }
+
+def main():
+    """
+    Runs the server or the load-test client, as given on the command line.
+    """
+    parser = argparse.ArgumentParser(description="Library management system network service.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help="Run the service.")
+    serve_parser.add_argument('--app', choices=['library', 'new'], default='new')
+    serve_parser.add_argument('--books', default='books.csv')
+    serve_parser.add_argument('--members', default='members.csv', help="Member file (library app).")
+    serve_parser.add_argument('--users', default='users.csv', help="User file (new app).")
+    serve_parser.add_argument('--durability', choices=DURABILITY_MODES, default=INTERVAL,
+                              help="When changes are written to storage (default interval).")
+    serve_parser.add_argument('--flush-interval', type=float, default=1.0, help="Seconds per group of changes.")
+    serve_parser.add_argument('--shards', type=int, default=0,
+                              help="Partition the catalogue across this many worker processes (new app).")
+    serve_parser.add_argument('--metrics', action='store_true',
+                              help="Record operation latencies and storage traffic, for the stats op.")
+    serve_parser.add_argument('--metrics-file', help="Also write the metrics to this Prometheus text file (implies --metrics).")
+    serve_parser.add_argument('--metrics-interval', type=float, default=10.0, help="Seconds between writes of --metrics-file.")
+    test_parser = commands.add_parser('load-test', help="Run the load-test client against a running service.")
+    test_parser.add_argument('--connections', type=int, default=1000)
+    test_parser.add_argument('--requests', type=int, default=10, help="Requests per connection.")
+    test_parser.add_argument('--op', default='search')
+    test_parser.add_argument('--query', default='harry', help="Search text for --op search.")
+    test_parser.add_argument('--user', help="Log in as this user first (new app).")
+    test_parser.add_argument('--password', default='')
+    for sub in (serve_parser, test_parser):
+        sub.add_argument('--host', default='127.0.0.1')
+        sub.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    raise_file_limit()
+    if args.command == 'serve':
+        options = {'durability': args.durability, 'flush_interval': args.flush_interval,
+                   'metrics': Metrics() if args.metrics or args.metrics_file else None}
+        if args.app == 'library':
+            service = LibraryService(library.Library("My Library", args.books, args.members, **options))
+        elif args.shards:
+            service = NewLibraryService(shards.ShardedLibrary("My Library", args.books, args.users, args.shards,
+                                                              durability=args.durability, metrics=options['metrics']))
+        else:
+            service = NewLibraryService(new.Library("My Library", args.books, args.users, **options))
+        try:
+            asyncio.run(serve(service, args.host, args.port, args.metrics_file, args.metrics_interval))
+        except KeyboardInterrupt:
+            service.library.close()
+            if args.metrics_file:
+                service.library.metrics.write(args.metrics_file)
+    else:
+        request = {'op': args.op, 'query': args.query}
+        if args.user:
+            request['login'] = {'user_name': args.user, 'password': args.password}
+        result = asyncio.run(load_test(args.host, args.port, args.connections, args.requests, request))
+        print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,823 @@
+"""
+Sharded catalogue for new.Library.
+
+The books are partitioned by a hash of book_id across worker processes.
+Each worker owns a new.Library over its own slice of the catalogue, kept in
+its own file next to the main book file, so searching and circulation use
+as many cores as there are shards. A ShardedLibrary in the calling process
+routes each operation on a single book to the shard that owns it and sends
+a search to every shard at once, merging the results.
+
+Usage:
+    library = ShardedLibrary("My Library", "books.csv", "users.csv", shards=4)
+    library.search_books("harry")
+    library.close()
+"""
+import heapq
+import multiprocessing
+import os
+import re
+import signal
+import threading
+import zlib
+from itertools import chain, islice
+
+from completion import MAX_COMPLETIONS
+from journal import read_rows, replace_file
+from new import BOOK_FIELDS, BORROWER_FIELDS, FINE_FIELDS, FUZZY_BUDGET, HOLD_FIELDS, LOAN_FIELDS, Book, Library, book_fields
+from pages import PAGE_SIZE
+from search_index import normalize
+from storage import CSVTable
+from write_behind import PER_OP
+
+# The new.Library methods a shard answers.
+SHARD_METHODS = frozenset([
+    'find_book_by_id', 'reserve_book', 'renew_book', 'search_books', 'fuzzy_search_books', 'autocomplete',
+    'add_book', 'delete_book', 'save_books', 'overdue_books', 'books_due_within',
+    'hold_position', 'cancel_reservation', 'check_out_book', 'return_book', 'expire_holds',
+    'inventory_counts', 'inventory_by_author', 'check_inventory', 'search_cache_stats',
+    'assess_fines', 'fines_of', 'pay_fine',
+])
+
+# The methods that return lists of books. Their results cross the pipe as
+# tuples of fields, which pickle several times faster than Book objects.
+LIST_METHODS = frozenset(['search_books', 'overdue_books', 'books_due_within'])
+
+# The methods that return lists of (score, book) pairs; the books cross the
+# pipe as tuples of fields in the same way.
+RANKED_METHODS = frozenset(['fuzzy_search_books', 'autocomplete'])
+
+# The ShardedLibrary methods timed when it has a Metrics object.
+METRIC_OPERATIONS = [
+    'find_book_by_id', 'search_books', 'fuzzy_search_books', 'autocomplete', 'add_book', 'delete_book',
+    'reserve_book', 'renew_book', 'cancel_reservation', 'check_out_book', 'return_book', 'expire_holds', 'overdue_books',
+    'books_due_within', 'assess_fines', 'pay_fine', 'save_books',
+]
+
+# The tables each shard keeps next to its book file besides the books, by
+# the suffix of their files, with the fields and key of each. Hold queues,
+# loan counts and borrowers go with their books; fines are owed by members, so each
+# shard keeps the balances run up on its own books.
+SHARD_TABLES = {
+    'holds': (HOLD_FIELDS, ('book_id', 'user_name')),
+    'loans': (LOAN_FIELDS, 'book_id'),
+    'fines': (FINE_FIELDS, 'user_name'),
+    'borrowers': (BORROWER_FIELDS, 'book_id'),
+}
+
+def shard_of(book_id, shards):
+    """
+    Gets the shard that owns a book. The hash is stable between processes
+    and runs, unlike hash() on strings.
+
+    Parameters:
+    - book_id (str): The ID of the book.
+    - shards (int): The number of shards.
+
+    Returns:
+    - int: The shard number.
+    """
+    return zlib.crc32(str(book_id).encode()) % shards
+
+def shard_file(book_file, shard, shards):
+    """
+    Gets the book file of a shard.
+
+    Parameters:
+    - book_file (str): The main book file.
+    - shard (int): The shard number.
+    - shards (int): The number of shards.
+
+    Returns:
+    - str: The shard's book file.
+    """
+    return f'{book_file}.shard{shard}of{shards}'
+
+def table_file(path, table):
+    """
+    Gets the file of one of a shard's other tables.
+
+    Parameters:
+    - path (str): The shard's book file.
+    - table (str): The table, one of SHARD_TABLES.
+
+    Returns:
+    - str: The table's file.
+    """
+    return f'{path}.{table}'
+
+def find_shards(book_file):
+    """
+    Finds the shard files already split from a book file, whatever the
+    number of shards they were split for.
+
+    Parameters:
+    - book_file (str): The main book file.
+
+    Returns:
+    - int or None: The number of shards of the most recently written
+      complete set of shard book files, or None if there is none.
+    """
+    directory, name = os.path.split(book_file)
+    pattern = re.compile(re.escape(name) + r'\.shard(\d+)of(\d+)(\.journal)?')
+    written = {}
+    for entry in os.scandir(directory or '.'):
+        match = pattern.fullmatch(entry.name)
+        if match:
+            shards = written.setdefault(int(match[2]), {})
+            shards[int(match[1])] = max(shards.get(int(match[1]), 0), entry.stat().st_mtime)
+    complete = [(max(shards.values()), count) for count, shards in written.items() if len(shards) == count]
+    return max(complete)[1] if complete else None
+
+def remove_shard_files(book_file, shards):
+    """
+    Removes the files of every shard, with their journals.
+
+    Parameters:
+    - book_file (str): The main book file.
+    - shards (int): The number of shards.
+    """
+    paths = [shard_file(book_file, shard, shards) for shard in range(shards)]
+    # The book files go first, so a removal cut off part way leaves an
+    # incomplete set, which find_shards() ignores.
+    for path in paths + [table_file(path, table) for path in paths for table in SHARD_TABLES]:
+        for name in (path, path + '.journal'):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+
+def split_catalogue(book_file, shards, old_shards=None):
+    """
+    Splits the catalogue into one set of files per shard, streaming the
+    books once.
+
+    The first time, the books come from the main book file. When the
+    number of shards changes, they come from the old shard files instead,
+    which hold every change since, and so do the holds, loan counts,
+    fines and borrowers; the old files are removed once the new ones are written. The
+    new book files are written under temporary names and renamed at the
+    end, so a split cut off by a crash is started again from the same files.
+
+    Parameters:
+    - book_file (str): The main book file.
+    - shards (int): The number of shards.
+    - old_shards (int or None): The number of shards of the existing shard
+      files to split, or None to split the main book file.
+
+    Returns:
+    - List[str]: The shard book files.
+    """
+    paths = [shard_file(book_file, shard, shards) for shard in range(shards)]
+    if old_shards:
+        sources = [shard_file(book_file, shard, old_shards) for shard in range(old_shards)]
+        # Read with their journals, in case the shards journaled their changes.
+        rows = chain.from_iterable(CSVTable(source, BOOK_FIELDS, 'book_id', journaled=True).iter_rows()
+                                   for source in sources)
+    else:
+        sources = []
+        rows = read_rows(book_file)
+
+    for table, (fields, key) in SHARD_TABLES.items():
+        parts = [[] for _ in paths]
+        balances = {}
+        for source in sources:
+            for row in CSVTable(table_file(source, table), fields, key, journaled=True).iter_rows():
+                if table == 'fines':
+                    # A member can owe fines on several old shards.
+                    balances[row['user_name']] = balances.get(row['user_name'], 0) + int(row['balance'])
+                else:
+                    parts[shard_of(row['book_id'], shards)].append(row)
+        for user_name, balance in balances.items():
+            parts[shard_of(user_name, shards)].append({'user_name': user_name, 'balance': balance})
+        for path, part in zip(paths, parts):
+            CSVTable(table_file(path, table), fields, key).save(part)
+
+    buffers = [[] for _ in paths]
+    tables = [CSVTable(path + '.tmp', BOOK_FIELDS, 'book_id') for path in paths]
+    for table in tables:
+        table.save([])
+    for row in rows:
+        shard = shard_of(row['book_id'], shards)
+        buffers[shard].append(row)
+        if len(buffers[shard]) >= 10000:
+            tables[shard].record_many('add', buffers[shard])
+            buffers[shard].clear()
+    for table, buffer in zip(tables, buffers):
+        if buffer:
+            table.record_many('add', buffer)
+    for table, path in zip(tables, paths):
+        replace_file(table.path, path)
+    if old_shards:
+        remove_shard_files(book_file, old_shards)
+    return paths
+
+def merge_catalogue(book_file, shards):
+    """
+    Writes the books of all shards back into the main book file. The
+    shards' holds, loan counts, fines and borrowers stay in their own files.
+
+    Parameters:
+    - book_file (str): The main book file.
+    - shards (int): The number of shards.
+
+    Returns:
+    - int: The number of books written.
+    """
+    count = 0
+    table = CSVTable(book_file, BOOK_FIELDS, 'book_id')
+    table.save([])
+    for shard in range(shards):
+        rows = list(CSVTable(shard_file(book_file, shard, shards), BOOK_FIELDS, 'book_id', journaled=True).iter_rows())
+        table.record_many('add', rows)
+        count += len(rows)
+    return count
+
+def serve_shard(connection, name, book_file, journaled, durability):
+    """
+    Runs a shard: loads its slice of the catalogue, with the holds, loan
+    counts, fines and borrowers kept next to it, and answers calls from the router
+    until it is told to stop.
+
+    Each call is a (method, args) tuple and is answered with (True, result)
+    or (False, exception). None stops the shard after writing any pending changes.
+
+    Parameters:
+    - connection (multiprocessing.connection.Connection): The shard's end of the pipe.
+    - name (str): The name of the library.
+    - book_file (str): The shard's book file.
+    - journaled (bool): Whether the shard journals its changes.
+    - durability (str): When the shard writes changes; see new.Library.
+    """
+    # Ctrl-C reaches the whole process group; the router stops the shards
+    # itself once it has finished with them.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    library = Library(name, book_file, None, journaled, durability=durability, hold_file=table_file(book_file, 'holds'),
+                      loan_file=table_file(book_file, 'loans'), fine_file=table_file(book_file, 'fines'),
+                      borrower_file=table_file(book_file, 'borrowers'))
+    while True:
+        try:
+            call = connection.recv()
+        except EOFError:
+            break
+        if call is None:
+            break
+        method, args = call
+        try:
+            if method == 'count_books':
+                result = len(library.books)
+            elif method in LIST_METHODS:
+                result = [book_fields(book) for book in getattr(library, method)(*args)]
+            elif method in RANKED_METHODS:
+                result = [(score, book_fields(book)) for score, book in getattr(library, method)(*args)]
+            elif method in SHARD_METHODS:
+                result = getattr(library, method)(*args)
+            else:
+                raise AttributeError(f"Shards do not support {method}")
+            connection.send((True, result))
+        except Exception as e:
+            connection.send((False, e))
+    library.close()
+    connection.close()
+
+class ShardedLibrary:
+    """
+    Represents a new.Library whose catalogue is partitioned across worker
+    processes by a hash of book_id. It offers the methods of new.Library
+    used by User, Admin and the network service.
+
+    It can be shared between threads: each shard answers one call at a
+    time, and calls to different shards run in parallel.
+
+    Books returned by a shard are copies; changes to a book go through
+    reserve_book(), renew_book() and the other methods, not by editing the
+    returned object. Users are kept in the calling process. Each shard
+    keeps the hold queues, loan counts, fines and borrowers of its own books in
+    files next to its book file (see SHARD_TABLES); as shards have no
+    users, the router tells a shard the member type of each borrower.
+
+    Attributes:
+    - name (str): The name of the library.
+    - book_file (str): The main book file, split into shard files.
+    - shards (int): The number of shards.
+    - directory (new.Library): The calling process's library, which holds the users.
+    """
+
+    def __init__(self, name, book_file, user_file, shards=None, journaled=False, durability=PER_OP, metrics=None):
+        """
+        Initializes a new ShardedLibrary object and starts the shards.
+
+        The main book file is split into shard files the first time; after
+        that, each shard loads and saves its own files. If the number of
+        shards changes, the existing shard files are split again for the new
+        number. Use merge_catalogue() to write the books back into the main file.
+
+        Parameters:
+        - name (str): The name of the library.
+        - book_file (str): The main book file.
+        - user_file (str): The file path for user data.
+        - shards (int): The number of shards (default the number of CPUs).
+        - journaled (bool): Whether each shard journals its changes.
+        - durability (str): When changes are written; see new.Library.
+        - metrics (Metrics or None): Records the calls and latencies of the
+          operations, as seen by the caller, including the round trip to the
+          shard; users are recorded by the directory. Without it, nothing is recorded.
+        """
+        self.name = name
+        self.metrics = metrics
+        if metrics:
+            metrics.instrument(self, METRIC_OPERATIONS)
+        self.book_file = os.path.join(os.getcwd(), book_file)
+        self.shards = shards or os.cpu_count() or 1
+        self.directory = Library(name, None, user_file, journaled, thread_safe=True, durability=durability, metrics=metrics)
+        paths = [shard_file(self.book_file, shard, self.shards) for shard in range(self.shards)]
+        if not all(os.path.exists(path) for path in paths):
+            paths = split_catalogue(self.book_file, self.shards, find_shards(self.book_file))
+        self.connections = []
+        self.locks = []
+        self.processes = []
+        for path in paths:
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=serve_shard, args=(child, name, path, journaled, durability),
+                                              daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.locks.append(threading.Lock())
+            self.processes.append(process)
+
+    @property
+    def users(self):
+        """
+        Gets the registered users.
+
+        Returns:
+        - List[User]: The users.
+        """
+        return self.directory.users
+
+    def users_page(self, cursor=None, limit=PAGE_SIZE):
+        """
+        Gets a page of the registered users. See new.Library.users_page().
+
+        Parameters:
+        - cursor (str or None): The cursor returned with the previous page,
+          or None for the first page.
+        - limit (int): The most users on the page.
+
+        Returns:
+        - Tuple[List[User], str or None]: The users, and the cursor of the
+          next page, or None after the last page.
+        """
+        return self.directory.users_page(cursor, limit)
+
+    def find_user(self, user_name):
+        """
+        Finds a registered user by name, ignoring case.
+
+        Parameters:
+        - user_name (str): The user name.
+
+        Returns:
+        - User or None: The User object if found, otherwise None.
+        """
+        return self.directory.find_user(user_name)
+
+    def add_user(self, user):
+        """
+        Adds a registered user to the library.
+
+        Parameters:
+        - user (User): The User object to add.
+
+        Returns:
+        - bool: True if added, False if the user name (ignoring case) is already taken.
+        """
+        return self.directory.add_user(user)
+
+    def call(self, shard, method, *args):
+        """
+        Calls a method on one shard and waits for the result.
+
+        Parameters:
+        - shard (int): The shard number.
+        - method (str): The new.Library method.
+        - args: The method's arguments.
+
+        Returns:
+        - object: The result.
+        """
+        with self.locks[shard]:
+            self.connections[shard].send((method, args))
+            ok, result = self.connections[shard].recv()
+        if not ok:
+            raise result
+        return result
+
+    def call_all(self, method, *args):
+        """
+        Calls a method on every shard at once and waits for all the results,
+        so the shards work in parallel.
+
+        Parameters:
+        - method (str): The new.Library method.
+        - args: The method's arguments.
+
+        Returns:
+        - list: The result of each shard, in shard order.
+        """
+        for lock in self.locks:
+            lock.acquire()
+        try:
+            for connection in self.connections:
+                connection.send((method, args))
+            replies = [connection.recv() for connection in self.connections]
+        finally:
+            for lock in self.locks:
+                lock.release()
+        for ok, result in replies:
+            if not ok:
+                raise result
+        return [result for ok, result in replies]
+
+    def owner(self, book_id):
+        """
+        Gets the shard that owns a book.
+
+        Parameters:
+        - book_id (str): The ID of the book.
+
+        Returns:
+        - int: The shard number.
+        """
+        return shard_of(book_id, self.shards)
+
+    def find_book_by_id(self, book_id):
+        """
+        Finds a book by its ID.
+
+        Parameters:
+        - book_id (str): The ID of the book to find.
+
+        Returns:
+        - Book or None: A copy of the book if found, otherwise None.
+        """
+        return self.call(self.owner(book_id), 'find_book_by_id', book_id)
+
+    def reserve_book(self, book_id, user_name=None, as_of=None):
+        """
+        Reserves a book. See new.Library.reserve_book().
+
+        Parameters:
+        - book_id (str): The ISBN of the book to reserve.
+        - user_name (str or None): The patron.
+        - as_of (date): The date of the reservation (default today).
+
+        Returns:
+        - Tuple[str, Book or None]: The status and a copy of the book, if found.
+        """
+        return self.call(self.owner(book_id), 'reserve_book', book_id, user_name, as_of)
+
+    def hold_position(self, book_id, user_name):
+        """
+        Gets a patron's place in the queue for a book. See new.Library.hold_position().
+
+        Parameters:
+        - book_id (str): The ISBN of the book.
+        - user_name (str): The patron.
+
+        Returns:
+        - int or None: 0 if the book is kept for the patron, their position, or None.
+        """
+        return self.call(self.owner(book_id), 'hold_position', book_id, user_name)
+
+    def cancel_reservation(self, book_id, user_name, as_of=None):
+        """
+        Cancels a patron's hold on a book. See new.Library.cancel_reservation().
+
+        Parameters:
+        - book_id (str): The ISBN of the book.
+        - user_name (str): The patron.
+        - as_of (date): The date of the cancellation (default today).
+
+        Returns:
+        - bool: True if the patron had a hold.
+        """
+        return self.call(self.owner(book_id), 'cancel_reservation', book_id, user_name, as_of)
+
+    def check_out_book(self, book_id, user_name, loan_days=14, as_of=None):
+        """
+        Lends a book to a patron. See new.Library.check_out_book().
+
+        Parameters:
+        - book_id (str): The ISBN of the book.
+        - user_name (str): The patron.
+        - loan_days (int): The length of the loan, in days.
+        - as_of (date): The date of the loan (default today).
+
+        Returns:
+        - Tuple[str, Book or None]: The status and a copy of the book, if found.
+        """
+        user = self.directory.find_user(user_name)
+        return self.call(self.owner(book_id), 'check_out_book', book_id, user_name, loan_days, as_of,
+                         user.user_type if user else None)
+
+    def return_book(self, book_id, as_of=None):
+        """
+        Takes back a book on loan. See new.Library.return_book().
+
+        Parameters:
+        - book_id (str): The ISBN of the book.
+        - as_of (date): The date of the return (default today).
+
+        Returns:
+        - Tuple[str, Book or None]: The status and a copy of the book, if found.
+        """
+        return self.call(self.owner(book_id), 'return_book', book_id, as_of)
+
+    def expire_holds(self, as_of=None):
+        """
+        Passes on expired holds on every shard. See new.Library.expire_holds().
+
+        Parameters:
+        - as_of (date): The date to check against (default today).
+
+        Returns:
+        - List[Tuple[str, str]]: The (book ID, patron) of each expired hold.
+        """
+        return [hold for holds in self.call_all('expire_holds', as_of) for hold in holds]
+
+    def renew_book(self, book_id, loan_days=14):
+        """
+        Renews a book on loan. See new.Library.renew_book().
+
+        Parameters:
+        - book_id (str): The ISBN of the book to renew.
+        - loan_days (int): The number of days to add to the due date.
+
+        Returns:
+        - Tuple[str, Book or None]: The status and a copy of the book, if found.
+        """
+        return self.call(self.owner(book_id), 'renew_book', book_id, loan_days)
+
+    def add_book(self, book):
+        """
+        Adds a book to the shard that owns it.
+
+        Parameters:
+        - book (Book): The Book object to add.
+        """
+        self.call(self.owner(book.book_id), 'add_book', book)
+
+    def delete_book(self, book_id):
+        """
+        Deletes a book from the shard that owns it.
+
+        Parameters:
+        - book_id (str): The ISBN of the book to delete.
+
+        Returns:
+        - bool: True if the book was found and deleted.
+        """
+        return self.call(self.owner(book_id), 'delete_book', book_id)
+
+    def search_books(self, search_query):
+        """
+        Searches every shard at once for books whose title or author matches
+        the query. See new.Library.search_books().
+
+        Parameters:
+        - search_query (str): The search query.
+
+        Returns:
+        - List[Book]: Copies of the matching books, shard by shard, each
+          shard's matches in catalogue order.
+        """
+        return [Book(*fields) for books in self.call_all('search_books', search_query) for fields in books]
+
+    def fuzzy_search_books(self, search_query, max_distance=None, limit=20, budget=FUZZY_BUDGET):
+        """
+        Searches every shard at once for books with a close match for every
+        word of the query, and merges their best results. See
+        new.Library.fuzzy_search_books().
+
+        Parameters:
+        - search_query (str): The search query.
+        - max_distance (int or None): A cap on the typos forgiven per word, or None for the default.
+        - limit (int): The largest number of results.
+        - budget (float or None): The most time each shard may spend checking candidates,
+          in seconds, or None for no limit.
+
+        Returns:
+        - List[Tuple[int, Book]]: The number of typos and a copy of the book of each
+          result, fewest typos first.
+        """
+        ranked = self.call_all('fuzzy_search_books', search_query, max_distance, limit, budget)
+        best = islice(heapq.merge(*ranked, key=lambda result: result[0]), limit)
+        return [(score, Book(*fields)) for score, fields in best]
+
+    def autocomplete(self, prefix, limit=MAX_COMPLETIONS):
+        """
+        Asks every shard at once for the most borrowed books whose title or
+        author starts with a prefix, and merges their suggestions. See
+        new.Library.autocomplete().
+
+        Parameters:
+        - prefix (str): The text typed so far.
+        - limit (int): The largest number of suggestions, at most MAX_COMPLETIONS.
+
+        Returns:
+        - List[Tuple[int, Book]]: The loan count and a copy of the book of each
+          suggestion, most borrowed first, then by title.
+        """
+        def rank(suggestion):
+            loans, fields = suggestion
+            return -loans, normalize(fields[1]), normalize(fields[2])
+
+        best = islice(heapq.merge(*self.call_all('autocomplete', prefix, limit), key=rank), limit)
+        return [(loans, Book(*fields)) for loans, fields in best]
+
+    def overdue_books(self, as_of=None):
+        """
+        Finds the books that are overdue on any shard.
+
+        Parameters:
+        - as_of (date): The date to check against (default today).
+
+        Returns:
+        - List[Book]: Copies of the overdue books, earliest due date first.
+        """
+        books = [Book(*fields) for books in self.call_all('overdue_books', as_of) for fields in books]
+        return sorted(books, key=lambda book: book.due_return)
+
+    def books_due_within(self, days, as_of=None):
+        """
+        Finds the books that fall due in the next few days on any shard.
+
+        Parameters:
+        - days (int): The number of days to look ahead.
+        - as_of (date): The start of the period (default today).
+
+        Returns:
+        - List[Book]: Copies of the books due in the period, earliest due date first.
+        """
+        books = [Book(*fields) for books in self.call_all('books_due_within', days, as_of) for fields in books]
+        return sorted(books, key=lambda book: book.due_return)
+
+    def inventory_counts(self, author=None, as_of=None):
+        """
+        Counts the books in each state, adding up every shard's counters.
+        See new.Library.inventory_counts().
+
+        Parameters:
+        - author (str or None): The author, or None for the whole library.
+        - as_of (date): The date overdue loans are counted at (default today).
+
+        Returns:
+        - dict: The number of books in total, available, reserved, on_loan and overdue.
+        """
+        totals = {}
+        for counts in self.call_all('inventory_counts', author, as_of):
+            for field, value in counts.items():
+                totals[field] = totals.get(field, 0) + value
+        return totals
+
+    def inventory_by_author(self, as_of=None):
+        """
+        Counts the books in each state for every author, adding up every
+        shard's counters. See new.Library.inventory_by_author().
+
+        Parameters:
+        - as_of (date): The date overdue loans are counted at (default today).
+
+        Returns:
+        - dict: The counts of each author, by author.
+        """
+        authors = {}
+        for shard_authors in self.call_all('inventory_by_author', as_of):
+            for author, counts in shard_authors.items():
+                totals = authors.setdefault(author, dict.fromkeys(counts, 0))
+                for field, value in counts.items():
+                    totals[field] += value
+        return authors
+
+    def check_inventory(self, as_of=None):
+        """
+        Recounts every shard's books and compares them with its counters.
+        See new.Library.check_inventory().
+
+        Parameters:
+        - as_of (date): The date overdue loans are counted at (default today).
+
+        Returns:
+        - List[str]: A description of each wrong counter, by shard; empty if all are right.
+        """
+        return [f"shard {shard}: {problem}" for shard, problems in enumerate(self.call_all('check_inventory', as_of))
+                for problem in problems]
+
+    def search_cache_stats(self):
+        """
+        Gets the hit and miss counts of the search caches, adding up every
+        shard's. See new.Library.search_cache_stats().
+
+        Returns:
+        - dict: See search_cache.SearchCache.stats().
+        """
+        totals = {}
+        for stats in self.call_all('search_cache_stats'):
+            for field, value in stats.items():
+                if field != 'hit_rate':
+                    totals[field] = totals.get(field, 0) + value
+        lookups = totals['hits'] + totals['misses']
+        totals['hit_rate'] = totals['hits'] / lookups if lookups else None
+        return totals
+
+    def assess_fines(self, as_of=None):
+        """
+        Works out the fines of all the books on loan on every shard at
+        once, adding up the totals. See new.Library.assess_fines().
+
+        Parameters:
+        - as_of (date): The date to fine up to (default today).
+
+        Returns:
+        - dict: The number of loans, the number overdue and the total of their fines, in cents.
+        """
+        totals = {}
+        for summary in self.call_all('assess_fines', as_of):
+            for field, value in summary.items():
+                totals[field] = totals.get(field, 0) + value
+        return totals
+
+    def fines_of(self, user_name):
+        """
+        Gets what a member owes in fines on all shards. See new.Library.fines_of().
+
+        Parameters:
+        - user_name (str): The member.
+
+        Returns:
+        - dict: 'owed' and 'accruing', in cents.
+        """
+        totals = {'owed': 0, 'accruing': 0}
+        for fines in self.call_all('fines_of', user_name):
+            for field, value in fines.items():
+                totals[field] += value
+        return totals
+
+    def pay_fine(self, user_name, amount):
+        """
+        Pays off some of the fines a member owes, shard by shard. See new.Library.pay_fine().
+
+        Parameters:
+        - user_name (str): The member.
+        - amount (int): The amount paid, in cents.
+
+        Returns:
+        - Tuple[int, int]: The amount taken and the amount still owed, in cents.
+
+        Raises:
+        - ValueError: If the amount is not positive.
+        """
+        if amount <= 0:
+            raise ValueError("The amount paid must be positive")
+        paid = 0
+        owed = 0
+        for shard, fines in enumerate(self.call_all('fines_of', user_name)):
+            if fines['owed'] and paid < amount:
+                taken, left = self.call(shard, 'pay_fine', user_name, amount - paid)
+                paid += taken
+                owed += left
+            else:
+                owed += fines['owed']
+        return paid, owed
+
+    def count_books(self):
+        """
+        Counts the books on all shards.
+
+        Returns:
+        - int: The number of books.
+        """
+        return sum(self.call_all('count_books'))
+
+    def save_books(self):
+        """
+        Saves every shard's books to its file.
+        """
+        self.call_all('save_books')
+
+    def close(self):
+        """
+        Stops the shards, which write any pending changes first, and closes the user storage.
+        """
+        for lock, connection in zip(self.locks, self.connections):
+            with lock:
+                try:
+                    connection.send(None)
+                except (BrokenPipeError, OSError):
+                    pass
+                connection.close()
+        for process in self.processes:
+            process.join()
+        self.directory.close()
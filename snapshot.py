@@ -0,0 +1,63 @@
+import os
+import pickle
+
+# Bump when the layout of the snapshotted data changes, so old snapshots are rebuilt.
+VERSION = 1
+
+def file_stamp(paths):
+    """
+    Gets the size and modification time of some files.
+
+    Parameters:
+    - paths (Iterable[str]): The files.
+
+    Returns:
+    - tuple: A (path, size, mtime) triple per file; size and mtime are None for missing files.
+    """
+    stamp = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamp.append((path, stat.st_size, stat.st_mtime_ns))
+        except FileNotFoundError:
+            stamp.append((path, None, None))
+    return tuple(stamp)
+
+def load_snapshot(path, sources, build, tag):
+    """
+    Loads data parsed from some source files, from a pickled snapshot if the
+    sources have not changed since it was taken, otherwise by parsing them
+    again and taking a new snapshot.
+
+    The snapshot is keyed by the size and modification time of each source,
+    so editing a file, or the program saving it, invalidates the snapshot.
+    Snapshots are only as trustworthy as the directory they are kept in,
+    like the data files themselves.
+
+    Parameters:
+    - path (str): The snapshot file.
+    - sources (List[str]): The files the data is parsed from.
+    - build (callable): Parses the sources; its result must be picklable.
+    - tag (str): Names the kind of data, so different data never shares a snapshot.
+
+    Returns:
+    - object: The data.
+    """
+    stamp = (VERSION, tag, file_stamp(sources))
+    try:
+        with open(path, 'rb') as file:
+            if pickle.load(file) == stamp:
+                return pickle.load(file)
+    except (OSError, EOFError, ValueError, TypeError, AttributeError, pickle.UnpicklingError):
+        pass
+    data = build()
+    temporary = path + '.tmp'
+    try:
+        with open(temporary, 'wb') as file:
+            pickle.dump(stamp, file, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(data, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+    except OSError:
+        # The snapshot only saves time; carry on without it.
+        pass
+    return data
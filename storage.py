@@ -0,0 +1,459 @@
+import csv
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from catalogue import SUFFIX, CatalogueTable
+from journal import Journal, read_rows, replace_file
+
+# The number of rows SQLiteTable.iter_rows() reads per query. A connection
+# is only borrowed while a batch is read, so an iterator that is never
+# finished does not keep one from the pool.
+READ_BATCH = 1000
+
+class CSVTable:
+    """
+    Represents a table stored in a CSV file, optionally with a journal.
+
+    Attributes:
+    - path (str): The CSV file.
+    - fieldnames (List[str]): The CSV columns.
+    - journal (Journal or None): The journal, when journaling is enabled.
+    """
+
+    def __init__(self, path, fieldnames, key, journaled=False):
+        """
+        Initializes a new CSVTable object.
+
+        Parameters:
+        - path (str): The CSV file.
+        - fieldnames (List[str]): The CSV columns.
+        - key (str or Tuple[str]): The column(s) that identify a row.
+        - journaled (bool): Append changes to a journal instead of rewriting the file.
+        """
+        self.path = path
+        self.fieldnames = fieldnames
+        self.journal = Journal(path, fieldnames, key) if journaled else None
+
+    def iter_rows(self):
+        """
+        Yields the stored rows one at a time.
+
+        Returns:
+        - Iterator[dict]: The rows, in insertion order.
+        """
+        return self.journal.iter_rows() if self.journal else read_rows(self.path)
+
+    def record(self, op, row):
+        """
+        Records a change to a single row.
+
+        Parameters:
+        - op (str): 'add', 'update' or 'delete'.
+        - row (dict): The row that changed.
+
+        Returns:
+        - bool: True if the caller should now save all rows with save().
+        """
+        if self.journal:
+            return self.journal.append(op, row)
+        if op != 'add' or self.header() != self.fieldnames:
+            return True
+        # A new row goes at the end of the file, so it can be appended
+        # instead of rewriting every row.
+        with open(self.path, 'a', newline='') as file:
+            csv.DictWriter(file, fieldnames=self.fieldnames).writerow(row)
+        return False
+
+    def record_many(self, op, rows):
+        """
+        Records the same change to several rows.
+
+        Parameters:
+        - op (str): 'add', 'update' or 'delete'.
+        - rows (List[dict]): The rows that changed.
+
+        Returns:
+        - bool: True if the caller should now save all rows with save().
+        """
+        if self.journal:
+            return any([self.journal.append(op, row) for row in rows])
+        if op != 'add' or self.header() != self.fieldnames:
+            return True
+        with open(self.path, 'a', newline='') as file:
+            csv.DictWriter(file, fieldnames=self.fieldnames).writerows(rows)
+        return False
+
+    def header(self):
+        """
+        Reads the column names from the first line of the CSV file.
+
+        Returns:
+        - List[str] or None: The column names, or None if the file is missing or empty.
+        """
+        try:
+            with open(self.path, 'r', newline='') as file:
+                return next(csv.reader(file), None)
+        except FileNotFoundError:
+            return None
+
+    def save(self, rows):
+        """
+        Replaces the stored rows. The rows are written to a temporary file,
+        fsynced and renamed over the CSV file, so a crash never leaves a
+        partly written file.
+
+        Parameters:
+        - rows (Iterable[dict]): The current rows.
+        """
+        if self.journal:
+            self.journal.compact(rows)
+            return
+        temp_file = self.path + '.tmp'
+        with open(temp_file, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=self.fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+            file.flush()
+            os.fsync(file.fileno())
+        replace_file(temp_file, self.path)
+
+    def close(self):
+        """
+        Closes the journal, if any.
+        """
+        if self.journal:
+            self.journal.close()
+
+class CSVStorage:
+    """
+    Represents the default storage backend, which keeps each table in its own CSV file.
+
+    Attributes:
+    - journaled (bool): Whether changes are appended to journals.
+    """
+
+    def __init__(self, journaled=False):
+        """
+        Initializes a new CSVStorage object.
+
+        Parameters:
+        - journaled (bool): Append changes to a journal next to each CSV file.
+        """
+        self.journaled = journaled
+        self.tables = []
+
+    def table(self, name, path, fieldnames, key, indexes=()):
+        """
+        Opens a table.
+
+        Parameters:
+        - name (str): The table name.
+        - path (str or None): The CSV file. Tables without a file are not
+          stored, and files ending in '.lmsc' are binary catalogues.
+        - fieldnames (List[str]): The columns.
+        - key (str or Tuple[str]): The column(s) that identify a row.
+        - indexes (Iterable[str]): Columns to index; ignored for CSV files.
+
+        Returns:
+        - CSVTable, CatalogueTable or None: The table, or None if it has no file.
+        """
+        if path is None:
+            return None
+        if path.endswith(SUFFIX):
+            table = CatalogueTable(path, fieldnames, key)
+        else:
+            table = CSVTable(path, fieldnames, key, self.journaled)
+        self.tables.append(table)
+        return table
+
+    def close(self):
+        """
+        Closes all open tables.
+        """
+        for table in self.tables:
+            table.close()
+
+class ConnectionPool:
+    """
+    Represents a small pool of SQLite connections to one database file.
+
+    Connections are created on demand up to the pool size and handed out one
+    per caller, so a session reading the database does not wait for another
+    one that is writing. The database runs in WAL mode, which lets readers
+    carry on while a write is in progress.
+
+    Attributes:
+    - path (str): The database file.
+    - size (int): The maximum number of connections.
+    """
+
+    def __init__(self, path, size=4):
+        """
+        Initializes a new ConnectionPool object.
+
+        Parameters:
+        - path (str): The database file.
+        - size (int): The maximum number of connections.
+        """
+        self.path = path
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def connect(self):
+        """
+        Opens a new connection.
+
+        Returns:
+        - sqlite3.Connection: The connection.
+        """
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, cached_statements=256)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a connection from the pool, waiting if all are in use.
+
+        Returns:
+        - ContextManager[sqlite3.Connection]: The connection, returned to the pool on exit.
+        """
+        try:
+            connection = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                create = self.created < self.size
+                if create:
+                    self.created += 1
+            connection = self.connect() if create else self.idle.get()
+        try:
+            yield connection
+        finally:
+            self.idle.put(connection)
+
+    def close(self):
+        """
+        Closes the idle connections.
+        """
+        while True:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            connection.close()
+            with self.lock:
+                self.created -= 1
+
+class SQLiteTable:
+    """
+    Represents a table stored in SQLite.
+
+    Values are stored as text, exactly as they would be written to CSV, so
+    the Library classes parse rows the same way for either backend. A seq
+    column keeps rows in insertion order. Every statement is a fixed SQL
+    string with parameters, so each connection prepares it once and reuses
+    it from its statement cache.
+
+    Attributes:
+    - name (str): The table name.
+    - fieldnames (List[str]): The columns.
+    - key (Tuple[str]): The columns that identify a row.
+    """
+
+    def __init__(self, pool, name, fieldnames, key, indexes=()):
+        """
+        Initializes a new SQLiteTable object, creating the table if needed.
+
+        Parameters:
+        - pool (ConnectionPool): The connection pool.
+        - name (str): The table name.
+        - fieldnames (List[str]): The columns.
+        - key (str or Tuple[str]): The column(s) that identify a row.
+        - indexes (Iterable[str]): Other columns to index.
+        """
+        self.pool = pool
+        self.name = name
+        self.fieldnames = list(fieldnames)
+        self.key = (key,) if isinstance(key, str) else tuple(key)
+        columns = ', '.join(f'"{field}"' for field in self.fieldnames)
+        placeholders = ', '.join('?' for _ in self.fieldnames)
+        match = ' AND '.join(f'"{field}" = ?' for field in self.key)
+        first = f'(SELECT seq FROM "{name}" WHERE {match} ORDER BY seq LIMIT 1)'
+        self.select_sql = f'SELECT seq, {columns} FROM "{name}" WHERE seq > ? ORDER BY seq LIMIT ?'
+        self.insert_sql = f'INSERT INTO "{name}" ({columns}) VALUES ({placeholders})'
+        self.update_sql = f'UPDATE "{name}" SET ({columns}) = ({placeholders}) WHERE seq = {first}'
+        self.delete_sql = f'DELETE FROM "{name}" WHERE seq = {first}'
+        self.clear_sql = f'DELETE FROM "{name}"'
+
+        with self.pool.connection() as connection, connection:
+            connection.execute(f'CREATE TABLE IF NOT EXISTS "{name}" (seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                               + ', '.join(f'"{field}" TEXT' for field in self.fieldnames) + ')')
+            key_columns = ', '.join(f'"{field}"' for field in self.key)
+            connection.execute(f'CREATE INDEX IF NOT EXISTS "{name}_key" ON "{name}" ({key_columns})')
+            for field in indexes:
+                connection.execute(f'CREATE INDEX IF NOT EXISTS "{name}_{field}" ON "{name}" ("{field}")')
+
+    def values(self, row, fields):
+        """
+        Converts row values to the text stored in the table.
+
+        Parameters:
+        - row (dict): The row.
+        - fields (Iterable[str]): The columns to take.
+
+        Returns:
+        - List[str]: The values, as text.
+        """
+        return ['' if row.get(field) is None else str(row[field]) for field in fields]
+
+    def iter_rows(self):
+        """
+        Yields the stored rows one at a time. They are read READ_BATCH at a
+        time, each batch on a connection borrowed only while it is read.
+
+        Returns:
+        - Iterator[dict]: The rows, in insertion order.
+        """
+        last = -1
+        while True:
+            with self.pool.connection() as connection:
+                batch = connection.execute(self.select_sql, (last, READ_BATCH)).fetchall()
+            for values in batch:
+                yield dict(zip(self.fieldnames, values[1:]))
+            if len(batch) < READ_BATCH:
+                return
+            last = batch[-1][0]
+
+    def record(self, op, row):
+        """
+        Applies a change to a single row. Updates and deletes apply to the
+        first row with the same key.
+
+        Parameters:
+        - op (str): 'add', 'update' or 'delete'.
+        - row (dict): The row that changed.
+
+        Returns:
+        - bool: Always False; SQLite never needs a full save.
+        """
+        key = self.values(row, self.key)
+        with self.pool.connection() as connection, connection:
+            if op == 'add':
+                connection.execute(self.insert_sql, self.values(row, self.fieldnames))
+            elif op == 'update':
+                connection.execute(self.update_sql, self.values(row, self.fieldnames) + key)
+            elif op == 'delete':
+                connection.execute(self.delete_sql, key)
+        return False
+
+    def record_many(self, op, rows):
+        """
+        Applies the same change to several rows in a single transaction.
+
+        Parameters:
+        - op (str): 'add', 'update' or 'delete'.
+        - rows (List[dict]): The rows that changed.
+
+        Returns:
+        - bool: Always False; SQLite never needs a full save.
+        """
+        with self.pool.connection() as connection, connection:
+            if op == 'add':
+                connection.executemany(self.insert_sql, (self.values(row, self.fieldnames) for row in rows))
+            elif op == 'update':
+                connection.executemany(self.update_sql, (self.values(row, self.fieldnames) + self.values(row, self.key) for row in rows))
+            elif op == 'delete':
+                connection.executemany(self.delete_sql, (self.values(row, self.key) for row in rows))
+        return False
+
+    def save(self, rows):
+        """
+        Replaces the stored rows in a single transaction.
+
+        Parameters:
+        - rows (Iterable[dict]): The current rows.
+        """
+        with self.pool.connection() as connection, connection:
+            connection.execute(self.clear_sql)
+            connection.executemany(self.insert_sql, (self.values(row, self.fieldnames) for row in rows))
+
+    def close(self):
+        """
+        Does nothing; connections belong to the pool.
+        """
+
+class SQLiteStorage:
+    """
+    Represents a storage backend that keeps every table in one SQLite database.
+
+    Attributes:
+    - pool (ConnectionPool): The connection pool.
+    """
+
+    def __init__(self, path, pool_size=4):
+        """
+        Initializes a new SQLiteStorage object.
+
+        Parameters:
+        - path (str): The database file.
+        - pool_size (int): The maximum number of pooled connections.
+        """
+        self.pool = ConnectionPool(path, pool_size)
+
+    def table(self, name, path, fieldnames, key, indexes=()):
+        """
+        Opens a table, creating it if needed.
+
+        Parameters:
+        - name (str): The table name.
+        - path (str or None): The CSV file the table replaces; ignored.
+        - fieldnames (List[str]): The columns.
+        - key (str or Tuple[str]): The column(s) that identify a row.
+        - indexes (Iterable[str]): Other columns to index.
+
+        Returns:
+        - SQLiteTable: The table.
+        """
+        return SQLiteTable(self.pool, name, fieldnames, key, indexes)
+
+    def close(self):
+        """
+        Closes the pooled connections.
+        """
+        self.pool.close()
+
+def import_csv(table, path):
+    """
+    Replaces the rows of a table with the rows of a CSV file.
+
+    Parameters:
+    - table (CSVTable or SQLiteTable): The table to fill.
+    - path (str): The CSV file to read.
+    """
+    table.save(read_rows(path))
+
+def export_csv(table, path):
+    """
+    Writes the rows of a table to a CSV file.
+
+    Parameters:
+    - table (CSVTable or SQLiteTable): The table to read.
+    - path (str): The CSV file to write.
+
+    Returns:
+    - int: The number of rows written.
+    """
+    count = 0
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=table.fieldnames)
+        writer.writeheader()
+        for row in table.iter_rows():
+            writer.writerow({field: row.get(field, '') for field in table.fieldnames})
+            count += 1
+    return count
@@ -0,0 +1,100 @@
+import atexit
+import threading
+
+# When changes reach storage; see WriteBehind.
+PER_OP = 'per-op'
+INTERVAL = 'interval'
+ON_EXIT = 'on-exit'
+DURABILITY_MODES = (PER_OP, INTERVAL, ON_EXIT)
+
+class WriteBehind:
+    """
+    Represents the group commit of changes to a library's tables.
+
+    With PER_OP durability every change is written before the call that
+    made it returns. With INTERVAL, the first change starts a short timer
+    and every change made before it fires is written together, so a burst
+    of changes costs one write per table. With ON_EXIT, changes are only
+    written by flush(), close() or when the program exits. Either way a
+    group is written with one atomic save per changed table.
+
+    Attributes:
+    - durability (str): PER_OP, INTERVAL or ON_EXIT.
+    - interval (float): The INTERVAL window, in seconds.
+    - changes (int): The number of changes recorded.
+    - groups (int): The number of group writes made.
+    """
+
+    def __init__(self, flush, durability=PER_OP, interval=1.0):
+        """
+        Initializes a new WriteBehind object.
+
+        Parameters:
+        - flush (callable): Writes a group; called with the set of changed table names.
+        - durability (str): PER_OP, INTERVAL or ON_EXIT.
+        - interval (float): The INTERVAL window, in seconds.
+
+        Raises:
+        - ValueError: If the durability is not one of DURABILITY_MODES.
+        """
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability {durability!r}; expected one of {', '.join(DURABILITY_MODES)}")
+        self.write = flush
+        self.durability = durability
+        self.interval = interval
+        self.pending = set()
+        self.timer = None
+        self.lock = threading.Lock()
+        self.flushing = threading.Lock()
+        self.changes = 0
+        self.groups = 0
+        if self.deferred:
+            atexit.register(self.flush)
+
+    @property
+    def deferred(self):
+        """
+        Tells whether changes are held back and written in groups.
+
+        Returns:
+        - bool: True unless the durability is PER_OP.
+        """
+        return self.durability != PER_OP
+
+    def changed(self, table):
+        """
+        Records that a table changed. The change is written at the end of
+        the current window (INTERVAL) or at exit (ON_EXIT).
+
+        Parameters:
+        - table (str): The name of the table.
+        """
+        with self.lock:
+            self.pending.add(table)
+            self.changes += 1
+            if self.durability == INTERVAL and self.timer is None:
+                self.timer = threading.Timer(self.interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        """
+        Writes every pending change now, as one group.
+        """
+        with self.flushing:
+            with self.lock:
+                pending, self.pending = self.pending, set()
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+            if pending:
+                self.write(pending)
+                self.groups += 1
+
+    def close(self):
+        """
+        Writes every pending change and stops flushing at exit.
+        """
+        self.flush()
+        if self.deferred:
+            atexit.unregister(self.flush)